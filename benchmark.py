@@ -0,0 +1,477 @@
+import argparse
+import hashlib
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import levels
+import pivots
+import zone_engine
+import zone_index
+from zone_stream import DEMAND, ZoneDetector
+
+# -----------------------------
+# Zone Detection Benchmarks
+# -----------------------------
+#
+# Times the zone-detection hot paths on synthetic OHLC bars, so it runs
+# offline without yfinance:
+#
+#   python benchmark.py [--sizes 1000,100000,1000000] [--out report.json] [--compare old.json]
+#
+# Every case runs each variant of a detector on the same bars. The variants
+# are the vectorized engine, the streaming detector and a plain-loop port of
+# the original per-candle code. The report records the best time, the peak
+# traced memory and a digest of every variant's output. A case whose variants
+# disagree is reported as a mismatch and makes the script exit with status 1.
+# Reports are sorted JSON, so two of them can be diffed directly or compared
+# with --compare.
+
+REPORT_VERSION = 1
+DEFAULT_SIZES = (1000, 100000, 1000000)
+
+# (volatility multiplier, drift per bar) of the regimes the random walk switches between
+DEFAULT_REGIMES = ((1.0, 0.0), (2.5, 0.0), (0.5, 0.0005), (1.5, -0.0005))
+
+
+# -----------------------------
+# Synthetic OHLC Bars
+# -----------------------------
+
+def synthetic_ohlc(n, seed=0, volatility=0.01, regimes=DEFAULT_REGIMES, switch_probability=0.002,
+                   flat_probability=0.01, start_price=100.0, start="2000-01-03", freq="min"):
+    """
+    Random-walk OHLC bars with regime switching.
+
+    Args:
+        n: Number of bars.
+        volatility: Standard deviation of the log return per bar in the base regime.
+        regimes: (volatility multiplier, drift) pairs; the walk jumps to a random
+            regime with switch_probability on every bar.
+        flat_probability: Share of bars with no range, which have no body percentage.
+
+    Returns:
+        DataFrame with Open, High, Low, Close and Volume columns on a DatetimeIndex.
+    """
+    rng = np.random.default_rng(seed)
+    segment = np.cumsum(rng.random(n) < switch_probability)
+    regime = rng.integers(0, len(regimes), size=segment[-1] + 1 if n else 0)[segment]
+    scale = np.array([r[0] for r in regimes])[regime] * volatility
+    drift = np.array([r[1] for r in regimes])[regime]
+
+    close = start_price * np.exp(np.cumsum(drift + scale * rng.standard_normal(n)))
+    open_price = np.empty(n)
+    if n:
+        open_price[0] = start_price
+        # Small gaps between a close and the next open
+        open_price[1:] = close[:-1] * np.exp(0.1 * scale[1:] * rng.standard_normal(n - 1))
+    high = np.maximum(open_price, close) * np.exp(0.5 * scale * np.abs(rng.standard_normal(n)))
+    low = np.minimum(open_price, close) * np.exp(-0.5 * scale * np.abs(rng.standard_normal(n)))
+
+    flat = rng.random(n) < flat_probability
+    open_price[flat] = high[flat] = low[flat] = close[flat]
+
+    return pd.DataFrame({
+        "Open": open_price,
+        "High": high,
+        "Low": low,
+        "Close": close,
+        "Volume": rng.integers(1000, 100000, size=n).astype(np.float64),
+    }, index=pd.date_range(start, periods=n, freq=freq))
+
+
+# -----------------------------
+# Reference Implementations
+# -----------------------------
+#
+# Ports of the original per-candle loops of the scripts, over plain lists.
+# They define the expected output of the faster variants.
+
+def _body_percentages(open_price, high, low, close):
+    return [abs(c - o) / (h - l) * 100 if h - l != 0 else 0 for o, h, l, c in zip(open_price, high, low, close)]
+
+
+def reference_dz_sz_zones(open_price, high, low, close):
+    # dz_sz_chart.detect_demand_zones before zone_engine
+    body = _body_percentages(open_price, high, low, close)
+    n = len(body)
+    zones = []
+    i = 0
+    while i < n - 2:
+        if body[i] > 50:
+            j = i + 1
+            while j < n and j - i - 1 < 5 and body[j] < 50:
+                j += 1
+            if j < n and body[j] > 50:
+                if j > i + 1 and (close[j] > open_price[j] and close[j] > high[i] and
+                                  close[j] > max(high[i + 1:j])):
+                    zones.append((i, j, i + 1, j))
+            i = j
+        else:
+            i += 1
+    return zones
+
+
+def reference_bulk_zones(open_price, high, low, close, max_base=5, min_legout=1):
+    # gui_bulk_dz.detect_demand_zones before zone_engine
+    body = _body_percentages(open_price, high, low, close)
+    n = len(body)
+    zones = []
+    i = 0
+    while i < n - 2:
+        if body[i] > 50:
+            j = i + 1
+            while j < n and j - i - 1 < max_base and body[j] < 50:
+                j += 1
+            base_end = j
+            if base_end > i + 1:
+                while j < n and j - base_end < min_legout and body[j] > 50:
+                    j += 1
+                if j - base_end == min_legout:
+                    legout = j - 1
+                    upper_body_lowest = min(max(open_price[k], close[k]) for k in range(i + 1, base_end))
+                    if (close[legout] > open_price[legout] and close[legout] > high[i] and
+                            close[legout] > upper_body_lowest):
+                        zones.append((i, legout, i + 1, base_end))
+                else:
+                    j += 1
+            i = j
+        else:
+            i += 1
+    return zones
+
+
+def reference_sd_zones(open_price, high, low, close):
+    # dem_zones_updated.detect_zones before zone_engine: (base_start, base_end, is_supply)
+    ratio = [abs(c - o) / (h - l) if h - l != 0 else float('nan') for o, h, l, c in zip(open_price, high, low, close)]
+    n = len(ratio)
+    zones = []
+    i = 0
+    while i < n - 2:
+        if ratio[i] > 0.55:
+            j = i + 1
+            while j < n and j - i - 1 < 3 and ratio[j] < 0.45:
+                j += 1
+            if j > i + 1 and j < n and ratio[j] > 0.55:
+                zones.append((i + 1, j, close[j] < open_price[j]))
+            i = j + 1
+        else:
+            i += 1
+    return zones
+
+
+def reference_zone_status(high, low, start, zone_low, zone_high, target_price):
+    # check_zone_tested_and_target before zone_index
+    entered = False
+    for k in range(start, len(high)):
+        if not entered and low[k] <= zone_high and high[k] >= zone_low:
+            entered = True
+        if entered:
+            if high[k] >= target_price:
+                return zone_index.STATUS_TARGET
+            if low[k] < zone_low:
+                return zone_index.STATUS_TESTED
+    return zone_index.STATUS_FRESH
+
+
+def reference_is_zone_tested(open_price, high, low, close, base_start, base_end):
+    # dem_zones_updated.is_zone_tested before zone_index
+    for j in range(base_end, len(high)):
+        for k in range(base_start, base_end):
+            if low[j] <= open_price[k] <= high[j] or low[j] <= close[k] <= high[j]:
+                return True
+    return False
+
+
+def reference_support_resistance(high, low, window, threshold):
+    # Rolling-window pivots and a greedy clustering loop over the sorted prices
+    high_series = pd.Series(high)
+    low_series = pd.Series(low)
+    local_max = np.flatnonzero(high_series == high_series.rolling(window, center=True).max())
+    local_min = np.flatnonzero(low_series == low_series.rolling(window, center=True).min())
+
+    def cluster(prices):
+        result = []
+        prices = sorted(float(p) for p in prices if not np.isnan(p))
+        i = 0
+        while i < len(prices):
+            j = i
+            while j < len(prices) and prices[j] <= prices[i] + abs(prices[i]) * threshold:
+                j += 1
+            result.append((len(prices[i:j]), prices[i], prices[j - 1]))
+            i = j
+        return result
+
+    return (local_max.tolist(), local_min.tolist(),
+            cluster(np.asarray(high)[local_max]), cluster(np.asarray(low)[local_min]))
+
+
+# -----------------------------
+# Cases
+# -----------------------------
+
+def _ohlc(data):
+    return tuple(data[name].to_numpy(dtype=np.float64) for name in ['Open', 'High', 'Low', 'Close'])
+
+
+def _engine_dz_sz_zones(open_price, high, low, close):
+    body_pct = zone_engine.body_percentage(open_price, high, low, close)
+    return zone_engine.detect_demand_zones(open_price, high, low, close,
+                                           body_pct > 50, body_pct < 50, body_pct > 50, max_base=5)
+
+
+def _engine_bulk_zones(open_price, high, low, close):
+    body_pct = zone_engine.body_percentage(open_price, high, low, close)
+    return zone_engine.detect_demand_zones(open_price, high, low, close,
+                                           body_pct > 50, body_pct < 50, body_pct > 50,
+                                           max_base=5, resume=zone_engine.RESUME_AFTER_LEGOUT,
+                                           breakout="upper_body")
+
+
+def _engine_sd_zones(open_price, high, low, close):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        body_ratio = np.abs(close - open_price) / (high - low)
+    exciting = body_ratio > 0.55
+    return zone_engine.detect_supply_demand_zones(open_price, high, low, close, exciting, body_ratio < 0.45,
+                                                  exciting, max_base=3, resume=zone_engine.RESUME_PAST_LEGOUT)
+
+
+def _zone_keys(zones):
+    return list(zip(zones['legin'].tolist(), zones['legout'].tolist(),
+                    zones['base_start'].tolist(), zones['base_end'].tolist()))
+
+
+def _stream_bulk_zones(data):
+    detector = ZoneDetector()
+    for open_price, high, low, close in zip(*(column.tolist() for column in _ohlc(data))):
+        detector.add_candle(open_price, high, low, close)
+    return [(z.legin, z.legout) for z in detector.zones if z.kind == DEMAND]
+
+
+def _touch_statuses(high, low, zones):
+    touch_index = zone_index.TouchIndex(low, high)
+    statuses = []
+    for z in zones:
+        risk = z['base_high'] - z['base_low']
+        status, _, _ = touch_index.zone_status(int(z['legout']) + 1, z['base_low'], z['base_high'],
+                                               z['base_high'] + 2 * risk)
+        statuses.append(status)
+    return statuses
+
+
+def _sweep_statuses(high, low, zones):
+    target_price = zones['base_high'] + 2 * (zones['base_high'] - zones['base_low'])
+    return [status for status, _, _ in zone_index.zone_statuses(low, high, zones['legout'] + 1, zones['base_low'],
+                                                                zones['base_high'], target_price)]
+
+
+def _reference_statuses(high, low, zones):
+    high, low = high.tolist(), low.tolist()
+    return [reference_zone_status(high, low, int(z['legout']) + 1, float(z['base_low']), float(z['base_high']),
+                                  float(z['base_high'] + 2 * (z['base_high'] - z['base_low'])))
+            for z in zones]
+
+
+def _touch_tested(open_price, high, low, close, zones):
+    # Same test as dem_zones_updated.zone_prices_touched
+    touch_index = zone_index.TouchIndex(low, high)
+    tested = []
+    for z in zones:
+        base_start, base_end = int(z['base_start']), int(z['base_end'])
+        base_prices = set(open_price[base_start:base_end]) | set(close[base_start:base_end])
+        tested.append(any(touch_index.is_price_touched(base_end, price) for price in base_prices))
+    return tested
+
+
+def _reference_tested(open_price, high, low, close, zones):
+    columns = [column.tolist() for column in (open_price, high, low, close)]
+    return [reference_is_zone_tested(*columns, int(z['base_start']), int(z['base_end'])) for z in zones]
+
+
+def _streaming_support_resistance(high, low, window, threshold):
+    local_max, local_min = pivots.find_pivots(high, low, window)
+    resistances = levels.cluster_levels(high[local_max], tolerance=threshold, positions=local_max)
+    supports = levels.cluster_levels(low[local_min], tolerance=threshold, positions=local_min)
+    return (local_max.tolist(), local_min.tolist(),
+            list(zip(resistances['touches'].tolist(), resistances['low'].tolist(), resistances['high'].tolist())),
+            list(zip(supports['touches'].tolist(), supports['low'].tolist(), supports['high'].tolist())))
+
+
+def benchmark_cases(data):
+    """
+    Yields (case name, {variant: (callable, is_reference)}, canonical) for the bars.
+    canonical(result) turns a variant's output into comparable plain values.
+    """
+    open_price, high, low, close = _ohlc(data)
+    lists = [column.tolist() for column in (open_price, high, low, close)]
+
+    yield "detect_demand_zones/dz_sz", {
+        "engine": (lambda: _engine_dz_sz_zones(open_price, high, low, close), False),
+        "reference": (lambda: reference_dz_sz_zones(*lists), True),
+    }, lambda result: _zone_keys(result) if isinstance(result, np.ndarray) else result
+
+    yield "detect_demand_zones/gui_bulk", {
+        "engine": (lambda: _engine_bulk_zones(open_price, high, low, close), False),
+        "stream": (lambda: _stream_bulk_zones(data), False),
+        "reference": (lambda: reference_bulk_zones(*lists), True),
+    }, lambda result: ([(legin, legout) for legin, legout, _, _ in _zone_keys(result)]
+                       if isinstance(result, np.ndarray) else [zone[:2] for zone in result])
+
+    yield "detect_supply_demand_zones/dem_zones", {
+        "engine": (lambda: _engine_sd_zones(open_price, high, low, close), False),
+        "reference": (lambda: reference_sd_zones(*lists), True),
+    }, lambda result: (list(zip(result['base_start'].tolist(), result['base_end'].tolist(),
+                                result['is_supply'].tolist()))
+                       if isinstance(result, np.ndarray) else result)
+
+    dz_sz_zones = _engine_dz_sz_zones(open_price, high, low, close)
+    yield "check_zone_tested_and_target", {
+        "touch_index": (lambda: _touch_statuses(high, low, dz_sz_zones), False),
+        "sweep": (lambda: _sweep_statuses(high, low, dz_sz_zones), False),
+        "reference": (lambda: _reference_statuses(high, low, dz_sz_zones), True),
+    }, list
+
+    sd_zones = _engine_sd_zones(open_price, high, low, close)
+    yield "is_zone_tested", {
+        "touch_index": (lambda: _touch_tested(open_price, high, low, close, sd_zones), False),
+        "reference": (lambda: _reference_tested(open_price, high, low, close, sd_zones), True),
+    }, list
+
+    yield "detect_support_resistance", {
+        "streaming": (lambda: _streaming_support_resistance(high, low, 20, 0.01), False),
+        "reference": (lambda: reference_support_resistance(high, low, 20, 0.01), True),
+    }, lambda result: ([("pivot_high", position) for position in result[0]] +
+                       [("pivot_low", position) for position in result[1]] +
+                       [("resistance",) + level for level in result[2]] +
+                       [("support",) + level for level in result[3]])
+
+
+# -----------------------------
+# Runner and Report
+# -----------------------------
+
+def measure(func, repeat=3):
+    """
+    Runs func repeat times for the best wall time, then once more under
+    tracemalloc for the peak memory it allocates.
+
+    Returns:
+        Tuple of (result, best seconds, peak bytes).
+    """
+    best = None
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def digest(values):
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, seed=0, reference_max=100000, log=print):
+    """
+    Runs every case at every size.
+
+    Args:
+        reference_max: Largest size the plain-loop reference variants run at.
+        log: Called with one line per measurement; None for silence.
+
+    Returns:
+        The report as a dict.
+    """
+    results = []
+    mismatches = []
+    for size in sizes:
+        data = synthetic_ohlc(size, seed=seed)
+        for case, variants, canonical in benchmark_cases(data):
+            digests = {}
+            for variant, (func, is_reference) in variants.items():
+                if is_reference and size > reference_max:
+                    continue
+                result, seconds, peak = measure(func, repeat)
+                values = canonical(result)
+                digests[variant] = digest(values)
+                results.append({
+                    "case": case,
+                    "variant": variant,
+                    "bars": size,
+                    "seconds": seconds,
+                    "peak_bytes": peak,
+                    "items": len(values),
+                    "digest": digests[variant],
+                })
+                if log is not None:
+                    log(f"{case:38} {variant:12} {size:>9} bars {seconds * 1000:11.2f} ms "
+                        f"{peak / 2 ** 20:9.2f} MiB {len(values):>8} items")
+            if len(set(digests.values())) > 1:
+                mismatches.append({"case": case, "bars": size, "digests": digests})
+                if log is not None:
+                    log(f"MISMATCH in {case} at {size} bars: {digests}")
+
+    return {
+        "version": REPORT_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+        },
+        "config": {"sizes": list(sizes), "repeat": repeat, "seed": seed, "reference_max": reference_max},
+        "results": results,
+        "mismatches": mismatches,
+    }
+
+
+def compare_reports(old, new):
+    """
+    Lines comparing the timings and outputs of two reports, matched on (case, variant, bars).
+    """
+    previous = {(r["case"], r["variant"], r["bars"]): r for r in old["results"]}
+    lines = []
+    for r in new["results"]:
+        before = previous.get((r["case"], r["variant"], r["bars"]))
+        if before is None:
+            continue
+        ratio = r["seconds"] / before["seconds"] if before["seconds"] else float('inf')
+        note = "" if r["digest"] == before["digest"] else "  OUTPUT CHANGED"
+        lines.append(f"{r['case']:38} {r['variant']:12} {r['bars']:>9} bars "
+                     f"{before['seconds'] * 1000:11.2f} -> {r['seconds'] * 1000:11.2f} ms ({ratio:6.2f}x){note}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the zone detection hot paths on synthetic bars.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated bar counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per variant; the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic bars")
+    parser.add_argument("--reference-max", type=int, default=100000,
+                        help="Largest bar count the slow reference loops run at")
+    parser.add_argument("--out", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    options = parser.parse_args()
+
+    report = run_benchmarks([int(size) for size in options.sizes.split(",")], options.repeat,
+                            options.seed, options.reference_max)
+    if options.out:
+        with open(options.out, "w") as file:
+            json.dump(report, file, indent=1, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as file:
+            print("\n" + "\n".join(compare_reports(json.load(file), report)))
+    sys.exit(1 if report["mismatches"] else 0)
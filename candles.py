@@ -0,0 +1,187 @@
+import hashlib
+
+import numpy as np
+
+import instrument
+import zone_engine
+
+# -----------------------------
+# Shared Candle Definitions
+# -----------------------------
+#
+# CandleSeries keeps a whole price history as contiguous OHLC columns, so it
+# can be built straight from a DataFrame without iterrows. Indexing it returns
+# a CandleView that reads from those columns and behaves like a Candle.
+
+CANDLE_DTYPE = np.dtype([
+    ("open_price", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+])
+
+
+def ohlc_digest(timestamps, open_price, high, low, close, n=None):
+    """
+    SHA-1 hex digest of the int64 timestamps and OHLC values of the first n bars (all by default).
+    """
+    bars = np.column_stack([np.asarray(timestamps, dtype=np.int64)[:n].view(np.float64),
+                            open_price[:n], high[:n], low[:n], close[:n]])
+    return hashlib.sha1(bars.tobytes()).hexdigest()
+
+
+class _CandleProperties:
+    __slots__ = ()
+
+    @property
+    def body_size(self):
+        return abs(self.close - self.open_price)
+
+    @property
+    def candle_range(self):
+        return self.high - self.low
+
+    @property
+    def body_percentage(self):
+        if self.candle_range == 0:
+            return 0
+        return (self.body_size / self.candle_range) * 100
+
+    @property
+    def is_bullish(self):
+        return self.close > self.open_price
+
+    @property
+    def upper_body(self):
+        return max(self.open_price, self.close)
+
+
+class Candle(_CandleProperties):
+    """
+    Represents a single standalone candlestick.
+    """
+    __slots__ = ("open_price", "high", "low", "close", "date")
+
+    def __init__(self, open_price, high, low, close, date=None):
+        self.open_price = open_price
+        self.high = high
+        self.low = low
+        self.close = close
+        self.date = date
+
+
+class CandleView(_CandleProperties):
+    """
+    A candle inside a CandleSeries; reads its prices from the series columns.
+    """
+    __slots__ = ("_series", "_index")
+
+    def __init__(self, series, index):
+        self._series = series
+        self._index = index
+
+    @property
+    def open_price(self):
+        return float(self._series.open_price[self._index])
+
+    @property
+    def high(self):
+        return float(self._series.high[self._index])
+
+    @property
+    def low(self):
+        return float(self._series.low[self._index])
+
+    @property
+    def close(self):
+        return float(self._series.close[self._index])
+
+    @property
+    def date(self):
+        if self._series.dates is None:
+            return None
+        return self._series.dates[self._index]
+
+
+class CandleSeries:
+    """
+    A sequence of candles stored as OHLC columns.
+
+    Supports len(), iteration, integer indexing (returns a CandleView) and
+    slicing (returns a CandleSeries sharing the same memory).
+    """
+    def __init__(self, open_price, high, low, close, dates=None):
+        self.open_price = np.asarray(open_price, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.dates = dates
+
+    @classmethod
+    def from_dataframe(cls, data):
+        """
+        Builds a series from a yfinance style DataFrame with Open/High/Low/Close
+        columns and the candle dates as index.
+        """
+        def column(name):
+            values = data[name]
+            # yfinance returns (Price, Ticker) columns even for a single symbol
+            if values.ndim > 1:
+                values = values.iloc[:, 0]
+            return values.to_numpy(dtype=np.float64)
+
+        with instrument.stage("candles"):
+            return cls(column('Open'), column('High'), column('Low'), column('Close'), data.index)
+
+    def __len__(self):
+        return len(self.close)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return CandleSeries(self.open_price[key], self.high[key], self.low[key], self.close[key],
+                                None if self.dates is None else self.dates[key])
+        index = int(key)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("candle index out of range")
+        return CandleView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield CandleView(self, index)
+
+    def ohlc_arrays(self):
+        return self.open_price, self.high, self.low, self.close
+
+    def fingerprint(self):
+        """
+        Digest of the dates and OHLC values; equal series have equal fingerprints.
+        """
+        if self.dates is None:
+            timestamps = np.zeros(len(self), dtype=np.int64)
+        else:
+            # Nanoseconds since the epoch whatever unit the index uses; .values is UTC for tz-aware dates
+            timestamps = np.asarray(self.dates.values).astype('datetime64[ns]').view(np.int64)
+        return ohlc_digest(timestamps, *self.ohlc_arrays())
+
+    @property
+    def body_percentage(self):
+        return zone_engine.body_percentage(self.open_price, self.high, self.low, self.close)
+
+    @property
+    def is_bullish(self):
+        return self.close > self.open_price
+
+    @property
+    def upper_body(self):
+        return np.maximum(self.open_price, self.close)
+
+    def to_records(self):
+        """
+        Returns the candles as a structured array with CANDLE_DTYPE fields.
+        """
+        records = np.empty(len(self), dtype=CANDLE_DTYPE)
+        for name in CANDLE_DTYPE.names:
+            records[name] = getattr(self, name)
+        return records
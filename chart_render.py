@@ -0,0 +1,163 @@
+import os
+import sys
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection
+
+import zone_engine
+import zone_index
+
+# -----------------------------
+# Zone Chart Rendering
+# -----------------------------
+#
+# add_zone_lines() draws the upper and lower boundary of every zone as one
+# LineCollection instead of two ax.hlines() calls per zone. render_charts()
+# renders many symbols headless with the Agg backend, optionally across the
+# universe_scan process pool, and writes image files instead of opening a
+# blocking window per chart:
+#
+#   python chart_render.py [START] [END] [OUT_DIR] [png|svg]
+#
+# renders every symbol of yf_symbols.csv from the OHLC cache.
+
+CHART_DIR = "charts"
+STATUS_COLORS = {
+    zone_index.STATUS_TARGET: 'pink',
+    zone_index.STATUS_TESTED: 'blue',
+    zone_index.STATUS_FRESH: 'green',
+}
+
+
+def _date_numbers(dates):
+    # Matplotlib date numbers, as mplfinance uses with show_nontrading=True
+    return mdates.date2num(pd.DatetimeIndex(dates).to_pydatetime())
+
+
+def zone_line_collection(x_start, x_end, highs, lows, colors, linestyle='--', linewidth=1.5):
+    """
+    Builds one LineCollection with a horizontal line at the high and the low
+    of every zone, from x_start to x_end (numbers or dates; x_end may be a scalar).
+    """
+    highs = np.asarray(highs, dtype=np.float64)
+    lows = np.asarray(lows, dtype=np.float64)
+    n = len(highs)
+    x_start = np.broadcast_to(np.asarray(x_start), (n,))
+    x_end = np.broadcast_to(np.asarray(x_end), (n,))
+    if n and not np.issubdtype(x_start.dtype, np.number):
+        x_start = _date_numbers(x_start)
+    if n and not np.issubdtype(x_end.dtype, np.number):
+        x_end = _date_numbers(x_end)
+
+    segments = np.empty((2 * n, 2, 2), dtype=np.float64)
+    segments[:n, :, 1] = highs[:, None]
+    segments[n:, :, 1] = lows[:, None]
+    segments[:n, 0, 0] = segments[n:, 0, 0] = x_start
+    segments[:n, 1, 0] = segments[n:, 1, 0] = x_end
+    colors = list(colors)
+    return LineCollection(segments, colors=colors + colors, linestyles=linestyle, linewidths=linewidth)
+
+
+def add_zone_lines(ax, x_start, x_end, highs, lows, colors, **kwargs):
+    """
+    Draws every zone boundary on ax in a single artist.
+    """
+    if len(highs) == 0:
+        return None
+    return ax.add_collection(zone_line_collection(x_start, x_end, highs, lows, colors, **kwargs), autolim=False)
+
+
+def chart_zones(data, min_legin_pct=50, max_base_pct=50, min_legout_pct=50, max_base=5):
+    """
+    Demand zones of a frame with the dz_sz_chart.py rules.
+
+    Returns:
+        DataFrame with the leg-in date, zone high and low, status and line color of every zone.
+    """
+    open_price, high, low, close = (data[name].to_numpy(dtype=np.float64).ravel()
+                                    for name in ['Open', 'High', 'Low', 'Close'])
+    body_pct = zone_engine.body_percentage(open_price, high, low, close)
+    zones = zone_engine.detect_demand_zones(open_price, high, low, close,
+                                            body_pct > min_legin_pct, body_pct < max_base_pct,
+                                            body_pct > min_legout_pct, max_base=max_base)
+    target_price = zones['base_high'] + 2 * (zones['base_high'] - zones['base_low'])
+    statuses = [status for status, _, _ in zone_index.zone_statuses(low, high, zones['legout'] + 1, zones['base_low'],
+                                                                    zones['base_high'], target_price)]
+    return pd.DataFrame({
+        "Leg-In Date": data.index[zones['legin']],
+        "Zone High": zones['base_high'],
+        "Zone Low": zones['base_low'],
+        "Status": statuses,
+        "Color": [STATUS_COLORS[status] for status in statuses],
+    })
+
+
+def render_chart(data, zones, path, title=None, figsize=(15, 10), dpi=100):
+    """
+    Renders a candle chart with its zones to path; the format follows the extension.
+    """
+    # Imported here so add_zone_lines() works without mplfinance installed
+    import mplfinance as mpf
+    import matplotlib.pyplot as plt
+
+    fig, ax = mpf.plot(data, type='candle', style='charles',
+                       title=title or '',
+                       ylabel='Price',
+                       volume=False,
+                       tight_layout=True,
+                       show_nontrading=True,
+                       returnfig=True,
+                       figsize=figsize)
+    add_zone_lines(ax[0], zones["Leg-In Date"], data.index[-1],
+                   zones["Zone High"], zones["Zone Low"], zones["Color"])
+    fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+    return path
+
+
+def render_symbol(symbol, store, out_dir, fmt):
+    """
+    Scanner job: detects the zones of one symbol and writes its chart.
+    Returns the file path, or None if there is no data.
+    """
+    matplotlib.use("Agg")
+    data = store.frame(symbol)
+    if data.empty:
+        return None
+    path = os.path.join(out_dir, f"{quote(symbol, safe='')}.{fmt}")
+    return render_chart(data, chart_zones(data), path, title=f"{symbol} with Detected Demand Zones")
+
+
+def render_charts(frames, out_dir=CHART_DIR, fmt="png", workers=None):
+    """
+    Renders a chart per symbol of frames ({symbol: OHLC DataFrame}) without any window.
+
+    Returns:
+        Dict of symbol -> written file path (None for symbols without data).
+    """
+    from universe_scan import scan_universe
+
+    matplotlib.use("Agg")
+    os.makedirs(out_dir, exist_ok=True)
+    symbols = list(frames)
+    paths = scan_universe(symbols, frames, render_symbol, (out_dir, fmt), workers)
+    return dict(zip(symbols, paths))
+
+
+if __name__ == "__main__":
+    from ohlc_cache import OHLCCache
+
+    start_date = sys.argv[1] if len(sys.argv) > 1 else "2023-01-01"
+    end_date = sys.argv[2] if len(sys.argv) > 2 else "2024-12-31"
+    out_dir = sys.argv[3] if len(sys.argv) > 3 else CHART_DIR
+    fmt = sys.argv[4] if len(sys.argv) > 4 else "png"
+
+    symbols = pd.read_csv('yf_symbols.csv')['Symbol'].tolist()
+    frames = OHLCCache().get_many(symbols, interval="1d", start=start_date, end=end_date)
+    paths = render_charts(frames, out_dir, fmt)
+    written = [path for path in paths.values() if path]
+    print(f"Wrote {len(written)} charts to {out_dir}.")
@@ -1,10 +1,39 @@
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import mplfinance as mpf
 import matplotlib.pyplot as plt
 import customtkinter as ctk
-import csv
-import os
+from candles import CandleSeries
+from ohlc_cache import OHLCCache
+from universe_scan import iter_pipeline_scan
+from scan_worker import ScanWorker
+from results_store import ResultsStore, make_run_id
+from result_cache import ResultCache, result_key
+import timeframes
+import resample
+import chart_render
+import instrument
+import zone_engine
+import zone_index
+
+# Zones are saved to the results store; demand_zone_data.csv is exported from it
+RESULTS_SOURCE = "coinsiding_dz"
+CSV_FILE = 'demand_zone_data.csv'
+CSV_COLUMNS = {
+    "Symbol": "symbol",
+    "Leg-In Time": "legin_time",
+    "Leg-Out Time": "legout_time",
+    "Zone High": "zone_high",
+    "Zone Low": "zone_low",
+    "Status": "status",
+    "Higher Timeframe Leg-In Time": "htf_legin_time",
+    "Higher Timeframe Leg-Out Time": "htf_legout_time",
+    "Higher Timeframe Zone High": "htf_zone_high",
+    "Higher Timeframe Zone Low": "htf_zone_low",
+}
+
+# Written when "Save cProfile Dump" is ticked; open it with snakeviz, gprof2dot or flameprof
+PROFILE_FILE = "scan_profile.prof"
 
 # Define the main application class
 class DemandZoneApp(ctk.CTk):
@@ -14,6 +43,19 @@ class DemandZoneApp(ctk.CTk):
         self.title("Demand Zone Detector")
         self.geometry("600x900")
 
+        # Bars are served from disk and only missing ranges are downloaded
+        self.ohlc_cache = OHLCCache()
+
+        # Repeated scans update their zones in place instead of appending to a CSV
+        self.results_store = ResultsStore()
+
+        # Symbols whose bars and parameters were scanned before are answered from here
+        self.result_cache = ResultCache()
+
+        # Scans run in the background so the window stays responsive
+        self.scan_worker = ScanWorker(self)
+        self.scan_results = {}
+
         # Create a scrollable frame
         self.scrollable_frame = ctk.CTkScrollableFrame(self, width=580, height=800)
         self.scrollable_frame.pack(pady=10)
@@ -85,6 +127,16 @@ class DemandZoneApp(ctk.CTk):
         self.scan_all_button = ctk.CTkButton(self.scrollable_frame, text="Scan All Nifty 50 Stocks", command=self.scan_all_nifty50)
         self.scan_all_button.pack(pady=20)
 
+        # Button to stop a running scan
+        self.cancel_button = ctk.CTkButton(self.scrollable_frame, text="Cancel Scan", command=self.cancel_scan, state="disabled")
+        self.cancel_button.pack(pady=5)
+
+        # Stage timings of a scan are only recorded when asked for
+        self.timings_checkbox = ctk.CTkCheckBox(self.scrollable_frame, text="Show Stage Timings")
+        self.timings_checkbox.pack(pady=5)
+        self.profile_checkbox = ctk.CTkCheckBox(self.scrollable_frame, text="Save cProfile Dump")
+        self.profile_checkbox.pack(pady=5)
+
         # Label to display results
         self.output_label = ctk.CTkLabel(self.scrollable_frame, text="")
         self.output_label.pack(pady=20)
@@ -106,13 +158,14 @@ class DemandZoneApp(ctk.CTk):
         min_legout_pct = float(self.min_legout_entry.get() or "50")
         max_legout_pct = float(self.max_legout_entry.get() or "100")
 
-        # Fetch monthly data for the given symbol
-        monthly_data = yf.download(symbol, start=start_date, end=end_date, interval="1mo")
+        params = (min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct)
+
+        # Fetch daily data once; monthly bars are resampled from it locally
+        daily_data = self.ohlc_cache.get(symbol, interval="1d", start=start_date, end=end_date)
+        monthly_data = resample.resample_ohlc(daily_data, "1mo")
 
-        # Convert monthly data to a list of Candle objects
-        monthly_candles = []
-        for idx, row in monthly_data.iterrows():
-            monthly_candles.append(Candle(row['Open'], row['High'], row['Low'], row['Close'], idx))
+        # Convert monthly data to a candle series
+        monthly_candles = CandleSeries.from_dataframe(monthly_data)
 
         # Detect monthly demand zones using user-defined or default parameters
         monthly_demand_zones = self.detect_demand_zones(monthly_candles, min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct)
@@ -121,33 +174,17 @@ class DemandZoneApp(ctk.CTk):
             self.output_label.configure(text="No monthly demand zones detected.")
             return
 
-        # Fetch daily data for the given symbol
-        daily_data = yf.download(symbol, start=start_date, end=end_date, interval="1d")
-
-        # Filter daily data based on the detected monthly demand zones
-        filtered_daily_data = pd.DataFrame()
-        for dz in monthly_demand_zones:
-            first_base_date = monthly_data.index[dz[0]]
-            last_base_date = monthly_data.index[dz[1]]
-
-            filtered_data = daily_data.loc[first_base_date:last_base_date]
-            
-            # Ensure the filtered data has a DatetimeIndex
-            filtered_data.index = pd.to_datetime(filtered_data.index)
-            
-            filtered_daily_data = pd.concat([filtered_daily_data, filtered_data])
-
-        # Reset the index to ensure it's a proper DatetimeIndex after filtering
-        filtered_daily_data.index = pd.to_datetime(filtered_daily_data.index)
+        # Filter daily data to the detected monthly demand zones in one take
+        monthly_starts = monthly_data.index[[dz[0] for dz in monthly_demand_zones]]
+        monthly_ends = monthly_data.index[[dz[1] for dz in monthly_demand_zones]]
+        filtered_daily_data = timeframes.slice_windows(daily_data, monthly_starts, monthly_ends)
 
         if filtered_daily_data.empty:
             self.output_label.configure(text="No data available for the selected date range or criteria.")
             return
 
-        # Convert filtered daily data to Candle objects
-        filtered_candles = []
-        for idx, row in filtered_daily_data.iterrows():
-            filtered_candles.append(Candle(row['Open'], row['High'], row['Low'], row['Close'], idx))
+        # Convert filtered daily data to a candle series
+        filtered_candles = CandleSeries.from_dataframe(filtered_daily_data)
 
         # Detect demand zones in the filtered daily data
         demand_zones = self.detect_demand_zones(filtered_candles, min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct)
@@ -156,6 +193,14 @@ class DemandZoneApp(ctk.CTk):
             self.output_label.configure(text="No demand zones detected in the selected time range.")
             return
 
+        # Check if the zones have been tested and if they met the 1:2 target
+        zone_colors = self.check_zones_tested_and_target(demand_zones, filtered_candles)
+
+        # Monthly zone containing each daily zone, looked up by bisection
+        monthly_index = timeframes.ZoneIntervalIndex(monthly_starts, monthly_ends)
+        parent_zones = monthly_index.containing_many(filtered_daily_data.index[[dz[0] for dz in demand_zones]],
+                                                     filtered_daily_data.index[[dz[1] for dz in demand_zones]])
+
         # Prepare data for CSV export
         csv_data = []
         fresh_zones = 0
@@ -174,17 +219,14 @@ class DemandZoneApp(ctk.CTk):
 
         # Add horizontal rays for demand zones and prepare CSV data
         zone_info = []
-        for dz in demand_zones:
+        ray_starts, ray_highs, ray_lows, ray_colors = [], [], [], []
+        for zone_number, (dz, color) in enumerate(zip(demand_zones, zone_colors)):
             base_candles = dz[2]
 
             # Find the highest high and lowest low of the base candles
             highest_high = max(candle.high for candle in base_candles)
             lowest_low = min(candle.low for candle in base_candles)
 
-            # Check if the zone has been tested and if it met the 1:2 target
-            start_index = dz[1] + 1  # Start checking after the leg-out candle
-            color = self.check_zone_tested_and_target(dz, filtered_candles, start_index)
-
             if color == 'green':
                 status = 'Fresh'
                 fresh_zones += 1
@@ -196,19 +238,18 @@ class DemandZoneApp(ctk.CTk):
                 target_zones += 1
 
             # Add horizontal rays (lines) from these points extending to the right
-            ax[0].hlines(y=highest_high, xmin=filtered_daily_data.index[dz[0]], xmax=filtered_daily_data.index[-1], color=color, linestyle='--', linewidth=1.5)
-            ax[0].hlines(y=lowest_low, xmin=filtered_daily_data.index[dz[0]], xmax=filtered_daily_data.index[-1], color=color, linestyle='--', linewidth=1.5)
+            ray_starts.append(filtered_daily_data.index[dz[0]])
+            ray_highs.append(highest_high)
+            ray_lows.append(lowest_low)
+            ray_colors.append(color)
 
             # Define leg-in and leg-out candles
             legin_candle = filtered_candles[dz[0]]
             legout_candle = filtered_candles[dz[1]]
 
             # Map the corresponding monthly demand zone
-            higher_timeframe_zone = None
-            for monthly_zone in monthly_demand_zones:
-                if filtered_daily_data.index[dz[0]] >= monthly_data.index[monthly_zone[0]] and filtered_daily_data.index[dz[1]] <= monthly_data.index[monthly_zone[1]]:
-                    higher_timeframe_zone = monthly_zone
-                    break
+            parent = parent_zones[zone_number]
+            higher_timeframe_zone = monthly_demand_zones[parent] if parent >= 0 else None
 
             if higher_timeframe_zone:
                 higher_legin_candle = monthly_candles[higher_timeframe_zone[0]]
@@ -231,16 +272,17 @@ class DemandZoneApp(ctk.CTk):
                 "Zone High": highest_high,
                 "Zone Low": lowest_low,
                 "Status": status,
-                "Higher Timeframe Leg-In Time": higher_legin_candle.date if higher_legin_candle else "N/A",
-                "Higher Timeframe Leg-Out Time": higher_legout_candle.date if higher_legout_candle else "N/A",
-                "Higher Timeframe Zone High": higher_legin_candle.high if higher_legin_candle else "N/A",
-                "Higher Timeframe Zone Low": higher_legout_candle.low if higher_legout_candle else "N/A"
+                "Higher Timeframe Leg-In Time": higher_legin_candle.date if higher_legin_candle else None,
+                "Higher Timeframe Leg-Out Time": higher_legout_candle.date if higher_legout_candle else None,
+                "Higher Timeframe Zone High": higher_legin_candle.high if higher_legin_candle else None,
+                "Higher Timeframe Zone Low": higher_legout_candle.low if higher_legout_candle else None
             })
 
+        chart_render.add_zone_lines(ax[0], ray_starts, filtered_daily_data.index[-1], ray_highs, ray_lows, ray_colors)
         plt.show()
 
-        # Write data to CSV
-        self.write_to_csv(csv_data)
+        # Save the zones and refresh the CSV export
+        self.save_results(make_run_id(RESULTS_SOURCE, start_date, end_date, *params), params, [(symbol, csv_data)])
 
         # Display zone information
         output_text = (f"Number of fresh zones: {fresh_zones}\n"
@@ -273,199 +315,240 @@ class DemandZoneApp(ctk.CTk):
         min_legout_pct = float(self.min_legout_entry.get() or "50")
         max_legout_pct = float(self.max_legout_entry.get() or "100")
 
-        csv_data = []
-
-        for symbol in nifty50_symbols:
-            # Fetch monthly data for the given symbol
-            monthly_data = yf.download(symbol, start=start_date, end=end_date, interval="1mo")
-
-            # Convert monthly data to a list of Candle objects
-            monthly_candles = []
-            for idx, row in monthly_data.iterrows():
-                monthly_candles.append(Candle(row['Open'], row['High'], row['Low'], row['Close'], idx))
-
-            # Detect monthly demand zones
-            monthly_demand_zones = self.detect_demand_zones(
-                monthly_candles, min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct
-            )
-
-            if not monthly_demand_zones:
-                continue
+        params = (min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct)
 
-            # Fetch daily data for the given symbol
-            daily_data = yf.download(symbol, start=start_date, end=end_date, interval="1d")
-
-            # Filter daily data based on the detected monthly demand zones
-            filtered_daily_data = pd.DataFrame()
-            for dz in monthly_demand_zones:
-                first_base_date = monthly_data.index[dz[0]]
-                last_base_date = monthly_data.index[dz[1]]
-
-                filtered_data = daily_data.loc[first_base_date:last_base_date]
-                
-                # Ensure the filtered data has a DatetimeIndex
-                filtered_data.index = pd.to_datetime(filtered_data.index)
-                
-                filtered_daily_data = pd.concat([filtered_daily_data, filtered_data])
-
-            # Reset the index to ensure it's a proper DatetimeIndex after filtering
-            filtered_daily_data.index = pd.to_datetime(filtered_daily_data.index)
-
-            if filtered_daily_data.empty:
-                continue
-
-            # Convert filtered daily data to Candle objects
-            filtered_candles = []
-            for idx, row in filtered_daily_data.iterrows():
-                filtered_candles.append(Candle(row['Open'], row['High'], row['Low'], row['Close'], idx))
+        if self.scan_worker.running:
+            return
 
-            # Detect demand zones in the filtered daily data
-            demand_zones = self.detect_demand_zones(
-                filtered_candles, min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct
-            )
+        run_id = make_run_id(RESULTS_SOURCE, start_date, end_date, *params)
+
+        def fetch(chunk):
+            # Only daily bars are downloaded; the workers resample them to monthly
+            return self.ohlc_cache.map_many(chunk, interval="1d", start=start_date, end=end_date,
+                                            keys=[(symbol, "1d") for symbol in chunk])
+
+        def cache_key(symbol, store):
+            return result_key(RESULTS_SOURCE, params, store.candles((symbol, "1d")).fingerprint())
+
+        def write(position, symbol, rows):
+            # Re-saving a symbol replaces its zones in the run
+            self.results_store.save_symbol(run_id, symbol, "1d", rows, CSV_COLUMNS)
+
+        def scan(cancel_event):
+            # Downloading, scanning and saving overlap, a chunk of symbols at a time
+            self.results_store.start_run(run_id, RESULTS_SOURCE, params)
+            return iter_pipeline_scan(nifty50_symbols, fetch, scan_symbol, (params,), write, cancel_event=cancel_event,
+                                      cache=self.result_cache, cache_key=cache_key)
+
+        self.scan_results = {}
+        self.scan_total = len(nifty50_symbols)
+        self.scan_all_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
+        self.output_label.configure(text="Downloading Nifty 50 data...")
+        self.result_cache.reset_counts()
+        if self.timings_checkbox.get() or self.profile_checkbox.get():
+            scan = instrument.record_scan(scan, profile=bool(self.profile_checkbox.get()))
+        self.scan_worker.start(scan, self.on_symbol_scanned, self.on_scan_done, self.on_scan_error)
+
+    def cancel_scan(self):
+        self.scan_worker.cancel()
+        self.output_label.configure(text="Cancelling scan...")
+
+    def on_symbol_scanned(self, result):
+        # Called on the main thread as each symbol finishes
+        position, symbol, rows = result
+        self.scan_results[position] = (symbol, rows)
+        self.output_label.configure(
+            text=f"Scanned {len(self.scan_results)}/{self.scan_total}: {symbol} ({len(rows)} zones)")
+
+    def on_scan_done(self, cancelled):
+        self.scan_all_button.configure(state="normal")
+        self.cancel_button.configure(state="disabled")
+        if cancelled:
+            self.output_label.configure(text=f"Scan cancelled after {len(self.scan_results)} stocks. "
+                                             f"Their zones were saved, but {CSV_FILE} was not updated.\n"
+                                             + self.result_cache.summary() + self.stage_timings())
+            return
 
-            if not demand_zones:
-                continue
-
-            # Prepare CSV data
-            for dz in demand_zones:
-                base_candles = dz[2]
-
-                # Find the highest high and lowest low of the base candles
-                highest_high = max(candle.high for candle in base_candles)
-                lowest_low = min(candle.low for candle in base_candles)
-
-                # Define leg-in and leg-out candles
-                legin_candle = filtered_candles[dz[0]]
-                legout_candle = filtered_candles[dz[1]]
-
-                # Map the corresponding monthly demand zone
-                higher_timeframe_zone = None
-                for monthly_zone in monthly_demand_zones:
-                    if filtered_daily_data.index[dz[0]] >= monthly_data.index[monthly_zone[0]] and filtered_daily_data.index[dz[1]] <= monthly_data.index[monthly_zone[1]]:
-                        higher_timeframe_zone = monthly_zone
-                        break
-
-                if higher_timeframe_zone:
-                    higher_legin_candle = monthly_candles[higher_timeframe_zone[0]]
-                    higher_legout_candle = monthly_candles[higher_timeframe_zone[1]]
-                else:
-                    higher_legin_candle = None
-                    higher_legout_candle = None
-
-                status = self.check_zone_tested_and_target(dz, filtered_candles, dz[1] + 1)
-
-                csv_data.append({
-                    "Symbol": symbol,
-                    "Leg-In Time": legin_candle.date,
-                    "Leg-Out Time": legout_candle.date,
-                    "Zone High": highest_high,
-                    "Zone Low": lowest_low,
-                    "Status": status,
-                    "Higher Timeframe Leg-In Time": higher_legin_candle.date if higher_legin_candle else "N/A",
-                    "Higher Timeframe Leg-Out Time": higher_legout_candle.date if higher_legout_candle else "N/A",
-                    "Higher Timeframe Zone High": higher_legin_candle.high if higher_legin_candle else "N/A",
-                    "Higher Timeframe Zone Low": higher_legout_candle.low if higher_legout_candle else "N/A"
-                })
-
-        # Write the accumulated data to CSV
-        self.write_to_csv(csv_data)
+        # The zones were saved in list order while scanning, so the CSV matches a serial scan
+        with instrument.stage("save"):
+            # The CSV lists every run of this app, like the file it used to append to
+            self.results_store.export_csv(CSV_FILE, CSV_COLUMNS, source=RESULTS_SOURCE, na_rep="N/A")
 
         # Update the output label
-        self.output_label.configure(text=f"Nifty 50 stocks scan completed. Data saved to CSV.")
-
-    def write_to_csv(self, csv_data):
-        if csv_data:
-            csv_file = 'demand_zone_data.csv'
-            csv_file_exists = os.path.exists(csv_file)
-            with open(csv_file, mode='a', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=csv_data[0].keys())
-                if not csv_file_exists:
-                    writer.writeheader()  # Write the header only if the file does not exist
-                writer.writerows(csv_data)
+        self.output_label.configure(text=f"Nifty 50 stocks scan completed. Data saved to {CSV_FILE}.\n"
+                                         + self.result_cache.summary() + self.stage_timings())
+
+    def on_scan_error(self, error):
+        self.scan_all_button.configure(state="normal")
+        self.cancel_button.configure(state="disabled")
+        instrument.stop()
+        self.output_label.configure(text=f"Scan failed: {error}")
+
+    def stage_timings(self):
+        # Ends the recorded run, if any, and describes where the time went
+        stats = instrument.stop()
+        if stats is None:
+            return ""
+        text = "\n\nStage timings:\n" + stats.summary()
+        if stats.dump_profile(PROFILE_FILE):
+            text += f"\ncProfile data saved to {PROFILE_FILE}."
+        return text
+
+    def save_results(self, run_id, params, results):
+        # results is a list of (symbol, csv rows); re-saving a symbol replaces its zones in the run
+        self.results_store.start_run(run_id, RESULTS_SOURCE, params)
+        for symbol, rows in results:
+            self.results_store.save_symbol(run_id, symbol, "1d", rows, CSV_COLUMNS)
+        # The CSV lists every run of this app, like the file it used to append to
+        self.results_store.export_csv(CSV_FILE, CSV_COLUMNS, source=RESULTS_SOURCE, na_rep="N/A")
 
     def detect_demand_zones(self, candles, min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct):
-        demand_zones = []
-        i = 0
-        while i < len(candles) - 2:
-            if self.is_legin_candle(candles[i], min_legin_pct, max_legin_pct):
-                base_candles = []
-                j = i + 1
-                while j < len(candles) and len(base_candles) < max_base and self.is_base_candle(candles[j], min_base_pct, max_base_pct):
-                    base_candles.append(candles[j])
-                    j += 1
-
-                if j < len(candles) and self.is_legout_candle(candles[j], min_legout_pct, max_legout_pct):
-                    legin_candle = candles[i]
-                    legout_candle = candles[j]
-
-                    # Check if it's a demand zone
-                    if len(base_candles) >= min_base and (legout_candle.is_bullish and
-                                                         legout_candle.close > legin_candle.high and
-                                                         legout_candle.close > max(candle.high for candle in base_candles)):
-                        demand_zones.append((i, j, base_candles))  # Store the indices and base candles
-                i = j  # Skip to the next possible pattern after the legout candle
-            else:
-                i += 1
+        return detect_demand_zones(candles, min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct)
 
-        return demand_zones
-
-    def check_zone_tested_and_target(self, demand_zone, candles, start_index):
-        base_candles = demand_zone[2]
-        highest_high = max(candle.high for candle in base_candles)
-        lowest_low = min(candle.low for candle in base_candles)
-
-        # Determine the target for a 1:2 risk-reward ratio
-        risk = highest_high - lowest_low
-        target_price = highest_high + 2 * risk
-
-        for k in range(start_index, len(candles)):
-            if candles[k].low <= highest_high and candles[k].high >= lowest_low:
-                # Check if the price hits the 1:2 target after entering the zone
-                for m in range(k, len(candles)):
-                    if candles[m].high >= target_price:
-                        return 'Target Achieved'  # Zone achieved 1:2 target
-                    if candles[m].low < lowest_low:
-                        return 'Tested'  # Zone was broken before achieving target
-                break
-
-        return 'Fresh'  # Zone has not been tested
+    def check_zones_tested_and_target(self, demand_zones, candles):
+        return [chart_render.STATUS_COLORS[status] for status in check_zones_tested_and_target(demand_zones, candles)]
 
     def is_legin_candle(self, candle, min_legin_pct, max_legin_pct):
-        return min_legin_pct <= candle.body_percentage <= max_legin_pct
+        return is_legin_candle(candle, min_legin_pct, max_legin_pct)
 
     def is_base_candle(self, candle, min_base_pct, max_base_pct):
-        return min_base_pct <= candle.body_percentage <= max_base_pct
+        return is_base_candle(candle, min_base_pct, max_base_pct)
 
     def is_legout_candle(self, candle, min_legout_pct, max_legout_pct):
-        return min_legout_pct <= candle.body_percentage <= max_legout_pct
-
-# Convert fetched data to Candle objects
-class Candle:
-    def __init__(self, open_price, high, low, close, date):
-        self.open_price = open_price
-        self.high = high
-        self.low = low
-        self.close = close
-        self.date = date
-
-    @property
-    def body_size(self):
-        return abs(self.close - self.open_price)
-
-    @property
-    def candle_range(self):
-        return self.high - self.low
-
-    @property
-    def body_percentage(self):
-        if self.candle_range == 0:
-            return 0
-        return (self.body_size / self.candle_range) * 100
-
-    @property
-    def is_bullish(self):
-        return self.close > self.open_price
+        return is_legout_candle(candle, min_legout_pct, max_legout_pct)
+
+# -----------------------------
+# Zone Detection (shared by the GUI and the scanner worker processes)
+# -----------------------------
+
+# The rules take a single candle or a whole CandleSeries, whose body_percentage is an array
+def is_legin_candle(candle, min_legin_pct, max_legin_pct):
+    return (candle.body_percentage >= min_legin_pct) & (candle.body_percentage <= max_legin_pct)
+
+def is_base_candle(candle, min_base_pct, max_base_pct):
+    return (candle.body_percentage >= min_base_pct) & (candle.body_percentage <= max_base_pct)
+
+def is_legout_candle(candle, min_legout_pct, max_legout_pct):
+    return (candle.body_percentage >= min_legout_pct) & (candle.body_percentage <= max_legout_pct)
+
+def detect_demand_zones(candles, min_legin_pct, max_legin_pct, min_base, max_base, min_base_pct, max_base_pct, min_legout_pct, max_legout_pct):
+    open_price, high, low, close = zone_engine.ohlc_arrays(candles)
+    zones = zone_engine.detect_demand_zones(
+        open_price, high, low, close,
+        is_legin_candle(candles, min_legin_pct, max_legin_pct),
+        is_base_candle(candles, min_base_pct, max_base_pct),
+        is_legout_candle(candles, min_legout_pct, max_legout_pct),
+        max_base=max_base, min_base=min_base)
+    # Store the indices and base candles
+    return [(int(z['legin']), int(z['legout']), candles[z['base_start']:z['base_end']]) for z in zones]
+
+def check_zones_tested_and_target(demand_zones, candles):
+    highest_high = np.array([max(candle.high for candle in dz[2]) for dz in demand_zones], dtype=np.float64)
+    lowest_low = np.array([min(candle.low for candle in dz[2]) for dz in demand_zones], dtype=np.float64)
+
+    # Determine the targets for a 1:2 risk-reward ratio
+    risk = highest_high - lowest_low
+    target_price = highest_high + 2 * risk
+
+    # First touch of each zone after its leg-out, then whichever of target or
+    # break comes first, for all zones in one pass over the candles
+    _, high, low, _ = zone_engine.ohlc_arrays(candles)
+    statuses = zone_index.zone_statuses(low, high, [dz[1] + 1 for dz in demand_zones],
+                                        lowest_low, highest_high, target_price)
+    return [status for status, _, _ in statuses]
+
+def scan_symbol(symbol, store, params):
+    """
+    Scans one symbol for daily demand zones inside its monthly demand zones.
+    Runs in the scanner worker processes, so it must not touch the GUI.
+    """
+    csv_data = []
+
+    daily_data = store.frame((symbol, "1d"))
+
+    instrument.count("bars", len(daily_data))
+
+    # Monthly bars are built from the daily bars rather than downloaded
+    with instrument.stage("resample"):
+        monthly_data = resample.resample_ohlc(daily_data, "1mo")
+
+    # Convert monthly data to a candle series
+    monthly_candles = CandleSeries.from_dataframe(monthly_data)
+
+    # Detect monthly demand zones
+    with instrument.stage("detect"):
+        monthly_demand_zones = detect_demand_zones(monthly_candles, *params)
+
+    if not monthly_demand_zones:
+        return csv_data
+
+    # Filter daily data to the detected monthly demand zones in one take
+    with instrument.stage("align"):
+        monthly_starts = monthly_data.index[[dz[0] for dz in monthly_demand_zones]]
+        monthly_ends = monthly_data.index[[dz[1] for dz in monthly_demand_zones]]
+        filtered_daily_data = timeframes.slice_windows(daily_data, monthly_starts, monthly_ends)
+
+    if filtered_daily_data.empty:
+        return csv_data
+
+    # Convert filtered daily data to a candle series
+    filtered_candles = CandleSeries.from_dataframe(filtered_daily_data)
+
+    # Detect demand zones in the filtered daily data
+    with instrument.stage("detect"):
+        demand_zones = detect_demand_zones(filtered_candles, *params)
+    instrument.count("zones", len(demand_zones))
+
+    if not demand_zones:
+        return csv_data
+
+    with instrument.stage("status"):
+        statuses = check_zones_tested_and_target(demand_zones, filtered_candles)
+
+    # Monthly zone containing each daily zone, looked up by bisection
+    with instrument.stage("align"):
+        monthly_index = timeframes.ZoneIntervalIndex(monthly_starts, monthly_ends)
+        parent_zones = monthly_index.containing_many(filtered_daily_data.index[[dz[0] for dz in demand_zones]],
+                                                     filtered_daily_data.index[[dz[1] for dz in demand_zones]])
+
+    # Prepare CSV data
+    for zone_number, (dz, status) in enumerate(zip(demand_zones, statuses)):
+        base_candles = dz[2]
+
+        # Find the highest high and lowest low of the base candles
+        highest_high = max(candle.high for candle in base_candles)
+        lowest_low = min(candle.low for candle in base_candles)
+
+        # Define leg-in and leg-out candles
+        legin_candle = filtered_candles[dz[0]]
+        legout_candle = filtered_candles[dz[1]]
+
+        # Map the corresponding monthly demand zone
+        parent = parent_zones[zone_number]
+        higher_timeframe_zone = monthly_demand_zones[parent] if parent >= 0 else None
+
+        if higher_timeframe_zone:
+            higher_legin_candle = monthly_candles[higher_timeframe_zone[0]]
+            higher_legout_candle = monthly_candles[higher_timeframe_zone[1]]
+        else:
+            higher_legin_candle = None
+            higher_legout_candle = None
+
+        csv_data.append({
+            "Symbol": symbol,
+            "Leg-In Time": legin_candle.date,
+            "Leg-Out Time": legout_candle.date,
+            "Zone High": highest_high,
+            "Zone Low": lowest_low,
+            "Status": status,
+            "Higher Timeframe Leg-In Time": higher_legin_candle.date if higher_legin_candle else None,
+            "Higher Timeframe Leg-Out Time": higher_legout_candle.date if higher_legout_candle else None,
+            "Higher Timeframe Zone High": higher_legin_candle.high if higher_legin_candle else None,
+            "Higher Timeframe Zone Low": higher_legout_candle.low if higher_legout_candle else None
+        })
+
+    return csv_data
 
 # Run the application
 if __name__ == "__main__":
@@ -1,8 +1,131 @@
 import customtkinter as ctk
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import tkinter as tk
-from tkinter import ttk
+import zone_engine
+import zone_index
+from ohlc_cache import OHLCCache
+from result_cache import ResultCache, result_key
+from universe_scan import iter_pipeline_scan
+from scan_worker import ScanWorker
+from virtual_table import VirtualTable
+
+# Zones are returned as compact records so the scanner workers send back
+# small arrays instead of DataFrames or tuples
+ZONE_DTYPE = np.dtype([
+    ("date", "datetime64[ns]"),   # First base candle, in exchange local time
+    ("price", np.float64),        # Close of the first base candle
+    ("base_count", np.int64),     # Number of base candles
+    ("tested", np.bool_),         # A later candle traded through a base open or close
+])
+
+# Zone detection lives at module level so the scanner worker processes can run it
+def detect_zones(symbol, data):
+    """
+    Finds demand and supply zones: an exciting candle, 1-3 base candles and
+    another exciting candle whose direction decides demand or supply.
+
+    Returns:
+        Tuple of (demand zones, supply zones) as ZONE_DTYPE arrays.
+    """
+    open_price = data['Open'].to_numpy(dtype=np.float64).ravel()
+    high = data['High'].to_numpy(dtype=np.float64).ravel()
+    low = data['Low'].to_numpy(dtype=np.float64).ravel()
+    close = data['Close'].to_numpy(dtype=np.float64).ravel()
+
+    # Candles without a range are neither exciting nor base
+    with np.errstate(divide='ignore', invalid='ignore'):
+        body_ratio = np.abs(close - open_price) / (high - low)
+    exciting = body_ratio > 0.55
+    base = body_ratio < 0.45
+
+    # Demand and supply zones come out of the same pass
+    zones = zone_engine.detect_supply_demand_zones(open_price, high, low, close, exciting, base, exciting,
+                                                   max_base=3, resume=zone_engine.RESUME_PAST_LEGOUT)
+
+    touch_index = zone_index.TouchIndex(low, high)
+    dates = pd.DatetimeIndex(data.index)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+
+    records = np.empty(len(zones), dtype=ZONE_DTYPE)
+    records['date'] = dates.values[zones['base_start']]
+    records['price'] = close[zones['base_start']]
+    records['base_count'] = zones['base_end'] - zones['base_start']
+    records['tested'] = [zone_prices_touched(open_price, close, z['base_start'], z['base_end'], touch_index)
+                         for z in zones]
+    return records[~zones['is_supply']], records[zones['is_supply']]
+
+def zone_prices_touched(open_price, close, base_start, base_end, touch_index):
+    # Supply and demand zones are both tested once a later candle, starting
+    # with the leg-out, trades through the open or close of any base candle
+    base_prices = set(open_price[base_start:base_end]) | set(close[base_start:base_end])
+    return any(touch_index.is_price_touched(base_end, price) for price in base_prices)
+
+def zone_rows(symbol, zones):
+    # Display rows (symbol, date, price, base candles, tested) for the zone tables
+    return [(symbol, pd.Timestamp(z['date']), float(z['price']), int(z['base_count']), bool(z['tested']))
+            for z in zones]
+
+def is_zone_tested(data, start_index, end_index, is_supply, touch_index=None):
+    # Supply and demand zones are both tested once a later candle trades
+    # through the open or close of any base candle
+    if touch_index is None:
+        touch_index = zone_index.TouchIndex(data['Low'].to_numpy(), data['High'].to_numpy())
+    return zone_prices_touched(data['Open'].to_numpy(), data['Close'].to_numpy(), start_index, end_index + 1, touch_index)
+
+def scan_stock(symbol, store):
+    # Scanner job: runs in a worker process, so it must not touch the GUI
+    return detect_zones(symbol, store.frame(symbol))
+
+def scan_cache_key(symbol, store):
+    # The detector has no settings, so its results only depend on the bars
+    return result_key("dem_zones_updated", store.candles(symbol).fingerprint())
+
+
+class LatestZones:
+    """
+    Latest zone of every symbol, updated as scan results arrive so showing
+    them never walks the full zone lists.
+    """
+    def __init__(self):
+        self.latest = {}
+
+    def clear(self):
+        self.latest.clear()
+
+    def update(self, position, symbol, zones):
+        # zones is the ZONE_DTYPE array of one symbol; the first of equal dates wins
+        if len(zones) == 0:
+            self.latest.pop(symbol, None)
+            return
+        newest = int(np.argmax(zones['date']))
+        self.latest[symbol] = (position, zone_rows(symbol, zones[newest:newest + 1])[0])
+
+    def rows(self):
+        # Display rows in scan order, like the full zone lists
+        return [row for _, row in sorted(self.latest.values(), key=lambda entry: entry[0])]
+
+
+class ZoneTableRows:
+    """
+    Demand rows followed by supply rows, formatted for the table only when
+    a row is shown.
+    """
+    def __init__(self, demand_zones, supply_zones):
+        self.demand_zones = demand_zones
+        self.supply_zones = supply_zones
+
+    def __len__(self):
+        return len(self.demand_zones) + len(self.supply_zones)
+
+    def __getitem__(self, index):
+        if index < len(self.demand_zones):
+            zone, zone_type = self.demand_zones[index], "Demand"
+        else:
+            zone, zone_type = self.supply_zones[index - len(self.demand_zones)], "Supply"
+        return (zone[0], zone_type, zone[1], zone[2], zone[3], "Yes" if zone[4] else "No")
+
 
 class StockApp(ctk.CTk):
     def __init__(self):
@@ -44,6 +167,9 @@ class StockApp(ctk.CTk):
         self.fetch_button = ctk.CTkButton(self, text="Fetch Data", command=self.fetch_data)
         self.fetch_button.pack(pady=10)
         
+        self.cancel_button = ctk.CTkButton(self, text="Cancel Scan", command=self.cancel_scan, state="disabled")
+        self.cancel_button.pack(pady=10)
+        
         self.all_zones_button = ctk.CTkButton(self, text="Display All Zones", command=self.show_all_zones)
         self.all_zones_button.pack(pady=10)
         
@@ -56,96 +182,98 @@ class StockApp(ctk.CTk):
         
         self.all_demand_zones = []
         self.all_supply_zones = []
+        self.latest_demand_zones = LatestZones()
+        self.latest_supply_zones = LatestZones()
+        
+        # Bars are served from disk and only missing ranges are downloaded
+        self.ohlc_cache = OHLCCache()
+        
+        # Symbols whose bars did not change since an earlier scan are not scanned again
+        self.result_cache = ResultCache()
+        
+        # Scans run in the background so the window stays responsive
+        self.scan_worker = ScanWorker(self)
+        self.scan_results = {}
     
     def fetch_data(self):
         period = self.period_entry.get()
         interval = self.interval_entry.get()
         
-        if period and interval:
+        if self.scan_worker.running:
+            self.output_text.insert("end", "A scan is already running.\n")
+        elif period and interval:
             self.all_demand_zones.clear()
             self.all_supply_zones.clear()
+            self.latest_demand_zones.clear()
+            self.latest_supply_zones.clear()
+            self.scan_results = {}
+            symbols = list(self.nifty_50_symbols)
             
-            for symbol in self.nifty_50_symbols:
-                self.output_text.insert("1.0", f"Fetching data for {symbol} with period {period} and interval {interval}...\n")
-                data = yf.download(symbol, period=period, interval=interval)
-                self.output_text.insert("2.0", f"Data fetched for {symbol}\n")
-                
-                demand_zones, supply_zones = self.detect_zones(symbol, data)
-                for zone in demand_zones:
-                    self.all_demand_zones.append((symbol, zone[0], zone[1], zone[2], zone[3]))
-                for zone in supply_zones:
-                    self.all_supply_zones.append((symbol, zone[0], zone[1], zone[2], zone[3]))
+            self.output_text.insert("end", f"Fetching data for {len(symbols)} symbols with period {period} and interval {interval}...\n")
+            
+            def fetch(chunk):
+                return self.ohlc_cache.map_many(chunk, interval=interval, period=period)
+
+            def scan(cancel_event):
+                # Later chunks download while the first ones are scanned
+                return iter_pipeline_scan(symbols, fetch, scan_stock, cancel_event=cancel_event,
+                                          cache=self.result_cache, cache_key=scan_cache_key)
+            
+            self.result_cache.reset_counts()
+            self.fetch_button.configure(state="disabled")
+            self.cancel_button.configure(state="normal")
+            self.scan_worker.start(scan, self.on_symbol_scanned, self.on_scan_done, self.on_scan_error)
         else:
-            self.output_text.insert("1.0", "Please enter valid period and interval.\n")
+            self.output_text.insert("end", "Please enter valid period and interval.\n")
+    
+    def cancel_scan(self):
+        self.scan_worker.cancel()
+        self.output_text.insert("end", "Cancelling scan...\n")
+    
+    def on_symbol_scanned(self, result):
+        # Called on the main thread as each symbol finishes, in completion order
+        position, symbol, (demand_zones, supply_zones) = result
+        self.scan_results[position] = (symbol, demand_zones, supply_zones)
+        self.all_demand_zones.extend(zone_rows(symbol, demand_zones))
+        self.all_supply_zones.extend(zone_rows(symbol, supply_zones))
+        self.latest_demand_zones.update(position, symbol, demand_zones)
+        self.latest_supply_zones.update(position, symbol, supply_zones)
+        self.output_text.insert("end", f"Data fetched for {symbol}: {len(demand_zones)} demand, {len(supply_zones)} supply zones\n")
+        self.output_text.see("end")
+    
+    def on_scan_done(self, cancelled):
+        # Keep the zone lists in symbol order, as a serial scan would produce them
+        self.all_demand_zones.clear()
+        self.all_supply_zones.clear()
+        for position in sorted(self.scan_results):
+            symbol, demand_zones, supply_zones = self.scan_results[position]
+            self.all_demand_zones.extend(zone_rows(symbol, demand_zones))
+            self.all_supply_zones.extend(zone_rows(symbol, supply_zones))
+        
+        self.fetch_button.configure(state="normal")
+        self.cancel_button.configure(state="disabled")
+        self.output_text.insert("end", "Scan cancelled.\n" if cancelled else "Scan completed.\n")
+        self.output_text.insert("end", self.result_cache.summary() + "\n")
+        self.output_text.see("end")
+    
+    def on_scan_error(self, error):
+        self.fetch_button.configure(state="normal")
+        self.cancel_button.configure(state="disabled")
+        self.output_text.insert("end", f"Scan failed: {error}\n")
     
     def detect_zones(self, symbol, data):
-        demand_zones = []
-        supply_zones = []
-        
-        data['Candle_Range'] = data['High'] - data['Low']
-        data['Body_Size'] = abs(data['Close'] - data['Open'])
-        data['Exciting'] = (data['Body_Size'] / data['Candle_Range']) > 0.55
-        data['Base'] = (data['Body_Size'] / data['Candle_Range']) < 0.45
-        
-        print(f"\nProcessing {symbol}...")
-        print(data[['Open', 'High', 'Low', 'Close', 'Exciting', 'Base']].tail(10))
-        
-        i = 0
-        while i < len(data) - 2:
-            if data['Exciting'].iloc[i]:
-                base_count = 0
-                j = i + 1
-                while j < len(data) and base_count < 3 and data['Base'].iloc[j]:
-                    base_count += 1
-                    j += 1
-                if base_count > 0 and j < len(data) and data['Exciting'].iloc[j]:
-                    is_tested = self.is_zone_tested(data, i + 1, j - 1, data['Close'].iloc[j] < data['Open'].iloc[j])
-                    if data['Close'].iloc[j] < data['Open'].iloc[j]:
-                        supply_zones.append((data.index[i + 1], data['Close'].iloc[i + 1], base_count, is_tested))
-                        print(f"Supply Zone Detected: {data.index[i + 1]} | Open: {data['Open'].iloc[i + 1]} | Close: {data['Close'].iloc[i + 1]} | Base Candles: {base_count} | Tested: {is_tested}")
-                    else:
-                        demand_zones.append((data.index[i + 1], data['Close'].iloc[i + 1], base_count, is_tested))
-                        print(f"Demand Zone Detected: {data.index[i + 1]} | Open: {data['Open'].iloc[i + 1]} | Close: {data['Close'].iloc[i + 1]} | Base Candles: {base_count} | Tested: {is_tested}")
-                i = j + 1
-            else:
-                i += 1
-        
-        return demand_zones, supply_zones
+        return detect_zones(symbol, data)
     
-    def is_zone_tested(self, data, start_index, end_index, is_supply):
-        for j in range(end_index + 1, len(data)):
-            for k in range(start_index, end_index + 1):
-                base_open = data['Open'].iloc[k]
-                base_close = data['Close'].iloc[k]
-                if is_supply:
-                    if data['Low'].iloc[j] <= base_open <= data['High'].iloc[j] or data['Low'].iloc[j] <= base_close <= data['High'].iloc[j]:
-                        return True
-                else:
-                    if data['Low'].iloc[j] <= base_open <= data['High'].iloc[j] or data['Low'].iloc[j] <= base_close <= data['High'].iloc[j]:
-                        return True
-        return False
+    def is_zone_tested(self, data, start_index, end_index, is_supply, touch_index=None):
+        return is_zone_tested(data, start_index, end_index, is_supply, touch_index)
     
     def show_all_zones(self):
         self.show_zones_in_table(self.all_demand_zones, self.all_supply_zones)
     
     def show_latest_zones(self):
-        latest_demand_zones = {}
-        latest_supply_zones = {}
-        
-        for zone in self.all_demand_zones:
-            stock = zone[0]
-            date = zone[1]
-            if stock not in latest_demand_zones or date > latest_demand_zones[stock][1]:
-                latest_demand_zones[stock] = zone
-        
-        for zone in self.all_supply_zones:
-            stock = zone[0]
-            date = zone[1]
-            if stock not in latest_supply_zones or date > latest_supply_zones[stock][1]:
-                latest_supply_zones[stock] = zone
-        
-        latest_demand_zones = list(latest_demand_zones.values())
-        latest_supply_zones = list(latest_supply_zones.values())
+        # Maintained by on_symbol_scanned, so nothing is rescanned here
+        latest_demand_zones = self.latest_demand_zones.rows()
+        latest_supply_zones = self.latest_supply_zones.rows()
         
         print("\nLatest Demand Zones:")
         for zone in latest_demand_zones:
@@ -162,19 +290,9 @@ class StockApp(ctk.CTk):
         table_window.title("Detected Zones")
         table_window.geometry("800x600")
         
+        # Only the visible rows are put into the Treeview
         columns = ("Stock", "Type", "Date", "Price", "Base Candles", "Tested")
-        table = ttk.Treeview(table_window, columns=columns, show="headings")
-        
-        for col in columns:
-            table.heading(col, text=col)
-            table.column(col, minwidth=0, width=150)
-        
-        for zone in demand_zones:
-            table.insert("", "end", values=(zone[0], "Demand", zone[1], zone[2], zone[3], "Yes" if zone[4] else "No"))
-        
-        for zone in supply_zones:
-            table.insert("", "end", values=(zone[0], "Supply", zone[1], zone[2], zone[3], "Yes" if zone[4] else "No"))
-        
+        table = VirtualTable(table_window, columns, ZoneTableRows(demand_zones, supply_zones))
         table.pack(fill="both", expand=True)
 
 # Run the application
@@ -1,38 +1,18 @@
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import mplfinance as mpf
 import matplotlib.pyplot as plt
+from candles import CandleSeries
+from ohlc_cache import OHLCCache
+import chart_render
+import zone_engine
+import zone_index
 
 # Fetch historical data for Bank Nifty
 symbol = "^NSEBANK"
-data = yf.download(symbol, start="2023-01-01", end="2024-12-31", interval="1d")
-
-# Convert data to a list of Candle objects
-class Candle:
-    def __init__(self, open_price, high, low, close):
-        self.open_price = open_price
-        self.high = high
-        self.low = low
-        self.close = close
-
-    @property
-    def body_size(self):
-        return abs(self.close - self.open_price)
-
-    @property
-    def candle_range(self):
-        return self.high - self.low
-
-    @property
-    def body_percentage(self):
-        if self.candle_range == 0:
-            return 0
-        return (self.body_size / self.candle_range) * 100
-
-    @property
-    def is_bullish(self):
-        return self.close > self.open_price
+data = OHLCCache().get(symbol, interval="1d", start="2023-01-01", end="2024-12-31")
 
+# The rules take a single candle or a whole CandleSeries, whose body_percentage is an array
 def is_legin_candle(candle):
     return candle.body_percentage > 60
 
@@ -43,59 +23,35 @@ def is_legout_candle(candle):
     return candle.body_percentage > 60
 
 def detect_demand_zones(candles):
-    demand_zones = []
-    i = 0
-    while i < len(candles) - 2:
-        if is_legin_candle(candles[i]):
-            base_candles = []
-            j = i + 1
-            while j < len(candles) and len(base_candles) < 5 and is_base_candle(candles[j]):
-                base_candles.append(candles[j])
-                j += 1
-
-            if j < len(candles) and is_legout_candle(candles[j]):
-                legin_candle = candles[i]
-                legout_candle = candles[j]
-
-                # Check if it's a demand zone
-                if base_candles and (legout_candle.is_bullish and
-                                     legout_candle.close > legin_candle.high and
-                                     legout_candle.close > max(candle.high for candle in base_candles)):
-                    demand_zones.append((i, j, base_candles))  # Store the indices and base candles
-            i = j  # Skip to the next possible pattern after the legout candle
-        else:
-            i += 1
-
-    return demand_zones
-
-def check_zone_tested_and_target(demand_zone, candles, start_index):
-    base_candles = demand_zone[2]
-    highest_high = max(candle.high for candle in base_candles)
-    lowest_low = min(candle.low for candle in base_candles)
-    
-    # Determine the target for a 1:2 risk-reward ratio
+    open_price, high, low, close = zone_engine.ohlc_arrays(candles)
+    zones = zone_engine.detect_demand_zones(open_price, high, low, close,
+                                            is_legin_candle(candles), is_base_candle(candles),
+                                            is_legout_candle(candles), max_base=5)
+    # Store the indices and base candles
+    return [(int(z['legin']), int(z['legout']), candles[z['base_start']:z['base_end']]) for z in zones]
+
+def check_zones_tested_and_target(demand_zones, candles):
+    highest_high = np.array([max(candle.high for candle in dz[2]) for dz in demand_zones], dtype=np.float64)
+    lowest_low = np.array([min(candle.low for candle in dz[2]) for dz in demand_zones], dtype=np.float64)
+
+    # Determine the targets for a 1:2 risk-reward ratio
     risk = highest_high - lowest_low
     target_price = highest_high + 2 * risk
 
-    for k in range(start_index, len(candles)):
-        if candles[k].low <= highest_high and candles[k].high >= lowest_low:
-            # Check if the price hits the 1:2 target after entering the zone
-            for m in range(k, len(candles)):
-                if candles[m].high >= target_price:
-                    return 'pink'  # Zone achieved 1:2 target
-                if candles[m].low < lowest_low:
-                    return 'blue'  # Zone was broken before achieving target
-            break
-    
-    return 'green'  # Zone has not been tested
+    # First touch of each zone, then whichever of target or break comes first,
+    # for all zones in one pass after their leg-out candles
+    _, high, low, _ = zone_engine.ohlc_arrays(candles)
+    statuses = zone_index.zone_statuses(low, high, [dz[1] + 1 for dz in demand_zones],
+                                        lowest_low, highest_high, target_price)
+    # pink: 1:2 target achieved, blue: broken before the target, green: not tested
+    return [chart_render.STATUS_COLORS[status] for status, _, _ in statuses]
 
-# Convert fetched data to Candle objects
-candles = []
-for idx, row in data.iterrows():
-    candles.append(Candle(row['Open'], row['High'], row['Low'], row['Close']))
+# Convert fetched data to a columnar candle series
+candles = CandleSeries.from_dataframe(data)
 
 # Detect demand zones
 demand_zones = detect_demand_zones(candles)
+zone_colors = check_zones_tested_and_target(demand_zones, candles)
 
 # Track the number of fresh and tested zones
 fresh_zones = 0
@@ -111,18 +67,15 @@ fig, ax = mpf.plot(data, type='candle', style='charles',
                    show_nontrading=True,
                    returnfig=True)
 
-# Add horizontal rays for demand zones
-for dz in demand_zones:
+# Add horizontal rays for demand zones, collected into one artist
+ray_starts, ray_highs, ray_lows, ray_colors = [], [], [], []
+for dz, color in zip(demand_zones, zone_colors):
     base_candles = dz[2]
     
     # Find the highest high and lowest low of the base candles
     highest_high = max(candle.high for candle in base_candles)
     lowest_low = min(candle.low for candle in base_candles)
     
-    # Check if the zone has been tested and if it met the 1:2 target
-    start_index = dz[1] + 1  # Start checking after the leg-out candle
-    color = check_zone_tested_and_target(dz, candles, start_index)
-    
     if color == 'green':
         fresh_zones += 1
     elif color == 'blue':
@@ -131,9 +84,12 @@ for dz in demand_zones:
         target_zones += 1
     
     # Add horizontal rays (lines) from these points extending to the right
-    ax[0].hlines(y=highest_high, xmin=data.index[dz[0]], xmax=data.index[-1], color=color, linestyle='--', linewidth=1.5)
-    ax[0].hlines(y=lowest_low, xmin=data.index[dz[0]], xmax=data.index[-1], color=color, linestyle='--', linewidth=1.5)
+    ray_starts.append(data.index[dz[0]])
+    ray_highs.append(highest_high)
+    ray_lows.append(lowest_low)
+    ray_colors.append(color)
 
+chart_render.add_zone_lines(ax[0], ray_starts, data.index[-1], ray_highs, ray_lows, ray_colors)
 plt.show()
 
 # Print the number of fresh, tested, and target zones
@@ -0,0 +1,378 @@
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+# -----------------------------
+# OHLC Fetchers
+# -----------------------------
+#
+# A fetcher turns one request for many symbols into {symbol: DataFrame}.
+# Any object with a matching fetch() method can be plugged into OHLCCache,
+# e.g. a local fake in tests.
+#
+# An empty frame means the provider has no bars for the range. A provider
+# that refuses a request because of its rate limit raises ThrottledError
+# instead, so a throttled symbol is never mistaken for one without data.
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+def normalize_frame(data):
+    """
+    Flattens yfinance (Price, Ticker) columns and keeps the price columns.
+    """
+    if data is None or data.empty:
+        return pd.DataFrame(columns=PRICE_COLUMNS[:4])
+    if isinstance(data.columns, pd.MultiIndex):
+        data = data.droplevel(-1, axis=1)
+    columns = [c for c in PRICE_COLUMNS if c in data.columns]
+    data = data[columns].astype(np.float64)
+    data.index = pd.DatetimeIndex(data.index)
+    return data[~data.index.duplicated(keep='last')].sort_index()
+
+
+def split_multi_ticker(data, symbols):
+    """
+    Splits a multi-ticker yf.download frame into one normalized frame per symbol.
+    Works for both group_by="ticker" and group_by="column" layouts.
+    """
+    frames = {}
+    if data is None or data.empty:
+        return {symbol: normalize_frame(None) for symbol in symbols}
+
+    if not isinstance(data.columns, pd.MultiIndex):
+        # Only a single symbol can come back without a ticker level
+        return {symbols[0]: normalize_frame(data)} if len(symbols) == 1 else {}
+
+    ticker_level = 0 if set(symbols) & set(data.columns.get_level_values(0)) else 1
+    available = set(data.columns.get_level_values(ticker_level))
+    for symbol in symbols:
+        if symbol not in available:
+            frames[symbol] = normalize_frame(None)
+            continue
+        frame = data.xs(symbol, axis=1, level=ticker_level)
+        # Rows only exist for this symbol where another symbol traded
+        frames[symbol] = normalize_frame(frame.dropna(how='all'))
+    return frames
+
+
+class ThrottledError(Exception):
+    """
+    The provider refused (part of) a request because of its rate limit.
+
+    Attributes:
+        symbols: Symbols that were throttled.
+        frames: Frames of the other symbols of the request, which did arrive.
+        retry_after: Seconds the provider asked us to wait, if it said.
+    """
+    def __init__(self, symbols, frames=None, retry_after=None):
+        self.symbols = list(symbols)
+        self.frames = frames or {}
+        self.retry_after = retry_after
+        shown = ", ".join(self.symbols[:5]) + (", ..." if len(self.symbols) > 5 else "")
+        super().__init__(f"The data provider is rate limiting requests; {len(self.symbols)} symbol(s) "
+                         f"could not be fetched ({shown}). Try again later.")
+
+
+def is_throttle_message(message):
+    # yfinance reports throttling as YFRateLimitError or an HTTP 429 in its error text
+    message = str(message).lower()
+    return "rate limit" in message or "too many requests" in message or "429" in message
+
+
+class YFinanceFetcher:
+    """
+    Downloads symbols in multi-ticker yf.download calls of up to group_size symbols.
+    """
+    def __init__(self, group_size=50, threads=True):
+        self.group_size = group_size
+        self.threads = threads
+
+    def fetch(self, symbols, interval, start=None, end=None, period=None):
+        # yfinance is imported here so fetchers can be used offline with a fake
+        import yfinance as yf
+
+        frames = {}
+        throttled = []
+        for offset in range(0, len(symbols), self.group_size):
+            group = list(symbols[offset:offset + self.group_size])
+            kwargs = {"interval": interval, "group_by": "ticker", "threads": self.threads, "progress": False}
+            if period is not None:
+                kwargs["period"] = period
+            else:
+                kwargs["start"] = start
+                kwargs["end"] = end
+            try:
+                data = yf.download(group, **kwargs)
+            except Exception as error:
+                if not is_throttle_message(f"{type(error).__name__} {error}"):
+                    raise
+                throttled.extend(group)
+                continue
+
+            # yf.download reports failed tickers in yf.shared._ERRORS instead of raising
+            errors = getattr(getattr(yf, "shared", None), "_ERRORS", None) or {}
+            group_frames = split_multi_ticker(data, group)
+            for symbol in group:
+                if is_throttle_message(errors.get(symbol.upper(), "")):
+                    group_frames.pop(symbol, None)
+                    throttled.append(symbol)
+            frames.update(group_frames)
+
+        if throttled:
+            raise ThrottledError(throttled, frames)
+        return frames
+
+
+class PerSymbolFetcher:
+    """
+    Adapts a single-symbol downloader with the yf.download signature, such as
+    a stub returning canned frames, to the fetcher interface.
+    """
+    def __init__(self, downloader):
+        self.downloader = downloader
+
+    def fetch(self, symbols, interval, start=None, end=None, period=None):
+        frames = {}
+        for symbol in symbols:
+            kwargs = {"interval": interval}
+            if period is not None:
+                kwargs["period"] = period
+            else:
+                kwargs["start"] = start
+                kwargs["end"] = end
+            frames[symbol] = normalize_frame(self.downloader(symbol, **kwargs))
+        return frames
+
+
+# -----------------------------
+# Fetch Scheduling
+# -----------------------------
+#
+# FetchScheduler wraps any fetcher. It spaces requests with a token bucket
+# (one token per symbol), retries throttled symbols with exponential backoff
+# and jitter, and coalesces identical (symbol, interval, range) requests that
+# are already in flight, so two GUI actions asking for the same bars share one
+# download. Clock, sleep and random source can be swapped for tests, and
+# FakeProvider stands in for the data provider offline.
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens per second up to capacity.
+    """
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        """
+        Takes cost tokens, sleeping until the bucket has refilled enough.
+        Tokens are reserved before sleeping, so waiting callers queue up fairly.
+        Returns the seconds slept.
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (cost - self.tokens) / self.rate)
+            self.tokens -= cost
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+class _Flight:
+    # One in-flight (symbol, interval, range) request that others may wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.frame = None
+        self.error = None
+
+
+class FetchScheduler:
+    """
+    Rate-limited, retrying, coalescing front for a fetcher.
+
+    Args:
+        fetcher: Object with a fetchers-style fetch() method.
+        rate: Symbols requested per second on average.
+        burst: Symbols that may be requested at once after a quiet spell.
+        max_retries: Retries of throttled symbols before ThrottledError is raised.
+        base_delay, max_delay: Backoff before the first retry, and its cap; the
+            delay doubles per retry and a random part of it is skipped (jitter).
+        max_concurrent: Calls to the fetcher running at once. yfinance keeps
+            global state per download, so it must be 1 for YFinanceFetcher.
+    """
+    def __init__(self, fetcher, rate=2.0, burst=50, max_retries=5, base_delay=2.0, max_delay=60.0,
+                 max_concurrent=1, clock=time.monotonic, sleep=time.sleep, rng=None):
+        self.fetcher = fetcher
+        self.bucket = TokenBucket(rate, burst, clock, sleep)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.rng = rng if rng is not None else random.Random()
+        self.slots = threading.Semaphore(max_concurrent)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number attempt (1-based).
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = self.rng.uniform(delay / 2, delay)
+        return max(delay, retry_after or 0.0)
+
+    def fetch(self, symbols, interval, start=None, end=None, period=None):
+        request = (interval, start, end, period)
+        flights = {}
+        own = []
+        with self.lock:
+            for symbol in dict.fromkeys(symbols):
+                flight = self.in_flight.get((symbol,) + request)
+                if flight is None:
+                    flight = self.in_flight[(symbol,) + request] = _Flight()
+                    own.append(symbol)
+                else:
+                    instrument.count("fetch_coalesced")
+                flights[symbol] = flight
+
+        if own:
+            frames = {}
+            error = None
+            try:
+                frames = self._fetch_with_retry(own, interval, start, end, period)
+            except ThrottledError as throttled:
+                frames = throttled.frames
+                error = throttled
+            except BaseException as failure:
+                error = failure
+            finally:
+                with self.lock:
+                    for symbol in own:
+                        flight = self.in_flight.pop((symbol,) + request)
+                        flight.frame = frames.get(symbol)
+                        if flight.frame is None:
+                            flight.error = error
+                        flight.done.set()
+
+        # Coalesced symbols wait for the request that owns them
+        frames = {}
+        throttled = []
+        for symbol, flight in flights.items():
+            flight.done.wait()
+            if isinstance(flight.error, ThrottledError):
+                throttled.append(symbol)
+            elif flight.error is not None:
+                raise flight.error
+            else:
+                frames[symbol] = flight.frame if flight.frame is not None else normalize_frame(None)
+        if throttled:
+            raise ThrottledError(throttled, frames)
+        return frames
+
+    def _fetch_with_retry(self, symbols, interval, start, end, period):
+        frames = {}
+        pending = list(symbols)
+        attempt = 0
+        while True:
+            self.bucket.acquire(len(pending))
+            try:
+                with self.slots:
+                    frames.update(self.fetcher.fetch(pending, interval, start=start, end=end, period=period))
+                return frames
+            except ThrottledError as error:
+                frames.update(error.frames)
+                pending = [symbol for symbol in pending if symbol not in frames]
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise ThrottledError(pending, frames, error.retry_after)
+                instrument.count("fetch_retries")
+                self.sleep(self.backoff(attempt, error.retry_after))
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def default_fetcher():
+    """
+    The process-wide scheduled yfinance fetcher, so every cache shares one rate limit.
+    """
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = FetchScheduler(YFinanceFetcher())
+        return _default_scheduler
+
+
+class FakeProvider:
+    """
+    Offline stand-in for the data provider with latency and 429-style throttling.
+
+    Args:
+        frames: Dict of symbol -> OHLC DataFrame to serve; other symbols have no data.
+        latency: Seconds every call takes.
+        throttle_probability: Chance that each symbol of a call is throttled.
+        max_calls_per_second: Throttles every symbol of a call made while more
+            calls than this arrived in the last second.
+        retry_after: Retry-After seconds reported with throttled symbols.
+    """
+    def __init__(self, frames, latency=0.0, throttle_probability=0.0, max_calls_per_second=None,
+                 retry_after=None, seed=None, clock=time.monotonic, sleep=time.sleep):
+        self.frames = frames
+        self.latency = latency
+        self.throttle_probability = throttle_probability
+        self.max_calls_per_second = max_calls_per_second
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.calls = []
+        self.recent = []
+
+    def fetch(self, symbols, interval, start=None, end=None, period=None):
+        with self.lock:
+            now = self.clock()
+            self.calls.append((list(symbols), interval, start, end, period))
+            self.recent = [t for t in self.recent if now - t < 1.0] + [now]
+            overloaded = self.max_calls_per_second is not None and len(self.recent) > self.max_calls_per_second
+            throttled = [symbol for symbol in symbols
+                         if overloaded or self.rng.random() < self.throttle_probability]
+        if self.latency:
+            self.sleep(self.latency)
+
+        frames = {}
+        for symbol in symbols:
+            if symbol in throttled:
+                continue
+            data = self.frames.get(symbol)
+            if data is None:
+                frames[symbol] = normalize_frame(None)
+                continue
+            index = pd.DatetimeIndex(data.index)
+            mask = np.ones(len(data), dtype=bool)
+            for bound, keep in ((start, index.__ge__), (end, index.__lt__)):
+                if bound is not None:
+                    bound = pd.Timestamp(bound)
+                    if index.tz is not None and bound.tzinfo is None:
+                        bound = bound.tz_localize(index.tz)
+                    elif index.tz is None and bound.tzinfo is not None:
+                        bound = bound.tz_convert(None)
+                    mask &= keep(bound)
+            frames[symbol] = normalize_frame(data[mask])
+        if throttled:
+            raise ThrottledError(throttled, frames, self.retry_after)
+        return frames
@@ -1,48 +1,25 @@
 import customtkinter as ctk
-import yfinance as yf
+import numpy as np
 import pandas as pd
 from tkinter import messagebox
-
-# -----------------------------
-# Candle Class Definition
-# -----------------------------
-
-class Candle:
-    def __init__(self, open_price, high, low, close, date):
-        self.open_price = open_price
-        self.high = high
-        self.low = low
-        self.close = close
-        self.date = date
-
-    @property
-    def body_size(self):
-        return abs(self.close - self.open_price)
-
-    @property
-    def candle_range(self):
-        return self.high - self.low
-
-    @property
-    def body_percentage(self):
-        if self.candle_range == 0:
-            return 0
-        return (self.body_size / self.candle_range) * 100
-
-    @property
-    def is_bullish(self):
-        return self.close > self.open_price
-
-    @property
-    def upper_body(self):
-        return max(self.open_price, self.close)
+from ohlc_cache import OHLCCache
+from universe_scan import iter_pipeline_scan, iter_scan_universe
+from scan_worker import ScanWorker
+from results_store import ResultsStore, make_run_id
+from result_cache import ResultCache, result_key
+from zone_tracker import ZoneTracker
+import instrument
+import param_sweep
+import zone_engine
+import zone_index
 
 # -----------------------------
 # Demand Zone Detection Functions
 # -----------------------------
 
+# The rules take a single candle or a whole CandleSeries, whose body_percentage is an array
 def is_legin_candle(candle, min_body_percent, min_candles):
-    return candle.body_percentage > min_body_percent and min_candles > 0
+    return (candle.body_percentage > min_body_percent) & (min_candles > 0)
 
 def is_base_candle(candle, max_body_percent):
     return candle.body_percentage < max_body_percent
@@ -51,81 +28,141 @@ def is_legout_candle(candle, min_body_percent):
     return candle.body_percentage > min_body_percent
 
 def detect_demand_zones(candles, min_body_percent_legin, max_body_percent_base, min_body_percent_legout, max_base_candles, min_legin_candles, min_legout_candles):
-    demand_zones = []
-    i = 0
-    while i < len(candles) - 2:
-        if is_legin_candle(candles[i], min_body_percent_legin, min_legin_candles):
-            base_candles = []
-            j = i + 1
-            while j < len(candles) and len(base_candles) < max_base_candles and is_base_candle(candles[j], max_body_percent_base):
-                base_candles.append(candles[j])
-                j += 1
-
-            if base_candles:  # Ensure there are base candles before proceeding
-                # Check if the required number of leg-out candles is found
-                legout_candles = []
-                while j < len(candles) and len(legout_candles) < min_legout_candles and is_legout_candle(candles[j], min_body_percent_legout):
-                    legout_candles.append(candles[j])
-                    j += 1
-
-                if len(legout_candles) == min_legout_candles:
-                    legin_candle = candles[i]
-                    legout_candle = legout_candles[-1]  # Last leg-out candle
-
-                    # Determine the upper boundary of the demand zone
-                    upper_body_lowest = min(c.upper_body for c in base_candles)
-                    zone_low = min(candle.low for candle in base_candles)
-
-                    if legout_candle.is_bullish and legout_candle.close > legin_candle.high and legout_candle.close > upper_body_lowest:
-                        demand_zones.append((i, j-1, base_candles, legout_candles, upper_body_lowest, zone_low))
-                else:
-                    j += 1  # Move to the next potential pattern after insufficient leg-out candles
-
-            i = j  # Skip to the end of the current pattern
-        else:
-            i += 1
+    zones, _ = resume_demand_zones(candles, 0, len(candles), min_body_percent_legin, max_body_percent_base,
+                                   min_body_percent_legout, max_base_candles, min_legin_candles, min_legout_candles)
 
+    demand_zones = []
+    for z in zones:
+        base_candles = candles[z['base_start']:z['base_end']]
+        legout_candles = candles[z['base_end']:z['legout'] + 1]
+        demand_zones.append((int(z['legin']), int(z['legout']), base_candles, legout_candles,
+                             float(z['upper_body_low']), float(z['base_low'])))
     return demand_zones
 
-def check_zone_tested_and_target(demand_zone, candles, start_index):
-    upper_body_lowest = demand_zone[4]
-    zone_low = demand_zone[5]
-    
-    risk = upper_body_lowest - zone_low
-    target_price = upper_body_lowest + 2 * risk
-
-    zone_entered = False
-    target_hit = False
-    zone_broken = False
-
-    for k in range(start_index, len(candles)):
-        candle = candles[k]
-        if not zone_entered:
-            if candle.low <= upper_body_lowest and candle.high >= zone_low:
-                zone_entered = True
-        if zone_entered and not target_hit:
-            if candle.high >= target_price:
-                target_hit = True
-                break
-            if candle.low < zone_low:
-                zone_broken = True
-                break
-
-    if zone_entered:
-        if target_hit:
-            return 'pink'
-        elif zone_broken:
-            return 'blue'
+def resume_demand_zones(candles, start, settled, min_body_percent_legin, max_body_percent_base, min_body_percent_legout, max_base_candles, min_legin_candles, min_legout_candles):
+    """
+    Zone records from the start bar on and the restart bar (see zone_engine.resume_demand_zones).
+    """
+    open_price, high, low, close = zone_engine.ohlc_arrays(candles)
+    return zone_engine.resume_demand_zones(
+        start, settled, open_price, high, low, close,
+        is_legin_candle(candles, min_body_percent_legin, min_legin_candles),
+        is_base_candle(candles, max_body_percent_base),
+        is_legout_candle(candles, min_body_percent_legout),
+        max_base=max_base_candles, min_legout=min_legout_candles,
+        resume=zone_engine.RESUME_AFTER_LEGOUT, breakout="upper_body")
+
+ZONE_COLORS = {
+    zone_index.STATUS_TARGET: 'pink',
+    zone_index.STATUS_TESTED: 'blue',
+    zone_index.STATUS_FRESH: 'green',
+}
+
+def zone_levels(zones):
+    """
+    (zone low, zone high, target price) arrays of zone records; the target is twice the zone height above it.
+    """
+    upper_body_lowest = np.asarray(zones['upper_body_low'], dtype=np.float64)
+    zone_low = np.asarray(zones['base_low'], dtype=np.float64)
+    return zone_low, upper_body_lowest, upper_body_lowest + 2 * (upper_body_lowest - zone_low)
+
+def check_zones_tested_and_target(zones, candles):
+    """
+    Statuses of all zone records, settled together in one pass over the candles.
+    """
+    _, high, low, _ = zone_engine.ohlc_arrays(candles)
+    return zone_index.zone_statuses(low, high, zones['legout'] + 1, *zone_levels(zones))
+
+# -----------------------------
+# Per-Stock Analysis
+# -----------------------------
+
+# Zone state of earlier runs, so a rescan only processes the new bars. It only
+# holds the state directory, so every scanner worker can create its own.
+zone_tracker = ZoneTracker()
+
+def analyze_stock(stock, store, params, state_key=None):
+    """
+    Detects and classifies the demand zones of one stock.
+    Runs in the scanner worker processes, so it must not touch the GUI.
+
+    With a state_key, the zones are updated from the state the last run with
+    that key saved (see zone_tracker); the results are the same.
+
+    Returns:
+        Tuple of (summary row, list of zone rows), or None if there is no data.
+    """
+    candles = store.candles(stock)
+    if len(candles) == 0:
+        return None
+
+    statuses = None
+    with instrument.stage("detect"):
+        if state_key is None:
+            zones, _ = resume_demand_zones(candles, 0, len(candles), *params)
         else:
-            return 'green'
-    else:
-        return 'green'
+            detect = lambda start, settled: resume_demand_zones(candles, start, settled, *params)
+            zones, statuses = zone_tracker.update(state_key, stock, candles, detect, zone_levels)
+    instrument.count("bars", len(candles))
+    instrument.count("zones", len(zones))
+
+    fresh_zones = 0
+    tested_zones = 0
+    target_zones = 0
+    zone_details = []
+
+    with instrument.stage("status"):
+        if statuses is None:
+            statuses = check_zones_tested_and_target(zones, candles)
+        colors = [ZONE_COLORS[status] for status, _, _ in statuses]
+        rows = zip(candles.dates[zones['legin']], candles.dates[zones['legout']],
+                   zones['upper_body_low'].tolist(), zones['base_low'].tolist(), colors)
+        for legin_date, legout_date, zone_high, zone_low, color in rows:
+            zone_details.append({
+                "Stock": stock,
+                "Leg-In Date": legin_date,
+                "Leg-Out Date": legout_date,
+                "Zone High (Upper Body Lowest)": zone_high,
+                "Zone Low": zone_low,
+                "Zone Status": "Achieved Target" if color == 'pink' else "Tested" if color == 'blue' else "Fresh",
+            })
+
+            if color == 'green':
+                fresh_zones += 1
+            elif color == 'blue':
+                tested_zones += 1
+            elif color == 'pink':
+                target_zones += 1
+
+    summary = {
+        "Stock": stock,
+        "Fresh Zones (Green)": fresh_zones,
+        "Tested Zones (Blue)": tested_zones,
+        "Target Zones (Pink)": target_zones
+    }
+    return summary, zone_details
 
 # -----------------------------
 # GUI Application
 # -----------------------------
 
-def run_analysis():
+# The bar cache, results store and result cache are created by create_gui(),
+# not on import, so scanner worker processes that import this module do not
+# open the database or build a fetcher.
+RESULTS_SOURCE = "gui_bulk_dz"
+ZONE_COLUMNS = {
+    "Stock": "symbol",
+    "Leg-In Date": "legin_time",
+    "Leg-Out Date": "legout_time",
+    "Zone High (Upper Body Lowest)": "zone_high",
+    "Zone Low": "zone_low",
+    "Zone Status": "status",
+}
+
+# Written when "Save cProfile Dump" is ticked; open it with snakeviz, gprof2dot or flameprof
+PROFILE_FILE = "scan_profile.prof"
+
+def run_analysis(ohlc_cache, results_store, result_cache):
     try:
         start_date = start_date_entry.get()
         end_date = end_date_entry.get()
@@ -136,68 +173,205 @@ def run_analysis():
         max_base_candles = int(max_base_candles_entry.get())
         min_legin_candles = int(min_legin_candles_entry.get())
         min_legout_candles = int(min_legout_candles_entry.get())
+        params = (min_body_percent_legin, max_body_percent_base, min_body_percent_legout,
+                  max_base_candles, min_legin_candles, min_legout_candles)
 
         symbols_df = pd.read_csv('yf_symbols.csv')
         nifty50_stocks = symbols_df['Symbol'].tolist()
-
-        analysis_results = []
-        zone_details = []
-
-        for stock in nifty50_stocks:
-            data = yf.download(stock, start=start_date, end=end_date, interval=interval)
-            if data.empty:
-                print(f"No data fetched for symbol {stock} between {start_date} and {end_date}.")
-                continue
-
-            candles = []
-            for idx, row in data.iterrows():
-                candles.append(Candle(row['Open'], row['High'], row['Low'], row['Close'], idx))
-
-            demand_zones = detect_demand_zones(candles, min_body_percent_legin, max_body_percent_base, min_body_percent_legout, max_base_candles, min_legin_candles, min_legout_candles)
-
-            fresh_zones = 0
-            tested_zones = 0
-            target_zones = 0
-
-            for dz in demand_zones:
-                start_index = dz[1] + 1
-                color = check_zone_tested_and_target(dz, candles, start_index)
-                zone_details.append({
-                    "Stock": stock,
-                    "Leg-In Date": candles[dz[0]].date,
-                    "Leg-Out Date": candles[dz[1]].date,
-                    "Zone High (Upper Body Lowest)": dz[4],
-                    "Zone Low": dz[5],
-                    "Zone Status": "Achieved Target" if color == 'pink' else "Tested" if color == 'blue' else "Fresh",
-                })
-
-                if color == 'green':
-                    fresh_zones += 1
-                elif color == 'blue':
-                    tested_zones += 1
-                elif color == 'pink':
-                    target_zones += 1
-
-            analysis_results.append({
-                "Stock": stock,
-                "Fresh Zones (Green)": fresh_zones,
-                "Tested Zones (Blue)": tested_zones,
-                "Target Zones (Pink)": target_zones
+    except Exception as e:
+        messagebox.showerror("Error", str(e))
+        return
+
+    if scan_worker.running:
+        return
+
+    # Stocks finish in any order; results are keyed by their list position
+    results = {}
+    # Saving the same parameters again replaces the zones of that run
+    run_id = make_run_id(RESULTS_SOURCE, start_date, end_date, interval, *params)
+    scanned = []
+    # Zone state is kept per interval and parameters; the bar digest catches any other change
+    state_key = make_run_id(RESULTS_SOURCE, interval, *params) if incremental_checkbox.get() else None
+
+    def fetch(chunk):
+        # One batched download per chunk for the symbols missing from the cache;
+        # the workers then read the bars from the memory-mapped cache files
+        return ohlc_cache.map_many(chunk, interval=interval, start=start_date, end=end_date)
+
+    def cache_key(stock, store):
+        return result_key(RESULTS_SOURCE, params, store.candles(stock).fingerprint())
+
+    def write(position, stock, result):
+        # Called in list order while later stocks are still downloading or being analysed
+        if result is None:
+            print(f"No data fetched for symbol {stock} between {start_date} and {end_date}.")
+            return
+        _, details = result
+        results_store.save_symbol(run_id, stock, interval, details, ZONE_COLUMNS)
+        scanned.append(stock)
+
+    def scan(cancel_event):
+        # Stocks are analysed in parallel and streamed back as they finish
+        results_store.start_run(run_id, RESULTS_SOURCE, params)
+        return iter_pipeline_scan(nifty50_stocks, fetch, analyze_stock, (params, state_key), write,
+                                  cancel_event=cancel_event, cache=result_cache, cache_key=cache_key)
+
+    def on_result(item):
+        position, stock, result = item
+        results[position] = result
+        if result is None:
+            line = f"{stock}: no data between {start_date} and {end_date}"
+        else:
+            summary, details = result
+            line = f"{stock}: {len(details)} zones, {summary['Fresh Zones (Green)']} fresh"
+        progress_text.insert("end", f"[{len(results)}/{len(nifty50_stocks)}] {line}\n")
+        progress_text.see("end")
+
+    def on_done(cancelled):
+        finish_analysis()
+        progress_text.insert("end", result_cache.summary() + "\n")
+        if cancelled:
+            progress_text.insert("end", f"Analysis cancelled, zones of {len(scanned)} stocks were saved but not exported.\n")
+            report_timings()
+            return
+
+        # The zones were saved while scanning
+        with instrument.stage("save"):
+            # Export the summary analysis results
+            counts = results_store.status_counts(run_id).loc[scanned]
+            analysis_df = pd.DataFrame({
+                "Stock": scanned,
+                "Fresh Zones (Green)": counts.get("Fresh", 0),
+                "Tested Zones (Blue)": counts.get("Tested", 0),
+                "Target Zones (Pink)": counts.get("Achieved Target", 0),
             })
+            analysis_csv_filename = "nifty50_demand_zones_analysis.csv"
+            analysis_df.to_csv(analysis_csv_filename, index=False)
 
-        # Save the summary analysis results
-        analysis_df = pd.DataFrame(analysis_results)
-        analysis_csv_filename = "nifty50_demand_zones_analysis.csv"
-        analysis_df.to_csv(analysis_csv_filename, index=False)
-
-        # Save the detailed zones data
-        zones_df = pd.DataFrame(zone_details)
-        zones_csv_filename = "zones.csv"
-        zones_df.to_csv(zones_csv_filename, index=False)
+            # Export the detailed zones data
+            zones_csv_filename = "zones.csv"
+            results_store.export_csv(zones_csv_filename, ZONE_COLUMNS, run_id=run_id)
+        report_timings()
 
         messagebox.showinfo("Success", f"Analysis saved to {analysis_csv_filename} and zone details saved to {zones_csv_filename}.")
+
+    def on_error(error):
+        finish_analysis()
+        instrument.stop()
+        messagebox.showerror("Error", str(error))
+
+    progress_text.delete("1.0", "end")
+    result_cache.reset_counts()
+    start_analysis()
+    scan_worker.start(instrumented(scan), on_result, on_done, on_error)
+
+def run_sweep(ohlc_cache):
+    # Every parameter field may hold a list or range, e.g. 40,50,60 or 40:60:5
+    try:
+        start_date = start_date_entry.get()
+        end_date = end_date_entry.get()
+        interval = interval_entry.get()
+        grid = param_sweep.sweep_grid(
+            param_sweep.parse_values(min_body_percent_legin_entry.get()),
+            param_sweep.parse_values(max_body_percent_base_entry.get()),
+            param_sweep.parse_values(min_body_percent_legout_entry.get()),
+            param_sweep.parse_values(max_base_candles_entry.get(), int),
+            param_sweep.parse_values(min_legin_candles_entry.get(), int),
+            param_sweep.parse_values(min_legout_candles_entry.get(), int))
+
+        symbols_df = pd.read_csv('yf_symbols.csv')
+        nifty50_stocks = symbols_df['Symbol'].tolist()
     except Exception as e:
         messagebox.showerror("Error", str(e))
+        return
+
+    if scan_worker.running:
+        return
+
+    # Summed fresh/tested/target counts of every combination over the stocks with data
+    totals = np.zeros((len(grid), 3), dtype=np.int64)
+    done = [0]
+    swept = [0]
+
+    def scan(cancel_event):
+        bars = ohlc_cache.map_many(nifty50_stocks, interval=interval, start=start_date, end=end_date)
+        # Each stock evaluates the whole grid against features computed once
+        return iter_scan_universe(nifty50_stocks, bars, param_sweep.sweep_stock, (grid,), cancel_event=cancel_event)
+
+    def on_result(item):
+        _, stock, counts = item
+        done[0] += 1
+        if counts is None:
+            line = f"{stock}: no data between {start_date} and {end_date}"
+        else:
+            totals[:] += counts
+            swept[0] += 1
+            line = f"{stock}: swept {len(grid)} combinations"
+        progress_text.insert("end", f"[{done[0]}/{len(nifty50_stocks)}] {line}\n")
+        progress_text.see("end")
+
+    def on_done(cancelled):
+        finish_analysis()
+        if cancelled:
+            progress_text.insert("end", "Sweep cancelled, nothing was saved.\n")
+            report_timings()
+            return
+        if not swept[0]:
+            progress_text.insert("end", "No stock had data for the sweep, nothing was saved.\n")
+            report_timings()
+            messagebox.showerror("Error", f"No data fetched between {start_date} and {end_date}.")
+            return
+
+        with instrument.stage("save"):
+            sweep_df = param_sweep.summarize(grid, totals)
+            sweep_csv_filename = "parameter_sweep.csv"
+            sweep_df.to_csv(sweep_csv_filename, index=False)
+
+        best = sweep_df.sort_values("Hit Rate %", ascending=False).head(5)
+        progress_text.insert("end", "\nBest hit rates:\n" + best.to_string(index=False) + "\n")
+        progress_text.see("end")
+        report_timings()
+        messagebox.showinfo("Success", f"Sweep of {len(grid)} combinations saved to {sweep_csv_filename}.")
+
+    def on_error(error):
+        finish_analysis()
+        instrument.stop()
+        messagebox.showerror("Error", str(error))
+
+    progress_text.delete("1.0", "end")
+    progress_text.insert("end", f"Sweeping {len(grid)} combinations over {len(nifty50_stocks)} stocks...\n")
+    start_analysis()
+    scan_worker.start(instrumented(scan), on_result, on_done, on_error)
+
+def instrumented(scan):
+    # Records stage timings for the scan when either instrumentation box is ticked
+    if timings_checkbox.get() or profile_checkbox.get():
+        return instrument.record_scan(scan, profile=bool(profile_checkbox.get()))
+    return scan
+
+def report_timings():
+    # Ends the recorded run, if any, and shows where the time went
+    stats = instrument.stop()
+    if stats is None:
+        return
+    progress_text.insert("end", "\nStage timings:\n" + stats.summary() + "\n")
+    if stats.dump_profile(PROFILE_FILE):
+        progress_text.insert("end", f"cProfile data saved to {PROFILE_FILE}.\n")
+    progress_text.see("end")
+
+def cancel_analysis():
+    scan_worker.cancel()
+    progress_text.insert("end", "Cancelling...\n")
+
+def start_analysis():
+    run_button.configure(state="disabled")
+    sweep_button.configure(state="disabled")
+    cancel_button.configure(state="normal")
+
+def finish_analysis():
+    run_button.configure(state="normal")
+    sweep_button.configure(state="normal")
+    cancel_button.configure(state="disabled")
 
 def create_gui():
     ctk.set_appearance_mode("System")  # Modes: "System" (default), "Dark", "Light"
@@ -212,6 +386,8 @@ def create_gui():
     global start_date_entry, end_date_entry, interval_entry, min_body_percent_legin_entry
     global max_body_percent_base_entry, min_body_percent_legout_entry, max_base_candles_entry
     global min_legin_candles_entry, min_legout_candles_entry
+    global run_button, sweep_button, cancel_button, progress_text, scan_worker
+    global timings_checkbox, profile_checkbox, incremental_checkbox
 
     ctk.CTkLabel(frame, text="Start Date (YYYY-MM-DD):").grid(row=0, column=0, sticky="w", padx=10, pady=5)
     start_date_entry = ctk.CTkEntry(frame)
@@ -258,9 +434,42 @@ def create_gui():
     min_legout_candles_entry.insert(0, "1")
     min_legout_candles_entry.grid(row=8, column=1, padx=10, pady=5)
 
-    ctk.CTkButton(frame, text="Run Analysis", command=run_analysis).grid(row=9, column=0, columnspan=2, pady=20)
+    # Re-running the analysis with other parameters reads the bars from disk
+    ohlc_cache = OHLCCache()
+    # Zones are saved to the results store and the CSVs are exported from it
+    results_store = ResultsStore()
+    # Stocks whose bars and parameters were analysed before are not analysed again
+    result_cache = ResultCache()
+
+    run_button = ctk.CTkButton(frame, text="Run Analysis",
+                               command=lambda: run_analysis(ohlc_cache, results_store, result_cache))
+    run_button.grid(row=9, column=0, pady=20)
+    cancel_button = ctk.CTkButton(frame, text="Cancel", command=cancel_analysis, state="disabled")
+    cancel_button.grid(row=9, column=1, pady=20)
+
+    # Sweep mode: parameter fields take lists (40,50,60) or ranges (40:60:5)
+    sweep_button = ctk.CTkButton(frame, text="Run Parameter Sweep", command=lambda: run_sweep(ohlc_cache))
+    sweep_button.grid(row=10, column=0, columnspan=2, pady=5)
+
+    # Stage timings are only recorded when asked for
+    timings_checkbox = ctk.CTkCheckBox(frame, text="Show Stage Timings")
+    timings_checkbox.grid(row=11, column=0, sticky="w", padx=10, pady=5)
+    profile_checkbox = ctk.CTkCheckBox(frame, text="Save cProfile Dump")
+    profile_checkbox.grid(row=11, column=1, sticky="w", padx=10, pady=5)
+
+    # Rescans with the same parameters only process the bars added since the last run
+    incremental_checkbox = ctk.CTkCheckBox(frame, text="Incremental Rescan")
+    incremental_checkbox.select()
+    incremental_checkbox.grid(row=12, column=0, sticky="w", padx=10, pady=5)
+
+    # Per-stock progress while the analysis runs in the background
+    progress_text = ctk.CTkTextbox(frame, width=360, height=150)
+    progress_text.grid(row=13, column=0, columnspan=2, padx=10, pady=5)
+
+    scan_worker = ScanWorker(root)
 
     root.mainloop()
 
-# Run the GUI
-create_gui()
+# Run the GUI; the guard keeps scanner worker processes from opening it
+if __name__ == "__main__":
+    create_gui()
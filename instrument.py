@@ -0,0 +1,228 @@
+import cProfile
+import pstats
+import time
+
+# -----------------------------
+# Scan Instrumentation
+# -----------------------------
+#
+# Per-stage timers and counters for scan runs. Code marks its stages with
+#
+#   with instrument.stage("detect"):
+#       ...
+#   instrument.count("zones", len(zones))
+#
+# and nothing is recorded unless a run was started with instrument.start().
+# While disabled, stage() returns a shared no-op context manager and count()
+# returns at once, so the calls can stay in the hot paths.
+#
+# universe_scan records inside its worker processes when the parent is
+# recording and merges their stages into the parent's run, so stage times are
+# summed over all processes and can exceed the wall time of the scan. Stages
+# may nest; an outer stage includes the time of the stages inside it.
+#
+# start(profile=True) also runs cProfile on the calling thread and in the
+# scanner workers. RunStats.dump_profile() writes the combined pstats file,
+# which snakeviz, gprof2dot or flameprof turn into call graphs and flame graphs.
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("stats", "name", "started")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _ProfileData:
+    # Lets pstats.Stats load raw cProfile stats sent back by a worker process
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class RunStats:
+    """
+    Stage timings and counters of one scan run.
+    """
+    def __init__(self):
+        self.stages = {}      # name -> [seconds, calls]
+        self.counters = {}    # name -> count
+        self.profiles = []    # Raw cProfile stats of this process and the workers
+        self.started = time.perf_counter()
+        self.wall_seconds = None
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds, calls=1):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {"stages": {name: list(entry) for name, entry in self.stages.items()},
+                "counters": dict(self.counters),
+                "profiles": list(self.profiles)}
+
+    def merge(self, data):
+        """
+        Adds the stages, counters and profiles of another run's as_dict().
+        """
+        for name, (seconds, calls) in data["stages"].items():
+            self.add_time(name, seconds, calls)
+        for name, n in data["counters"].items():
+            self.count(name, n)
+        self.profiles.extend(data.get("profiles", ()))
+
+    def summary(self):
+        """
+        Returns the stage timings and counters as text, slowest stage first.
+        """
+        lines = []
+        if self.wall_seconds is not None:
+            lines.append(f"Wall time: {self.wall_seconds:.3f} s")
+        lines.append(f"{'Stage':<20}{'Seconds':>10}{'Calls':>8}")
+        for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{name:<20}{seconds:>10.3f}{calls:>8}")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name}: {n}")
+        return "\n".join(lines)
+
+    def dump_profile(self, path):
+        """
+        Writes the combined cProfile data as a pstats file.
+        Returns the path, or None if the run was not profiled.
+        """
+        if not self.profiles:
+            return None
+        combined = pstats.Stats(_ProfileData(self.profiles[0]))
+        for stats in self.profiles[1:]:
+            combined.add(_ProfileData(stats))
+        combined.dump_stats(path)
+        return path
+
+
+_active = None
+_profiler = None
+
+
+def enabled():
+    return _active is not None
+
+
+def profiling():
+    return _profiler is not None
+
+
+def start(profile=False):
+    """
+    Starts recording a run in this process and returns its RunStats.
+    With profile=True, cProfile runs on the calling thread until stop_profile() or stop().
+    """
+    global _active, _profiler
+    _active = RunStats()
+    if profile:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    return _active
+
+
+def stop_profile():
+    """
+    Stops cProfile and keeps its data in the active run, which goes on recording.
+    Must be called on the thread that called start().
+    """
+    global _profiler
+    if _profiler is None:
+        return
+    _profiler.disable()
+    _profiler.create_stats()
+    if _active is not None:
+        _active.profiles.append(_profiler.stats)
+    _profiler = None
+
+
+def stop():
+    """
+    Stops recording and returns the finished RunStats (None if nothing was recording).
+    """
+    global _active
+    stop_profile()
+    stats = _active
+    _active = None
+    if stats is not None:
+        stats.wall_seconds = time.perf_counter() - stats.started
+    return stats
+
+
+def reset():
+    """
+    Drops a run and profiler inherited from the parent of a forked worker process.
+    """
+    global _active, _profiler
+    if _profiler is not None:
+        _profiler.disable()
+    _active = None
+    _profiler = None
+
+
+def record_scan(scan, profile=False):
+    """
+    Wraps a scan_worker.ScanWorker scan function so a run is recorded on the
+    scan thread. The run stays active after the scan, so the caller can time
+    saving the results before it calls stop().
+    """
+    def recorded(cancel_event):
+        start(profile)
+        try:
+            yield from scan(cancel_event)
+        finally:
+            stop_profile()
+    return recorded
+
+
+def stage(name):
+    """
+    Context manager timing a stage of the active run; a no-op when disabled.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name)
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+def merge(data):
+    if _active is not None and data is not None:
+        _active.merge(data)
@@ -0,0 +1,85 @@
+import numpy as np
+
+# -----------------------------
+# Support / Resistance Level Clustering
+# -----------------------------
+#
+# Groups the prices of local highs or lows into significant levels. Prices
+# are sorted once and cut into clusters greedily from the bottom: a cluster
+# takes every price within the tolerance of its lowest member, and the next
+# cluster starts at the first price beyond it (found with searchsorted), so
+# the work is one sort plus one step per level rather than comparing every
+# price with every kept level.
+
+LEVEL_DTYPE = np.dtype([
+    ("price", np.float64),    # Mean price of the members
+    ("low", np.float64),      # Lowest member
+    ("high", np.float64),     # Highest member
+    ("touches", np.int64),    # Number of extrema in the level
+    ("first", np.int64),      # Earliest position of a member
+    ("last", np.int64),       # Latest position of a member
+])
+
+
+def average_true_range(high, low, close, period=14):
+    """
+    Simple moving average of the true range; NaN until `period` bars exist.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    previous_close = np.append(np.nan, close[:-1])
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous_close), np.abs(low - previous_close)))
+
+    atr = np.full(len(true_range), np.nan)
+    if len(true_range) >= period:
+        total = np.cumsum(true_range)
+        atr[period - 1] = total[period - 1]
+        atr[period:] = total[period:] - total[:-period]
+        atr[period - 1:] /= period
+    return atr
+
+
+def cluster_levels(prices, tolerance=0.005, absolute=None, positions=None, min_touches=1):
+    """
+    Clusters prices into levels.
+
+    Args:
+        prices: Prices of the local extrema.
+        tolerance: Width of a level as a fraction of its lowest price (0.005 = 0.5%).
+        absolute: Width of a level in price units instead, e.g. 0.5 * ATR.
+        positions: Bar positions of the prices (defaults to their order).
+        min_touches: Levels with fewer members are dropped.
+
+    Returns:
+        Structured array with LEVEL_DTYPE fields, sorted by price.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    positions = np.arange(len(prices)) if positions is None else np.asarray(positions, dtype=np.int64)
+    keep = ~np.isnan(prices)
+    prices, positions = prices[keep], positions[keep]
+    if len(prices) == 0:
+        return np.empty(0, dtype=LEVEL_DTYPE)
+
+    order = np.argsort(prices, kind='stable')
+    prices = prices[order]
+    positions = positions[order]
+
+    # Each level starts at the first price beyond the reach of the previous one
+    starts = []
+    start = 0
+    while start < len(prices):
+        starts.append(start)
+        reach = prices[start] + (absolute if absolute is not None else abs(prices[start]) * tolerance)
+        start = max(int(np.searchsorted(prices, reach, side='right')), start + 1)
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.append(starts[1:], len(prices))
+
+    levels = np.empty(len(starts), dtype=LEVEL_DTYPE)
+    levels["touches"] = ends - starts
+    levels["price"] = np.add.reduceat(prices, starts) / levels["touches"]
+    levels["low"] = prices[starts]
+    levels["high"] = prices[ends - 1]
+    levels["first"] = np.minimum.reduceat(positions, starts)
+    levels["last"] = np.maximum.reduceat(positions, starts)
+    return levels[levels["touches"] >= min_touches]
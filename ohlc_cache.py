@@ -0,0 +1,375 @@
+import json
+import os
+import re
+import threading
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from candles import CandleSeries
+from fetchers import default_fetcher, normalize_frame
+import instrument
+
+# -----------------------------
+# On-Disk OHLC Cache
+# -----------------------------
+#
+# Sits in front of the fetchers in fetchers.py. Each (symbol, interval) pair
+# is stored as one .npy file per column plus an int64 timestamp column, so the
+# files can be memory-mapped later. A request only downloads the bars outside the range
+# already on disk; re-running a scan over a cached range never hits the network.
+#
+# The cache doubles as the scanners' bar archive: map_many() brings it up to
+# date and returns a MappedOHLC, which serves date-range slices of the
+# memory-mapped column files. The detectors read those slices in place, and
+# every scanner process maps the same files, so the bars live once in the
+# OS page cache instead of once per DataFrame, candle list and process.
+
+CACHE_DIR = "ohlc_cache"
+
+_PERIOD_PATTERN = re.compile(r"^(\d+)(d|wk|mo|y)$")
+
+
+def period_start(period, now):
+    """
+    Converts a yfinance period string (5d, 6mo, 1y, ytd, max) to a start date.
+    Returns None for "max".
+    """
+    if period is None or period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(year=now.year, month=1, day=1)
+    match = _PERIOD_PATTERN.match(period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == "d":
+        return now - pd.DateOffset(days=count)
+    if unit == "wk":
+        return now - pd.DateOffset(weeks=count)
+    if unit == "mo":
+        return now - pd.DateOffset(months=count)
+    return now - pd.DateOffset(years=count)
+
+
+def _naive(value):
+    # Coverage bounds are compared as naive timestamps
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert(None)
+    return value
+
+
+def _localize(value, index):
+    # Matches a naive bound to the timezone of the cached index
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    if index.tz is not None and value.tzinfo is None:
+        return value.tz_localize(index.tz)
+    if index.tz is None and value.tzinfo is not None:
+        return value.tz_convert(None)
+    return value
+
+
+def _index_from_timestamps(timestamps, meta):
+    # Cached timestamps are int64 ns, UTC for tz-aware indexes
+    index = pd.to_datetime(np.asarray(timestamps), unit='ns', utc=True)
+    index = index.tz_convert(meta['tz']) if meta['tz'] else index.tz_convert(None)
+    index.name = meta.get('index_name')
+    return index
+
+
+class OHLCCache:
+    """
+    Persistent OHLC cache keyed by (symbol, interval).
+
+    Args:
+        cache_dir: Directory holding the cached columns.
+        fetcher: Object with a fetchers-style fetch() method; defaults to batched
+            yfinance downloads behind the shared rate-limited FetchScheduler.
+            Use fetchers.PerSymbolFetcher(stub) or fetchers.FakeProvider in tests.
+        refresh_after: How long an open-ended request ("up to now") is served
+            from disk before the latest bars are topped up.
+        clock: Callable returning the current naive pd.Timestamp.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, fetcher=None,
+                 refresh_after=pd.Timedelta(minutes=15), clock=pd.Timestamp.now):
+        self.cache_dir = cache_dir
+        self.fetcher = fetcher if fetcher is not None else default_fetcher()
+        self.refresh_after = pd.Timedelta(refresh_after)
+        self.clock = clock
+
+    def path(self, symbol, interval):
+        return os.path.join(self.cache_dir, quote(symbol, safe=''), interval)
+
+    def load_meta(self, symbol, interval):
+        """
+        Returns the metadata of a cached pair, or None if not cached.
+        """
+        meta_file = os.path.join(self.path(symbol, interval), "meta.json")
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file) as file:
+            return json.load(file)
+
+    def load(self, symbol, interval, mmap_mode=None):
+        """
+        Returns (frame, meta) for a cached pair, or (None, None) if not cached.
+        With mmap_mode, the frame's columns are views of the memory-mapped files.
+        """
+        meta = self.load_meta(symbol, interval)
+        if meta is None:
+            return None, None
+        timestamps, columns = self.load_columns(symbol, interval, meta, mmap_mode)
+        return pd.DataFrame(columns, index=_index_from_timestamps(timestamps, meta), copy=False), meta
+
+    def load_columns(self, symbol, interval, meta, mmap_mode=None):
+        """
+        Returns (timestamps, dict of column name -> array) of a cached pair.
+        """
+        path = self.path(symbol, interval)
+        timestamps = np.load(os.path.join(path, "timestamp.npy"), mmap_mode=mmap_mode)
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                   for name in meta['columns']}
+        return timestamps, columns
+
+    def save(self, symbol, interval, data, meta):
+        path = self.path(symbol, interval)
+        os.makedirs(path, exist_ok=True)
+
+        index = pd.DatetimeIndex(data.index)
+        meta = dict(meta, columns=list(data.columns), index_name=index.name,
+                    tz=str(index.tz) if index.tz is not None else None)
+        # DatetimeIndex.values is UTC for tz-aware indexes
+        files = {"timestamp": index.values.astype('datetime64[ns]').view(np.int64)}
+        files.update({name: data[name].to_numpy(dtype=np.float64) for name in data.columns})
+
+        # Write every column next to its final name first, then swap them in.
+        # Temporary names are per thread, as two scans may save the same pair.
+        suffix = f".{os.getpid()}-{threading.get_ident()}.tmp"
+        for name, values in files.items():
+            with open(os.path.join(path, f"{name}.npy{suffix}"), "wb") as file:
+                np.save(file, values)
+        for name in files:
+            os.replace(os.path.join(path, f"{name}.npy{suffix}"), os.path.join(path, f"{name}.npy"))
+        with open(os.path.join(path, f"meta.json{suffix}"), "w") as file:
+            json.dump(meta, file)
+        os.replace(os.path.join(path, f"meta.json{suffix}"), os.path.join(path, "meta.json"))
+
+    def get(self, symbol, interval="1d", start=None, end=None, period=None):
+        """
+        Returns the bars for [start, end), or for the trailing period, like yf.download.
+        Only bars outside the cached range are downloaded.
+        """
+        return self.get_many([symbol], interval, start, end, period)[symbol]
+
+    def get_many(self, symbols, interval="1d", start=None, end=None, period=None):
+        """
+        Like get() for many symbols. Symbols missing the same range are downloaded
+        together in one fetcher call.
+
+        Returns:
+            Dict of symbol -> DataFrame, in the order of symbols.
+        """
+        plans = self._download(symbols, interval, start, end, period)
+        with instrument.stage("cache_write"):
+            return {symbol: self._apply(symbol, interval, plans[symbol]) for symbol in symbols}
+
+    def map_many(self, symbols, interval="1d", start=None, end=None, period=None, keys=None):
+        """
+        Like get_many(), but only brings the cache up to date and returns a
+        MappedOHLC serving the requested bars from the memory-mapped cache
+        files. Bars that need no download are never read into memory here.
+
+        Args:
+            keys: Store key of each symbol, e.g. (symbol, interval); defaults to the symbols.
+        """
+        plans = self._download(symbols, interval, start, end, period)
+        with instrument.stage("cache_write"):
+            for symbol in symbols:
+                if plans[symbol]["downloads"]:
+                    self._apply(symbol, interval, plans[symbol])
+        keys = symbols if keys is None else keys
+        return MappedOHLC(self.cache_dir, {key: (symbol, interval, plans[symbol]["req_start"], plans[symbol]["req_end"])
+                                           for key, symbol in zip(keys, symbols)})
+
+    def _download(self, symbols, interval, start, end, period):
+        # Plans every symbol, then fetches the missing ranges in grouped calls
+        now = self.clock()
+        with instrument.stage("cache_read"):
+            plans = {symbol: self._plan(symbol, interval, start, end, period, now) for symbol in symbols}
+
+        requests = {}
+        for symbol, plan in plans.items():
+            for request in plan["downloads"]:
+                requests.setdefault(request, []).append(symbol)
+            instrument.count("cache_misses" if plan["downloads"] else "cache_hits")
+
+        for (req_start, req_end, req_period), group in requests.items():
+            with instrument.stage("download"):
+                frames = self.fetcher.fetch(group, interval, start=req_start, end=req_end, period=req_period)
+            for symbol in group:
+                frame = frames.get(symbol)
+                frame = frame if frame is not None else normalize_frame(None)
+                plans[symbol]["downloaded"][req_start, req_end, req_period] = frame
+        return plans
+
+    def _plan(self, symbol, interval, start, end, period, now):
+        # Works out which ranges are missing from disk for one symbol
+        if start is None and end is None:
+            req_start = period_start(period, now)
+        else:
+            req_start = _naive(start)
+        req_end = _naive(end)
+        # Bars cannot exist past the current time, so coverage stops there
+        wanted_end = min(req_end, now) if req_end is not None else now
+
+        # Only the metadata and the timestamps are read to plan the downloads
+        meta = self.load_meta(symbol, interval)
+        plan = {"cached": meta is not None, "req_start": req_start, "req_end": req_end,
+                "downloads": [], "downloaded": {}}
+        if meta is None:
+            plan["downloads"].append((start, end, period))
+            plan.update(covered_start=req_start, covered_end=wanted_end, fetched_at=now)
+            return plan
+
+        covered_start = _naive(meta["covered_start"])
+        covered_end = _naive(meta["covered_end"])
+        fetched_at = _naive(meta["fetched_at"])
+
+        # Bars before the cached range
+        if covered_start is not None and (req_start is None or req_start < covered_start):
+            plan["downloads"].append((req_start, covered_start, None))
+            covered_start = req_start
+
+        # Bars after the cached range. A range that reached "now" when it was
+        # fetched is trusted for refresh_after before topping it up again.
+        stale = wanted_end > covered_end
+        if stale and covered_end >= fetched_at and now - fetched_at <= self.refresh_after:
+            stale = False
+        if stale:
+            # The last cached bar is fetched again since it may have still been forming
+            timestamps = np.load(os.path.join(self.path(symbol, interval), "timestamp.npy"), mmap_mode='r')
+            top_up_from = _index_from_timestamps(timestamps[-1:], meta)[0] if len(timestamps) else covered_end
+            plan["downloads"].append((top_up_from, req_end, None))
+            covered_end = max(covered_end, wanted_end)
+            fetched_at = now
+
+        plan.update(covered_start=covered_start, covered_end=covered_end, fetched_at=fetched_at)
+        return plan
+
+    def _apply(self, symbol, interval, plan):
+        # Merges the downloaded ranges into the cached bars and saves them
+        data = self.load(symbol, interval)[0] if plan["cached"] else None
+        if not plan["downloads"]:
+            return self._slice(data, plan["req_start"], plan["req_end"])
+
+        pieces = [plan["downloaded"][request] for request in plan["downloads"]]
+        if data is not None:
+            pieces.insert(0, data)
+        pieces = [p for p in pieces if not p.empty]
+        if not pieces:
+            # Nothing on disk and nothing downloaded; don't cache the miss
+            return normalize_frame(None) if data is None else self._slice(data, plan["req_start"], plan["req_end"])
+
+        data = pd.concat(pieces) if len(pieces) > 1 else pieces[0]
+        data = data[~data.index.duplicated(keep='last')].sort_index()
+        self.save(symbol, interval, data, self._meta(plan["covered_start"], plan["covered_end"], plan["fetched_at"]))
+        return self._slice(data, plan["req_start"], plan["req_end"])
+
+    @staticmethod
+    def _meta(covered_start, covered_end, fetched_at):
+        return {
+            "covered_start": covered_start.isoformat() if covered_start is not None else None,
+            "covered_end": covered_end.isoformat(),
+            "fetched_at": fetched_at.isoformat(),
+        }
+
+    @staticmethod
+    def _slice(data, start, end):
+        mask = np.ones(len(data), dtype=bool)
+        if start is not None:
+            mask &= data.index >= _localize(start, data.index)
+        if end is not None:
+            mask &= data.index < _localize(end, data.index)
+        return data[mask]
+
+
+class MappedOHLC:
+    """
+    Scanner store serving date-range slices of cached bars straight from the
+    memory-mapped column files of an OHLCCache.
+
+    Like universe_scan.SharedOHLC it offers candles(key) and frame(key), and
+    worker processes attach to it through spec. Each key maps to
+    (symbol, interval, start, end); the candles and frames it returns are
+    views of the mapped files, so they must not be written to.
+    """
+    def __init__(self, cache_dir, ranges):
+        self.cache_dir = cache_dir
+        self.ranges = ranges
+        self.cache = OHLCCache(cache_dir)
+        self.mapped = {}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(*spec)
+
+    @property
+    def spec(self):
+        return self.cache_dir, self.ranges
+
+    def _columns(self, key):
+        # (meta, timestamps, columns) of the key's bars, mapped on first use
+        if key not in self.mapped:
+            symbol, interval, start, end = self.ranges[key]
+            meta = self.cache.load_meta(symbol, interval)
+            if meta is None:
+                self.mapped[key] = (None, np.empty(0, dtype=np.int64), {})
+            else:
+                timestamps, columns = self.cache.load_columns(symbol, interval, meta, mmap_mode='r')
+                # Rows of [start, end), found by bisecting the sorted timestamps
+                lo, hi = 0, len(timestamps)
+                if start is not None:
+                    lo = int(np.searchsorted(timestamps, self._bound(start, meta), side='left'))
+                if end is not None:
+                    hi = int(np.searchsorted(timestamps, self._bound(end, meta), side='left'))
+                hi = max(lo, hi)
+                self.mapped[key] = (meta, timestamps[lo:hi], {name: values[lo:hi] for name, values in columns.items()})
+        return self.mapped[key]
+
+    @staticmethod
+    def _bound(value, meta):
+        # A date bound as it is stored in the timestamp column
+        value = pd.Timestamp(value)
+        if meta['tz']:
+            value = value.tz_localize(meta['tz']) if value.tzinfo is None else value
+        elif value.tzinfo is not None:
+            value = value.tz_convert(None)
+        return value.value
+
+    def _index(self, key):
+        meta, timestamps, _ = self._columns(key)
+        if meta is None:
+            return pd.DatetimeIndex([])
+        return _index_from_timestamps(timestamps, meta)
+
+    def candles(self, key):
+        _, _, columns = self._columns(key)
+        if not columns:
+            return CandleSeries([], [], [], [], dates=self._index(key))
+        with instrument.stage("candles"):
+            return CandleSeries(columns['Open'], columns['High'], columns['Low'], columns['Close'], dates=self._index(key))
+
+    def frame(self, key):
+        _, _, columns = self._columns(key)
+        if not columns:
+            return normalize_frame(None)
+        return pd.DataFrame(columns, index=self._index(key), copy=False)
+
+    def close(self):
+        self.mapped = {}
@@ -0,0 +1,188 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import zone_engine
+import zone_index
+
+# -----------------------------
+# Parameter Sweep Backtester
+# -----------------------------
+#
+# Evaluates a grid of gui_bulk_dz.py settings in one pass per stock. Body
+# percentages, the run lengths of every threshold and the touch index are
+# computed once per stock; zone outcomes are memoized by the zone's candles,
+# since most settings rediscover the same zones.
+
+PARAM_NAMES = [
+    "Min Leg-In Body %",
+    "Max Base Body %",
+    "Min Leg-Out Body %",
+    "Max Base Candles",
+    "Min Leg-In Candles",
+    "Min Leg-Out Candles",
+]
+
+
+def parse_values(text, cast=float):
+    """
+    Parses a sweep field: "50", "40,50,60" or an inclusive range "40:60:5".
+    """
+    values = []
+    for part in str(text).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            bounds = [cast(p) for p in part.split(":")]
+            if len(bounds) not in (2, 3):
+                raise ValueError(f"Invalid range: {part}")
+            start, stop = bounds[0], bounds[1]
+            step = bounds[2] if len(bounds) == 3 else 1
+            if step <= 0:
+                raise ValueError(f"Invalid range step: {part}")
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            values.extend(cast(start + i * step) for i in range(max(count, 0)))
+        else:
+            values.append(cast(part))
+    if not values:
+        raise ValueError(f"No values in: {text}")
+    return values
+
+
+def sweep_grid(min_body_percent_legin, max_body_percent_base, min_body_percent_legout,
+               max_base_candles, min_legin_candles, min_legout_candles):
+    """
+    Every combination of the given value lists, in gui_bulk_dz parameter order.
+    """
+    return list(itertools.product(min_body_percent_legin, max_body_percent_base, min_body_percent_legout,
+                                  max_base_candles, min_legin_candles, min_legout_candles))
+
+
+class SweepFeatures:
+    """
+    Candle features of one stock shared by every combination of the sweep.
+
+    counts() follows zone_engine.find_patterns with the gui_bulk_dz settings,
+    but walks the leg-in chain over the cached candidate list instead of
+    rebuilding the full jump table for every combination.
+    """
+    def __init__(self, candles):
+        self.open_price, self.high, self.low, self.close = zone_engine.ohlc_arrays(candles)
+        self.n = len(self.close)
+        self.body_pct = zone_engine.body_percentage(self.open_price, self.high, self.low, self.close)
+        self.upper_body = np.maximum(self.open_price, self.close)
+        self.touch_index = zone_index.TouchIndex(self.low, self.high)
+        self.legin_candidates = {}
+        self.base_runs = {}
+        self.legout_runs = {}
+        self.outcomes = {}
+
+    def _candidates(self, threshold):
+        # Leg-in candles that leave room for a base and a leg-out
+        candidates = self.legin_candidates.get(threshold)
+        if candidates is None:
+            candidates = np.flatnonzero(self.body_pct[:max(self.n - 2, 0)] > threshold)
+            self.legin_candidates[threshold] = candidates
+        return candidates
+
+    def _base_run(self, threshold):
+        run = self.base_runs.get(threshold)
+        if run is None:
+            run = self.base_runs[threshold] = np.append(zone_engine.run_lengths(self.body_pct < threshold), 0)
+        return run
+
+    def _legout_run(self, threshold):
+        run = self.legout_runs.get(threshold)
+        if run is None:
+            run = self.legout_runs[threshold] = np.append(zone_engine.run_lengths(self.body_pct > threshold), 0)
+        return run
+
+    def counts(self, params):
+        """
+        Returns (fresh, tested, target) zone counts for one combination,
+        matching gui_bulk_dz.analyze_stock.
+        """
+        (min_body_percent_legin, max_body_percent_base, min_body_percent_legout,
+         max_base_candles, min_legin_candles, min_legout_candles) = params
+        candidates = self._candidates(min_body_percent_legin)
+        if min_legin_candles <= 0 or len(candidates) == 0:
+            return 0, 0, 0
+
+        n_base = np.minimum(self._base_run(max_body_percent_base)[candidates + 1], max_base_candles)
+        base_end = candidates + 1 + n_base
+        n_legout = np.minimum(self._legout_run(min_body_percent_legout)[base_end], min_legout_candles)
+        legout_end = base_end + n_legout
+        complete = n_legout == min_legout_candles
+        resume_at = np.where(n_base == 0, base_end, np.where(complete, legout_end, legout_end + 1))
+
+        # Position of the leg-in candidate the scan continues with after each one
+        following = np.searchsorted(candidates, resume_at).tolist()
+        visited = []
+        k = 0
+        while k < len(following):
+            visited.append(k)
+            k = following[k]
+        visited = np.array(visited, dtype=np.int64)
+        visited = visited[(n_base[visited] >= 1) & complete[visited]]
+
+        fresh = tested = target = 0
+        for key in zip(candidates[visited].tolist(), base_end[visited].tolist(), legout_end[visited].tolist()):
+            status = self.outcomes.get(key, False)
+            if status is False:
+                status = self.outcomes[key] = self._outcome(*key)
+            if status is None:
+                continue
+            if status == zone_index.STATUS_TARGET:
+                target += 1
+            elif status == zone_index.STATUS_TESTED:
+                tested += 1
+            else:
+                fresh += 1
+        return fresh, tested, target
+
+    def _outcome(self, legin, base_end, legout_end):
+        # Status of the zone these candles form, or None if the leg-out does not break out
+        legout = legout_end - 1
+        zone_high = float(self.upper_body[legin + 1:base_end].min())
+        close = self.close[legout]
+        if not (close > self.open_price[legout] and close > self.high[legin] and close > zone_high):
+            return None
+        zone_low = float(self.low[legin + 1:base_end].min())
+        target_price = zone_high + 2 * (zone_high - zone_low)
+        status, _, _ = self.touch_index.zone_status(legout + 1, zone_low, zone_high, target_price)
+        return status
+
+
+def sweep_stock(stock, store, grid):
+    """
+    Scanner job: zone counts of one stock for every combination of the grid.
+
+    Returns:
+        int64 array of shape (len(grid), 3) with fresh, tested and target
+        counts, or None if there is no data.
+    """
+    candles = store.candles(stock)
+    if len(candles) == 0:
+        return None
+    features = SweepFeatures(candles)
+    return np.array([features.counts(params) for params in grid], dtype=np.int64).reshape(len(grid), 3)
+
+
+def summarize(grid, totals):
+    """
+    Builds the result table from the summed counts of every stock.
+    Hit rate is the share of resolved zones (tested or target) that reached the target.
+    """
+    table = pd.DataFrame(grid, columns=PARAM_NAMES)
+    totals = np.asarray(totals, dtype=np.int64).reshape(len(grid), 3)
+    table["Fresh Zones"] = totals[:, 0]
+    table["Tested Zones"] = totals[:, 1]
+    table["Target Zones"] = totals[:, 2]
+    table["Total Zones"] = totals.sum(axis=1)
+    resolved = totals[:, 1] + totals[:, 2]
+    hit_rate = np.full(len(grid), np.nan)
+    np.divide(totals[:, 2] * 100.0, resolved, out=hit_rate, where=resolved > 0)
+    table["Hit Rate %"] = hit_rate.round(2)
+    return table
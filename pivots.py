@@ -0,0 +1,106 @@
+from collections import deque
+
+import numpy as np
+
+# -----------------------------
+# Streaming Pivot Detection
+# -----------------------------
+#
+# A bar is a pivot high when its high equals the highest high of the window
+# centred on it, exactly like comparing High with
+# rolling(window, center=True).max() (pivot lows likewise with the lows).
+# Monotonic deques keep the window maximum and minimum in O(1) amortized time
+# per bar, and a pivot is confirmed as soon as the window's last future bar
+# arrives, so live feeds and stored history go through the same code without
+# copying or modifying a DataFrame.
+
+PIVOT_HIGH = "high"
+PIVOT_LOW = "low"
+
+
+class PivotDetector:
+    """
+    Incremental centred-window pivot detector.
+
+    For window w, the window of bar i spans w // 2 bars before it and
+    (w - 1) // 2 bars after it, matching pandas' centred rolling windows.
+    """
+    def __init__(self, window=20):
+        if window < 1:
+            raise ValueError(f"Window must be positive: {window}")
+        self.window = window
+        self.lag = (window - 1) // 2
+        self.count = 0
+        self.last_nan_high = -window
+        self.last_nan_low = -window
+        self.highs = deque()      # (position, high) with decreasing highs
+        self.lows = deque()       # (position, low) with increasing lows
+        self.recent = deque(maxlen=self.lag + 1)   # (high, low) of the bars awaiting confirmation
+
+    def update(self, high, low):
+        """
+        Adds the next bar.
+
+        Returns:
+            List of (position, kind, price) pivots confirmed by this bar.
+        """
+        t = self.count
+        self.count += 1
+        high = float(high)
+        low = float(low)
+        self.recent.append((high, low))
+
+        # pandas yields NaN for any window containing a missing value
+        if np.isnan(high):
+            self.last_nan_high = t
+        else:
+            while self.highs and self.highs[-1][1] <= high:
+                self.highs.pop()
+            self.highs.append((t, high))
+        if np.isnan(low):
+            self.last_nan_low = t
+        else:
+            while self.lows and self.lows[-1][1] >= low:
+                self.lows.pop()
+            self.lows.append((t, low))
+
+        start = t - self.window + 1
+        while self.highs and self.highs[0][0] < start:
+            self.highs.popleft()
+        while self.lows and self.lows[0][0] < start:
+            self.lows.popleft()
+
+        if start < 0:
+            return []
+
+        # The centre bar of the window ending here is now confirmed
+        center = t - self.lag
+        center_high, center_low = self.recent[0]
+        confirmed = []
+        if self.last_nan_high < start and center_high == self.highs[0][1]:
+            confirmed.append((center, PIVOT_HIGH, center_high))
+        if self.last_nan_low < start and center_low == self.lows[0][1]:
+            confirmed.append((center, PIVOT_LOW, center_low))
+        return confirmed
+
+
+def iter_pivots(high, low, window=20):
+    """
+    Yields (position, kind, price) for every pivot as it is confirmed.
+
+    high and low can be any iterables, e.g. DataFrame columns or a live feed.
+    """
+    detector = PivotDetector(window)
+    for bar_high, bar_low in zip(high, low):
+        yield from detector.update(bar_high, bar_low)
+
+
+def find_pivots(high, low, window=20):
+    """
+    Returns (pivot high positions, pivot low positions) as integer arrays.
+    """
+    highs = []
+    lows = []
+    for position, kind, _ in iter_pivots(high, low, window):
+        (highs if kind == PIVOT_HIGH else lows).append(position)
+    return np.array(highs, dtype=np.int64), np.array(lows, dtype=np.int64)
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------
+# Local OHLC Resampling
+# -----------------------------
+#
+# Builds higher timeframe bars from the finest cached bars instead of
+# downloading every interval separately, so all timeframes of a symbol come
+# from the same data. Calendar rules label a bar with its period start like
+# yfinance does ("1wk" on Monday, "1mo" on the 1st, "3mo" on the quarter
+# start); an integer rule groups every N base bars.
+#
+# Buckets are found from the sorted index in one pass and aggregated with
+# ufunc.reduceat, so no groupby or Python loop runs over the bars.
+
+CALENDAR_RULES = ("1wk", "1mo", "3mo")
+_PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+
+def bucket_labels(index, rule):
+    """
+    Start of the calendar period every timestamp falls into, in the index's timezone.
+    """
+    index = pd.DatetimeIndex(index)
+    # Periods follow the exchange's local calendar
+    wall = index.tz_localize(None) if index.tz is not None else index
+    days = wall.values.astype('datetime64[D]')
+    if rule == "1wk":
+        # 1970-01-01 was a Thursday
+        weekday = (days.view(np.int64) + 3) % 7
+        labels = days - weekday.astype('timedelta64[D]')
+    elif rule == "1mo":
+        labels = days.astype('datetime64[M]').astype('datetime64[D]')
+    elif rule == "3mo":
+        months = days.astype('datetime64[M]').view(np.int64)
+        labels = (months - months % 3).astype('datetime64[M]').astype('datetime64[D]')
+    else:
+        raise ValueError(f"Unsupported resample rule: {rule}")
+
+    labels = pd.DatetimeIndex(labels.astype('datetime64[ns]'), name=index.name)
+    if index.tz is not None:
+        labels = labels.tz_localize(index.tz, ambiguous=True, nonexistent="shift_forward")
+    return labels
+
+
+def _buckets(index, rule):
+    # Returns (positions where each bucket starts, bucket labels)
+    if isinstance(rule, (int, np.integer)):
+        if rule < 1:
+            raise ValueError(f"Bar count must be positive: {rule}")
+        starts = np.arange(0, len(index), rule)
+        return starts, index[starts]
+    labels = bucket_labels(index, rule)
+    values = labels.values
+    starts = np.flatnonzero(np.append(True, values[1:] != values[:-1]))
+    return starts, labels[starts]
+
+
+def resample_ohlc(data, rule):
+    """
+    Aggregates sorted OHLC bars into higher timeframe bars.
+
+    Args:
+        data: DataFrame with Open/High/Low/Close (and optionally Adj Close, Volume).
+        rule: "1wk", "1mo", "3mo", or an integer number of base bars.
+    """
+    columns = [c for c in _PRICE_COLUMNS if c in data.columns]
+    data = data.dropna(subset=columns)
+    if data.empty:
+        return data.copy()
+
+    starts, labels = _buckets(pd.DatetimeIndex(data.index), rule)
+    ends = np.append(starts[1:], len(data)) - 1
+
+    result = {}
+    for name in data.columns:
+        values = data[name].to_numpy(dtype=np.float64)
+        if name == 'Open':
+            result[name] = values[starts]
+        elif name == 'High':
+            result[name] = np.maximum.reduceat(values, starts)
+        elif name == 'Low':
+            result[name] = np.minimum.reduceat(values, starts)
+        elif name == 'Volume':
+            result[name] = np.add.reduceat(np.nan_to_num(values), starts)
+        else:
+            # Close, Adj Close and anything else take the last bar
+            result[name] = values[ends]
+    return pd.DataFrame(result, index=labels, columns=data.columns)
+
+
+class IncrementalResampler:
+    """
+    Keeps higher timeframe bars up to date as base bars arrive.
+
+    Only the base bars of the last, still forming, higher timeframe bar are
+    kept, so every update costs time proportional to that bar plus the new
+    base bars rather than the whole history.
+    """
+    def __init__(self, rule):
+        self.rule = rule
+        self.completed = []   # Frames of higher timeframe bars that can no longer change
+        self.forming = None   # The last higher timeframe bar
+        self.tail = None      # Base bars of the last higher timeframe bar
+
+    def update(self, base_bars):
+        """
+        Adds new base bars. Bars may revise the latest ones already seen, but
+        must not start before the last higher timeframe bar.
+
+        Returns:
+            DataFrame of the higher timeframe bars completed by this update.
+        """
+        base_bars = base_bars.dropna(subset=[c for c in _PRICE_COLUMNS if c in base_bars.columns]).sort_index()
+        base_bars = base_bars[~base_bars.index.duplicated(keep='last')]
+        if base_bars.empty:
+            return base_bars.iloc[0:0]
+
+        if self.tail is not None:
+            if base_bars.index[0] < self.tail.index[0]:
+                raise ValueError("Base bars before the last higher timeframe bar need a full resample")
+            base_bars = pd.concat([self.tail[self.tail.index < base_bars.index[0]], base_bars])
+
+        bars = resample_ohlc(base_bars, self.rule)
+        if bars.empty:
+            return bars
+        starts, _ = _buckets(pd.DatetimeIndex(base_bars.index), self.rule)
+        self.tail = base_bars.iloc[starts[-1]:]
+
+        # Every bar but the last is final now
+        done = bars.iloc[:-1]
+        if len(done):
+            self.completed.append(done)
+        self.forming = bars.iloc[-1:]
+        return done
+
+    @property
+    def bars(self):
+        """
+        All higher timeframe bars, including the one still forming.
+        """
+        if self.forming is None:
+            return pd.DataFrame(columns=_PRICE_COLUMNS)
+        if len(self.completed) > 1:
+            self.completed = [pd.concat(self.completed)]
+        return pd.concat(self.completed + [self.forming])
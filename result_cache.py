@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import instrument
+
+# -----------------------------
+# Memoized Scan Results
+# -----------------------------
+#
+# Re-running a scan with the same settings, or flipping back to settings used
+# a few clicks ago, used to recompute every symbol. ResultCache remembers the
+# result of a scanner job under a key made of the data fingerprint of the
+# symbol's bars (CandleSeries.fingerprint) and the full parameter tuple, so a
+# job whose bars and parameters have not changed is answered from the cache.
+#
+# Two levels: an in-process LRU that returns the result object itself, and
+# a directory of pickles that survives restarts. Both are bounded by size in
+# bytes (the pickled size of the results); the LRU drops its least recently
+# used entries and the disk level its least recently read files.
+#
+# Keys include RESULT_VERSION. Bump it when a detector changes what it
+# returns, so results of the old code are never served.
+
+RESULT_CACHE_DIR = "result_cache"
+RESULT_VERSION = 1
+
+
+def result_key(*parts):
+    """
+    Cache key for the parts of a job's inputs, e.g. source, fingerprint and parameters.
+    """
+    key = json.dumps([RESULT_VERSION, list(parts)], default=str)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-level cache of scanner job results.
+
+    Args:
+        cache_dir: Directory of the pickled results; None keeps results in memory only.
+        memory_bytes: Size budget of the in-process LRU.
+        disk_bytes: Size budget of the result files.
+    """
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, memory_bytes=64 * 2 ** 20, disk_bytes=512 * 2 ** 20):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()   # key -> (result, pickled size)
+        self.memory_used = 0
+        self.disk_used = None         # Summed on the first write
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def get(self, key):
+        """
+        Returns (True, result) on a hit and (False, None) on a miss.
+        """
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                instrument.count("result_cache_hits")
+                return True, entry[0]
+
+        data = None
+        if self.cache_dir is not None:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                # The modification time orders the files for eviction
+                os.utime(path)
+                result = pickle.loads(data)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                data = None
+
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                instrument.count("result_cache_misses")
+                return False, None
+            self.hits += 1
+            instrument.count("result_cache_hits")
+            self._remember(key, result, len(data))
+            return True, result
+
+    def put(self, key, result):
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self._remember(key, result, len(data))
+            if self.cache_dir is None:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            if self.disk_used is None:
+                self.disk_used = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                                     if entry.name.endswith(".pkl"))
+            if os.path.exists(path):
+                self.disk_used -= os.path.getsize(path)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+            self.disk_used += len(data)
+            if self.disk_used > self.disk_bytes:
+                self._evict_files()
+
+    def _remember(self, key, result, size):
+        # Results larger than the whole budget are only kept on disk
+        if key in self.memory:
+            self.memory_used -= self.memory.pop(key)[1]
+        if size > self.memory_bytes:
+            return
+        self.memory[key] = (result, size)
+        self.memory_used += size
+        while self.memory_used > self.memory_bytes:
+            _, (_, dropped) = self.memory.popitem(last=False)
+            self.memory_used -= dropped
+
+    def _evict_files(self):
+        # Oldest files first, down to 90% of the budget so the next writes do not rescan
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        self.disk_used = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.disk_used <= 0.9 * self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.disk_used -= size
+
+    def reset_counts(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+    def summary(self):
+        """
+        Hit and miss counts since the last reset_counts(), as text for the GUIs.
+        """
+        return f"Result cache: {self.hits} hits, {self.misses} misses"
+
+    def clear(self):
+        """
+        Drops every cached result, in memory and on disk.
+        """
+        with self.lock:
+            self.memory.clear()
+            self.memory_used = 0
+            self.disk_used = None
+            if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+                return
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".pkl"):
+                    os.remove(entry.path)
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import sqlite3
+
+import pandas as pd
+
+# -----------------------------
+# Zone Results Store
+# -----------------------------
+#
+# Keeps the zones found by the scanners in one SQLite file instead of CSVs
+# that are appended to or overwritten on every run. A zone is keyed by
+# (run id, symbol, timeframe, leg-in time), so saving the same scan again
+# updates its rows in place rather than duplicating them, and indexed queries
+# such as zones_near() never re-parse the whole history. The CSV files
+# the GUIs used to write are now exported from the store by export_csv().
+#
+# A run id names one scanner configuration (see make_run_id), so repeated
+# scans with the same parameters and dates land in the same run.
+
+RESULTS_DB = "zone_results.sqlite"
+
+ZONE_FIELDS = [
+    "symbol", "timeframe", "legin_time", "legout_time", "zone_high", "zone_low", "status",
+    "htf_legin_time", "htf_legout_time", "htf_zone_high", "htf_zone_low",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    params TEXT,
+    created TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scanned (
+    run_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    PRIMARY KEY (run_id, symbol, timeframe)
+);
+CREATE TABLE IF NOT EXISTS zones (
+    run_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    legin_time TEXT NOT NULL,
+    legout_time TEXT,
+    zone_high REAL,
+    zone_low REAL,
+    status TEXT,
+    htf_legin_time TEXT,
+    htf_legout_time TEXT,
+    htf_zone_high REAL,
+    htf_zone_low REAL,
+    PRIMARY KEY (run_id, symbol, timeframe, legin_time)
+);
+CREATE INDEX IF NOT EXISTS zones_by_status ON zones (run_id, status, symbol, zone_low);
+"""
+
+TIME_FIELDS = ["legin_time", "legout_time", "htf_legin_time", "htf_legout_time"]
+
+
+def make_run_id(source, *params):
+    """
+    Stable run id for a scanner (source) and its parameters, e.g. thresholds and dates.
+    """
+    key = json.dumps([source, list(params)], default=str)
+    return f"{source}-{hashlib.sha1(key.encode()).hexdigest()[:12]}"
+
+
+def _value(value):
+    # Timestamps are stored as text exactly as the CSVs printed them
+    if value is None:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return str(value)
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _time_column(values):
+    # Parsed back to datetimes, so to_csv prints them as it did for the scan's
+    # own DataFrames: dates alone when every time is midnight
+    try:
+        return pd.to_datetime(values)
+    except (ValueError, TypeError):
+        # Mixed time zones or text such as "N/A" are written as stored
+        return values
+
+
+class ResultsStore:
+    """
+    SQLite-backed store of zone results.
+
+    Args:
+        path: Database file, created on first use.
+    """
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        # Scans save from their background thread, one thread at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, run_id, source, params=None):
+        """
+        Registers a run, or marks an existing one as updated.
+        """
+        now = str(pd.Timestamp.now())
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO runs (run_id, source, params, created, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id) DO UPDATE SET updated = excluded.updated",
+                (run_id, source, json.dumps(params, default=str), now, now))
+        return run_id
+
+    def latest_run(self, source=None):
+        """
+        Returns the most recently updated run id (of a source), or None.
+        """
+        query = "SELECT run_id FROM runs"
+        args = ()
+        if source is not None:
+            query += " WHERE source = ?"
+            args = (source,)
+        row = self.conn.execute(query + " ORDER BY updated DESC LIMIT 1", args).fetchone()
+        return row[0] if row else None
+
+    def save_symbol(self, run_id, symbol, timeframe, rows, columns=None):
+        """
+        Saves the zones of one symbol in a run.
+
+        Zones are upserted on their leg-in time, and zones from an earlier save
+        of the same symbol that are no longer found are removed, so saving the
+        same scan twice leaves the store unchanged.
+
+        Args:
+            rows: Dicts with ZONE_FIELDS keys, or keys renamed by columns.
+            columns: Dict of row key -> zone field, e.g. {"Leg-In Date": "legin_time"}.
+        """
+        records = []
+        for row in rows:
+            if columns is not None:
+                row = {columns[key]: value for key, value in row.items() if key in columns}
+            record = dict(row, symbol=symbol, timeframe=timeframe)
+            records.append((run_id,) + tuple(_value(record.get(field)) for field in ZONE_FIELDS))
+
+        placeholders = ", ".join("?" * (len(ZONE_FIELDS) + 1))
+        updates = ", ".join(f"{field} = excluded.{field}" for field in ZONE_FIELDS[3:])
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO scanned (run_id, symbol, timeframe, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (run_id, symbol, timeframe) DO UPDATE SET updated = excluded.updated",
+                (run_id, symbol, timeframe, str(pd.Timestamp.now())))
+            self.conn.executemany(
+                f"INSERT INTO zones (run_id, {', '.join(ZONE_FIELDS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT (run_id, symbol, timeframe, legin_time) DO UPDATE SET {updates}",
+                records)
+            legin_times = [record[3] for record in records]
+            self.conn.execute(
+                "DELETE FROM zones WHERE run_id = ? AND symbol = ? AND timeframe = ? "
+                f"AND legin_time NOT IN ({', '.join('?' * len(legin_times))})",
+                [run_id, symbol, timeframe] + legin_times)
+        return len(records)
+
+    def zones(self, run_id=None, source=None, symbol=None, status=None):
+        """
+        Returns the stored zones as a DataFrame with run_id and ZONE_FIELDS columns,
+        symbol by symbol in the order the symbols were first scanned, and by
+        leg-in time within a symbol. Re-saving a scan keeps that order, so it
+        matches a fresh scan of the same data.
+        """
+        query = (f"SELECT zones.run_id, {', '.join('zones.' + field for field in ZONE_FIELDS)} FROM zones "
+                 "JOIN scanned ON scanned.run_id = zones.run_id AND scanned.symbol = zones.symbol "
+                 "AND scanned.timeframe = zones.timeframe")
+        conditions = []
+        args = []
+        if source is not None:
+            query += " JOIN runs ON runs.run_id = zones.run_id"
+            conditions.append("runs.source = ?")
+            args.append(source)
+        for field, value in (("run_id", run_id), ("symbol", symbol), ("status", status)):
+            if value is not None:
+                conditions.append(f"zones.{field} = ?")
+                args.append(value)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return pd.read_sql_query(query + " ORDER BY scanned.rowid, zones.legin_time", self.conn, params=args)
+
+    def status_counts(self, run_id):
+        """
+        Number of zones per status for every symbol scanned in a run, including
+        symbols without zones, in the order they were first scanned.
+
+        Returns:
+            DataFrame indexed by symbol with one column per status.
+        """
+        symbols = [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT symbol FROM scanned WHERE run_id = ? ORDER BY rowid", (run_id,))]
+        counts = pd.read_sql_query(
+            "SELECT symbol, status, COUNT(*) AS zones FROM zones WHERE run_id = ? GROUP BY symbol, status",
+            self.conn, params=(run_id,))
+        table = counts.pivot(index="symbol", columns="status", values="zones")
+        return table.reindex(symbols).fillna(0).astype(int)
+
+    def zones_near(self, prices, percent=2.0, run_id=None, status="Fresh"):
+        """
+        Zones of a status whose range lies within `percent` of the current price.
+
+        Args:
+            prices: Dict of symbol -> current price.
+            run_id: Run to search; defaults to the latest run.
+
+        Returns:
+            DataFrame of the matching zones with the price and its distance to the
+            zone in percent (0 when the price is inside the zone).
+        """
+        if run_id is None:
+            run_id = self.latest_run()
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS prices (symbol TEXT PRIMARY KEY, price REAL)")
+            self.conn.execute("DELETE FROM prices")
+            self.conn.executemany("INSERT INTO prices VALUES (?, ?)",
+                                  [(symbol, float(price)) for symbol, price in prices.items()])
+        fraction = percent / 100.0
+        near = pd.read_sql_query(
+            f"SELECT zones.run_id, {', '.join('zones.' + field for field in ZONE_FIELDS)}, prices.price, "
+            "MAX(zones.zone_low - prices.price, prices.price - zones.zone_high, 0) * 100.0 / prices.price "
+            "AS distance_percent "
+            "FROM prices JOIN zones ON zones.symbol = prices.symbol "
+            "WHERE zones.run_id = ? AND zones.status = ? "
+            "AND zones.zone_low <= prices.price * (1 + ?) AND zones.zone_high >= prices.price * (1 - ?) "
+            "ORDER BY distance_percent",
+            self.conn, params=(run_id, status, fraction, fraction))
+        return near
+
+    def export_csv(self, path, columns, run_id=None, source=None, na_rep=""):
+        """
+        Writes the zones of a run (or of every run of a source) to a CSV file.
+
+        Args:
+            columns: Dict of CSV header -> zone field, in output order.
+        """
+        data = self.zones(run_id=run_id, source=source)
+        data = data[list(columns.values())]
+        for field in TIME_FIELDS:
+            if field in data:
+                data[field] = _time_column(data[field])
+        data.columns = list(columns)
+        data.to_csv(path, index=False, na_rep=na_rep)
+        return path
@@ -0,0 +1,91 @@
+import queue
+import threading
+
+# -----------------------------
+# Background Scan Worker
+# -----------------------------
+#
+# Tk widgets may only be touched from the main thread. ScanWorker runs a scan
+# on a background thread, passes every result through a thread-safe queue and
+# drains that queue from the Tk event loop with after(), so the window stays
+# responsive and results show up as each symbol finishes.
+
+
+class ScanWorker:
+    """
+    Runs one scan at a time in the background for a Tk/customtkinter window.
+
+    Args:
+        widget: Any Tk widget; its after() schedules the queue polling.
+        poll_ms: How often the queue is drained while a scan is running.
+    """
+    def __init__(self, widget, poll_ms=100):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self.results = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.on_result = None
+        self.on_done = None
+        self.on_error = None
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, scan, on_result, on_done, on_error=None):
+        """
+        Starts scan(cancel_event) on a background thread.
+
+        scan must return an iterable of results and should stop early once
+        cancel_event is set. on_result(result) is called on the main thread for
+        every result, then on_done(cancelled) or on_error(exception) once.
+        """
+        if self.running:
+            return False
+        self.cancel_event = threading.Event()
+        self.results = queue.Queue()
+        self.on_result = on_result
+        self.on_done = on_done
+        self.on_error = on_error
+        self.thread = threading.Thread(target=self._run, args=(scan, self.cancel_event, self.results), daemon=True)
+        self.thread.start()
+        self.widget.after(self.poll_ms, self._poll)
+        return True
+
+    def cancel(self):
+        """
+        Stops the running scan after the symbols already in progress.
+        """
+        self.cancel_event.set()
+
+    @staticmethod
+    def _run(scan, cancel_event, results):
+        try:
+            for result in scan(cancel_event):
+                results.put(("result", result))
+                if cancel_event.is_set():
+                    break
+            results.put(("done", cancel_event.is_set()))
+        except Exception as e:
+            results.put(("error", e))
+
+    def _poll(self):
+        while True:
+            try:
+                kind, payload = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "result":
+                self.on_result(payload)
+                continue
+
+            self.thread = None
+            if kind == "done":
+                self.on_done(payload)
+            elif self.on_error is not None:
+                self.on_error(payload)
+            return
+
+        self.widget.after(self.poll_ms, self._poll)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------
+# Timeframe Alignment
+# -----------------------------
+#
+# Lines up zones found on a higher timeframe with the bars of a lower one
+# (1mo -> 1d, 1wk -> 1h, 1d -> 15m, ...). Everything works on timestamps, so
+# any pair of intervals can be combined:
+#   - slice_windows() cuts the lower timeframe to the higher timeframe zones
+#     with one searchsorted per window edge and a single positional take,
+#     instead of concatenating one .loc slice per zone.
+#   - ZoneIntervalIndex finds the higher timeframe zone containing a lower
+#     timeframe zone with two binary searches instead of a linear scan.
+
+
+def _nanos(timestamps):
+    # DatetimeIndex.values is UTC for tz-aware indexes
+    return pd.DatetimeIndex(timestamps).values.astype('datetime64[ns]').view(np.int64)
+
+
+def window_positions(index, starts, ends):
+    """
+    Row positions of a sorted DatetimeIndex inside each [start, end] window.
+
+    Windows are returned back to back in the order given, so rows falling in
+    two overlapping windows appear twice, exactly like concatenating
+    data.loc[start:end] for every window.
+    """
+    index = pd.DatetimeIndex(index)
+    left = index.searchsorted(pd.DatetimeIndex(starts), side='left')
+    right = index.searchsorted(pd.DatetimeIndex(ends), side='right')
+    lengths = np.maximum(right - left, 0)
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=np.int64)
+    # Each window continues from its own left edge where the previous one ended
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(left - offsets, lengths) + np.arange(lengths.sum())
+
+
+def slice_windows(data, starts, ends):
+    """
+    Returns the rows of data inside each [start, end] window, in window order.
+    """
+    return data.iloc[window_positions(data.index, starts, ends)]
+
+
+class ZoneIntervalIndex:
+    """
+    Containment lookups over higher timeframe zones spanning [start, end].
+
+    Zones are ordered by start. The running maximum of their ends is
+    non-decreasing, so the first zone reaching past a query end is found by
+    bisection; it contains the query if it also starts at or before it.
+    """
+    def __init__(self, starts, ends):
+        starts = _nanos(starts)
+        ends = _nanos(ends)
+        self.order = np.argsort(starts, kind='stable')
+        self.starts = starts[self.order]
+        self.reach = np.maximum.accumulate(ends[self.order]) if len(ends) else ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def containing_many(self, starts, ends):
+        """
+        For every [start, end] returns the position (in the order the zones
+        were given) of the earliest-starting zone containing it, or -1.
+        """
+        starts = _nanos(starts)
+        ends = _nanos(ends)
+        if len(self) == 0:
+            return np.full(len(starts), -1, dtype=np.int64)
+        started = np.searchsorted(self.starts, starts, side='right')
+        first = np.searchsorted(self.reach, ends, side='left')
+        return np.where(first < started, self.order[np.minimum(first, len(self) - 1)], -1)
+
+    def containing(self, start, end):
+        """
+        Position of the earliest-starting zone containing [start, end], or None.
+        """
+        position = int(self.containing_many([start], [end])[0])
+        return position if position >= 0 else None
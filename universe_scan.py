@@ -0,0 +1,396 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from candles import CandleSeries
+import instrument
+
+# -----------------------------
+# Parallel Universe Scanner
+# -----------------------------
+#
+# Fans a per-symbol job out to a process pool. The OHLC bars of every symbol
+# are packed into one shared memory block, so workers read them in place
+# instead of receiving pickled DataFrames. Results come back in the order of
+# the symbols, so the CSV files match the serial scan byte for byte.
+#
+# A job is a module-level function job(symbol, store, *args) where store
+# offers candles(key) and frame(key) for the keys of the frames passed in.
+# Instead of frames, a scan can be given a store that workers attach to
+# themselves, such as the memory-mapped ohlc_cache.MappedOHLC.
+
+STORE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+
+class FrameStore:
+    """
+    Serves candles straight from in-process DataFrames (the serial path).
+    """
+    def __init__(self, frames):
+        self.frames = frames
+
+    def frame(self, key):
+        return self.frames[key]
+
+    def candles(self, key):
+        return CandleSeries.from_dataframe(self.frames[key])
+
+
+class SharedOHLC:
+    """
+    OHLC columns of many frames packed into one shared memory block.
+
+    The block holds an int64 timestamp column followed by the float64
+    Open/High/Low/Close columns, each spanning every frame back to back.
+    """
+    def __init__(self, shm, layout, total, owner):
+        self.shm = shm
+        self.layout = layout
+        self.total = total
+        self.owner = owner
+        buffer = np.ndarray((len(STORE_COLUMNS) + 1, total), dtype=np.float64, buffer=shm.buf)
+        self.timestamps = buffer[0].view(np.int64)
+        self.columns = dict(zip(STORE_COLUMNS, buffer[1:]))
+
+    @classmethod
+    def create(cls, frames):
+        layout = {}
+        total = 0
+        for key, data in frames.items():
+            index = pd.DatetimeIndex(data.index)
+            tz = str(index.tz) if index.tz is not None else None
+            layout[key] = (total, total + len(data), tz, index.name)
+            total += len(data)
+
+        size = max((len(STORE_COLUMNS) + 1) * total * 8, 1)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        store = cls(shm, layout, total, owner=True)
+        for key, data in frames.items():
+            start, stop, _, _ = layout[key]
+            # DatetimeIndex.values is UTC for tz-aware indexes
+            store.timestamps[start:stop] = pd.DatetimeIndex(data.index).values.astype('datetime64[ns]').view(np.int64)
+            for name in STORE_COLUMNS:
+                values = data[name]
+                if values.ndim > 1:
+                    values = values.iloc[:, 0]
+                store.columns[name][start:stop] = values.to_numpy(dtype=np.float64)
+        return store
+
+    @classmethod
+    def attach(cls, spec):
+        name, layout, total = spec
+        return cls(shared_memory.SharedMemory(name=name), layout, total, owner=False)
+
+    @property
+    def spec(self):
+        return self.shm.name, self.layout, self.total
+
+    def _index(self, key):
+        start, stop, tz, name = self.layout[key]
+        index = pd.to_datetime(self.timestamps[start:stop], unit='ns', utc=True)
+        index = index.tz_convert(tz) if tz else index.tz_convert(None)
+        index.name = name
+        return index
+
+    def candles(self, key):
+        start, stop, _, _ = self.layout[key]
+        with instrument.stage("candles"):
+            return CandleSeries(*(self.columns[name][start:stop] for name in STORE_COLUMNS), dates=self._index(key))
+
+    def frame(self, key):
+        start, stop, _, _ = self.layout[key]
+        return pd.DataFrame({name: self.columns[name][start:stop] for name in STORE_COLUMNS}, index=self._index(key))
+
+    def close(self):
+        self.columns = None
+        self.timestamps = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+_worker_store = None
+
+
+def _attach_worker(store_class, spec):
+    global _worker_store
+    _worker_store = store_class.attach(spec)
+    instrument.reset()
+
+
+def _run_job(job, symbol, args, record=False, profile=False, store=None):
+    # Records the job's stages in the worker when the parent is recording a run
+    store = _worker_store if store is None else store
+    if not record:
+        return job(symbol, store, *args), None
+    instrument.start(profile)
+    try:
+        result = job(symbol, store, *args)
+    finally:
+        stats = instrument.stop()
+    return result, stats.as_dict()
+
+
+def _run_chunk_job(store_class, spec, job, symbol, args, record=False, profile=False):
+    # Pipeline jobs attach to the store of their own download chunk
+    store = store_class.attach(spec)
+    try:
+        return _run_job(job, symbol, args, record, profile, store)
+    finally:
+        store.close()
+
+
+def iter_scan_universe(symbols, frames, job, args=(), workers=None, cancel_event=None):
+    """
+    Runs job(symbol, store, *args) for every symbol and yields
+    (position, symbol, result) as each symbol finishes.
+
+    Args:
+        symbols: Symbols to scan.
+        frames: Dict of key -> OHLC DataFrame the jobs will read through the store,
+            or a store with attach() and spec, which is used as is.
+        job: Module-level function, so it can be sent to the worker processes.
+        workers: Number of processes; 1 runs serially in this process.
+        cancel_event: Optional threading.Event; once set, symbols that have not
+            started yet are dropped and the iteration stops.
+    """
+    workers = workers or os.cpu_count() or 1
+    shared = hasattr(frames, "spec")
+    if workers == 1 or len(symbols) < 2:
+        store = frames if shared else FrameStore(frames)
+        for position, symbol in enumerate(symbols):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            yield position, symbol, job(symbol, store, *args)
+        return
+
+    if shared:
+        store = frames
+    else:
+        with instrument.stage("share_bars"):
+            store = SharedOHLC.create(frames)
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(symbols)),
+                                   initializer=_attach_worker, initargs=(type(store), store.spec))
+    record = instrument.enabled()
+    profile = instrument.profiling()
+    try:
+        futures = {executor.submit(_run_job, job, symbol, args, record, profile): position
+                   for position, symbol in enumerate(symbols)}
+        for future in as_completed(futures):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            position = futures[future]
+            result, recorded = future.result()
+            instrument.merge(recorded)
+            yield position, symbols[position], result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if not shared:
+            store.close()
+
+
+def scan_universe(symbols, frames, job, args=(), workers=None):
+    """
+    Runs job(symbol, store, *args) for every symbol.
+
+    Args:
+        symbols: Symbols to scan, in output order.
+        frames: Dict of key -> OHLC DataFrame, or a store (see iter_scan_universe).
+        job: Module-level function, so it can be sent to the worker processes.
+        workers: Number of processes; 1 runs serially in this process.
+
+    Returns:
+        List of job results in the order of symbols.
+    """
+    results = [None] * len(symbols)
+    for position, _, result in iter_scan_universe(symbols, frames, job, args, workers):
+        results[position] = result
+    return results
+
+
+# -----------------------------
+# Download/Compute/Write Pipeline
+# -----------------------------
+#
+# iter_scan_universe() waits for every download before the first job starts,
+# and the GUIs only save once the last job is done. iter_pipeline_scan() runs
+# the three as overlapping stages instead: fetch threads download the symbols
+# in chunks, a dispatcher thread hands each downloaded chunk to the process
+# pool, and the calling thread writes the results. Bounded queues between the
+# stages keep memory flat: fetching pauses while `prefetch` chunks wait for
+# the pool, and at most two jobs per worker are pending before their results
+# have been picked up.
+#
+# With a result_cache.ResultCache, the dispatcher looks every symbol up by
+# cache_key(symbol, store) first and only sends the misses to the pool; the
+# results of the misses are added to the cache as they come back.
+
+class _StageFailed:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(target, item, stop):
+    # Blocking put that gives up once the pipeline stops
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(source, stop):
+    # Blocking get that gives up once the pipeline stops
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def iter_pipeline_scan(symbols, fetch, job, args=(), write=None, workers=None, fetch_workers=1,
+                       chunk_size=10, prefetch=2, cancel_event=None, cache=None, cache_key=None):
+    """
+    Like iter_scan_universe(), but downloads, computes and writes at the same time.
+
+    Args:
+        symbols: Symbols to scan.
+        fetch: fetch(chunk) downloads a list of symbols and returns a store with
+            attach() and spec, such as the one OHLCCache.map_many() returns.
+            It runs on fetch_workers threads at once.
+        job: Module-level function job(symbol, store, *args).
+        write: Optional write(position, symbol, result), called on the calling
+            thread in the order of symbols as results become available.
+        workers: Number of processes; 1 runs the jobs on the dispatcher thread.
+        chunk_size: Symbols per fetch() call.
+        prefetch: Downloaded chunks that may wait for the pool.
+        cancel_event: Optional threading.Event; once set, the stages stop and
+            the iteration ends.
+        cache: Optional result_cache.ResultCache answering jobs whose inputs
+            were seen before.
+        cache_key: cache_key(symbol, store) -> key of the job's result, from
+            the symbol's bars in the store and the job's parameters.
+
+    Yields:
+        (position, symbol, result) as each symbol finishes, in any order.
+    """
+    workers = workers or os.cpu_count() or 1
+    stop = threading.Event()
+    chunks = iter([list(range(i, min(i + chunk_size, len(symbols)))) for i in range(0, len(symbols), chunk_size)])
+    chunk_lock = threading.Lock()
+    fetched = queue.Queue(maxsize=prefetch)
+    finished = queue.Queue()
+    pending = threading.Semaphore(2 * workers)
+    missed = {}  # position -> cache key of the jobs sent to compute
+    record = instrument.enabled()
+    profile = instrument.profiling()
+    executor = None
+    if workers > 1 and len(symbols) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(symbols)), initializer=instrument.reset)
+        # Start the worker processes before the stage threads, so none of them
+        # holds a lock while the workers fork
+        executor.submit(instrument.enabled).result()
+
+    def fetch_stage():
+        try:
+            while not stop.is_set():
+                with chunk_lock:
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                store = fetch([symbols[position] for position in chunk])
+                if not _put(fetched, (chunk, store), stop):
+                    return
+            _put(fetched, None, stop)
+        except BaseException as error:
+            finished.put(_StageFailed(error))
+
+    def compute_stage():
+        try:
+            submitted = 0
+            fetchers_left = fetch_workers
+            while fetchers_left:
+                item = _get(fetched, stop)
+                if stop.is_set():
+                    return
+                if item is None:
+                    fetchers_left -= 1
+                    continue
+                chunk, store = item
+                for position in chunk:
+                    while not pending.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if cache is not None:
+                        with instrument.stage("cache"):
+                            key = cache_key(symbols[position], store)
+                            hit, result = cache.get(key)
+                        if hit:
+                            finished.put((position, None, result))
+                            submitted += 1
+                            continue
+                        missed[position] = key
+                    if executor is None:
+                        finished.put((position, None, job(symbols[position], store, *args)))
+                    else:
+                        future = executor.submit(_run_chunk_job, type(store), store.spec, job, symbols[position],
+                                                 args, record, profile)
+                        future.add_done_callback(lambda future, position=position: finished.put((position, future, None)))
+                    submitted += 1
+            finished.put(submitted)
+        except BaseException as error:
+            finished.put(_StageFailed(error))
+
+    threads = [threading.Thread(target=fetch_stage, daemon=True) for _ in range(fetch_workers)]
+    threads.append(threading.Thread(target=compute_stage, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # Results are written in the order of symbols, so the written files match a serial scan
+    unwritten = {}
+    next_write = 0
+    received = 0
+    total = None
+    try:
+        while total is None or received < total:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            item = _get(finished, cancel_event) if cancel_event is not None else finished.get()
+            if item is None:
+                return
+            if isinstance(item, _StageFailed):
+                raise item.error
+            if isinstance(item, int):
+                total = item
+                continue
+
+            position, future, result = item
+            if future is not None:
+                result, recorded = future.result()
+                instrument.merge(recorded)
+            pending.release()
+            received += 1
+            if position in missed:
+                cache.put(missed.pop(position), result)
+
+            if write is not None:
+                unwritten[position] = result
+                with instrument.stage("save"):
+                    while next_write in unwritten:
+                        write(next_write, symbols[next_write], unwritten.pop(next_write))
+                        next_write += 1
+            yield position, symbols[position], result
+    finally:
+        stop.set()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,117 @@
+from tkinter import ttk
+
+# -----------------------------
+# Virtualized Table
+# -----------------------------
+#
+# A ttk.Treeview slows down with every item inserted, so tables of tens of
+# thousands of zones took long to fill and lagged on scroll. VirtualTable
+# keeps only as many Treeview items as fit in the window and rewrites their
+# values from the row source whenever the view scrolls or is resized, so
+# opening and scrolling costs the same for 100 rows as for 100,000.
+
+
+class VirtualTable(ttk.Frame):
+    """
+    Read-only table showing a window of rows at a time.
+
+    Args:
+        master: Parent widget.
+        columns: Column headings.
+        rows: Any sequence supporting len() and indexing; rows[i] is the tuple
+            of values of row i and is only read while the row is visible.
+        column_width: Initial width of every column.
+    """
+    def __init__(self, master, columns, rows=(), column_width=150, **kwargs):
+        super().__init__(master, **kwargs)
+        self.rows = rows
+        self.first = 0
+        self.items = []
+
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=1)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, minwidth=0, width=column_width)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scrollbar)
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", lambda event: self.refresh())
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Prior>", lambda event: self.scroll(-self.page_size()))
+        self.tree.bind("<Next>", lambda event: self.scroll(self.page_size()))
+        self.tree.bind("<Home>", lambda event: self.scroll_to(0))
+        self.tree.bind("<End>", lambda event: self.scroll_to(len(self.rows)))
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.first = 0
+        self.refresh()
+
+    def page_size(self):
+        """
+        Number of rows that fit in the current height of the table.
+        """
+        height = self.tree.winfo_height()
+        top, row_height = self._row_geometry()
+        return max(1, (height - top) // row_height)
+
+    def _row_geometry(self):
+        # (y of the first row below the heading, row height) in pixels
+        if self.items:
+            bbox = self.tree.bbox(self.items[0])
+            if bbox:
+                return bbox[1], bbox[3]
+        row_height = ttk.Style(self).lookup("Treeview", "rowheight")
+        row_height = int(row_height) if row_height else 20
+        # Before the first row is drawn, assume the heading is one row high
+        return row_height, row_height
+
+    def refresh(self):
+        """
+        Shows the rows starting at self.first, reusing the Treeview items.
+        """
+        total = len(self.rows)
+        count = min(self.page_size(), total)
+        self.first = max(0, min(self.first, total - count))
+
+        # Grow or shrink the item pool to the visible row count
+        while len(self.items) < count:
+            self.items.append(self.tree.insert("", "end"))
+        if len(self.items) > count:
+            self.tree.delete(*self.items[count:])
+            del self.items[count:]
+
+        for offset, item in enumerate(self.items):
+            self.tree.item(item, values=self.rows[self.first + offset])
+
+        if total:
+            self.scrollbar.set(self.first / total, (self.first + count) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_to(self, first):
+        self.first = int(first)
+        self.refresh()
+        return "break"
+
+    def scroll(self, rows):
+        return self.scroll_to(self.first + rows)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(float(amount) * len(self.rows))
+        elif unit == "pages":
+            self.scroll(int(amount) * self.page_size())
+        else:
+            self.scroll(int(amount))
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        steps = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll(-3 * steps)
@@ -0,0 +1,298 @@
+import numpy as np
+
+# -----------------------------
+# Vectorized Zone Detection Engine
+# -----------------------------
+#
+# Shared by dz_sz.py, dz_sz_chart.py, gui_bulk_dz.py, coinsiding_dz.py and
+# dem_zones_updated.py.
+# Every candle is classified in one pass over the OHLC arrays, base runs are
+# measured with run-length arrays and the leg-in -> base -> leg-out scan is
+# resolved with pointer doubling, so no Python loop walks the candles.
+
+# How the scan resumes after a leg-in candle has been examined.
+# RESUME_AT_LEGOUT: continue at the candle after the base run, so the leg-out
+#   candle may itself become the next leg-in (dz_sz.py, coinsiding_dz.py).
+# RESUME_AFTER_LEGOUT: continue after the leg-out run, or one candle further
+#   when the leg-out run was incomplete (gui_bulk_dz.py).
+# RESUME_PAST_LEGOUT: always continue one candle after the base run, whether
+#   or not a leg-out followed (dem_zones_updated.py).
+RESUME_AT_LEGOUT = "at_legout"
+RESUME_AFTER_LEGOUT = "after_legout"
+RESUME_PAST_LEGOUT = "past_legout"
+
+ZONE_DTYPE = np.dtype([
+    ("legin", np.int64),          # Index of the leg-in candle
+    ("base_start", np.int64),     # Index of the first base candle
+    ("base_end", np.int64),       # Index one past the last base candle
+    ("legout", np.int64),         # Index of the last leg-out candle
+    ("base_high", np.float64),    # Highest high of the base candles
+    ("base_low", np.float64),     # Lowest low of the base candles
+    ("upper_body_low", np.float64),  # Lowest upper body of the base candles
+])
+
+SD_ZONE_DTYPE = np.dtype([
+    ("legin", np.int64),          # Index of the leg-in candle
+    ("base_start", np.int64),     # Index of the first base candle
+    ("base_end", np.int64),       # Index one past the last base candle
+    ("legout", np.int64),         # Index of the last leg-out candle
+    ("is_supply", np.bool_),      # The leg-out candle closed below its open
+    ("base_high", np.float64),    # Highest high of the base candles
+    ("base_low", np.float64),     # Lowest low of the base candles
+])
+
+
+def body_percentage(open_price, high, low, close):
+    """
+    Calculates the body percentage of every candle at once.
+    Candles with no range get 0, matching Candle.body_percentage.
+    """
+    open_price = np.asarray(open_price, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+
+    body = np.abs(close - open_price)
+    candle_range = high - low
+    pct = np.zeros(len(body), dtype=np.float64)
+    np.divide(body, candle_range, out=pct, where=candle_range != 0)
+    return pct * 100
+
+
+def run_lengths(mask):
+    """
+    For every index returns how many consecutive True values start there.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    n = len(mask)
+    idx = np.arange(n + 1)
+    # Position of the next False at or after each index (n if none)
+    breaks = np.where(np.append(~mask, True), idx, n)
+    next_break = np.minimum.accumulate(breaks[::-1])[::-1]
+    return next_break[:n] - idx[:n]
+
+
+def _visited_from(start, jump, n):
+    """
+    Returns the sorted indices visited by repeatedly applying `jump` from `start`.
+    `jump` must strictly increase every index and map anything >= n to n.
+    """
+    table = np.append(jump, n)
+    visited = np.array([start], dtype=np.int64) if start < n else np.empty(0, dtype=np.int64)
+    # Each round doubles the path prefix known so far
+    while len(visited):
+        reached = table[visited]
+        reached = reached[reached < n]
+        if len(reached) == 0:
+            break
+        visited = np.union1d(visited, reached)
+        table = table[table]
+    return visited
+
+
+def find_patterns(is_legin, is_base, is_legout, max_base, min_base=1,
+                  min_legout=1, resume=RESUME_AT_LEGOUT):
+    """
+    Finds leg-in -> base run -> leg-out patterns from per-candle masks.
+
+    Mirrors the original while-loops: only leg-ins before the last two candles
+    are considered, up to `max_base` base candles are collected greedily and
+    exactly `min_legout` leg-out candles must follow.
+
+    Returns:
+        Tuple of integer arrays (legin, base_end, legout_end) for the patterns
+        that matched, where base_end and legout_end are exclusive indices.
+    """
+    visited, n_base, base_end, n_legout, legout_end = _pattern_path(is_legin, is_base, is_legout, max_base,
+                                                                    min_legout, resume)
+    matched = (n_base[visited] >= max(min_base, 1)) & (n_legout[visited] == min_legout)
+    visited = visited[matched]
+    return visited, base_end[visited], legout_end[visited]
+
+
+def _pattern_path(is_legin, is_base, is_legout, max_base, min_legout, resume):
+    # Leg-in candidates the scan examines, plus the base and leg-out run of every candle
+    is_legin = np.asarray(is_legin, dtype=bool)
+    is_base = np.asarray(is_base, dtype=bool)
+    is_legout = np.asarray(is_legout, dtype=bool)
+    n = len(is_legin)
+    empty = np.empty(0, dtype=np.int64)
+    if n < 3:
+        return empty, empty, empty, empty, empty
+
+    idx = np.arange(n)
+    base_run = np.append(run_lengths(is_base), 0)
+    legout_run = np.append(run_lengths(is_legout), 0)
+
+    # Where the base run after each candidate leg-in ends
+    n_base = np.minimum(base_run[np.minimum(idx + 1, n)], max_base)
+    base_end = idx + 1 + n_base
+    n_legout = np.minimum(legout_run[base_end], min_legout)
+    legout_end = base_end + n_legout
+
+    candidate = is_legin & (idx < n - 2)
+    if resume == RESUME_AT_LEGOUT:
+        resume_at = base_end
+    elif resume == RESUME_AFTER_LEGOUT:
+        resume_at = np.where(n_base == 0, base_end,
+                             np.where(n_legout == min_legout, legout_end, legout_end + 1))
+    elif resume == RESUME_PAST_LEGOUT:
+        resume_at = base_end + 1
+    else:
+        raise ValueError(f"Unknown resume mode: {resume}")
+
+    # Non leg-in candles simply advance by one
+    jump = np.where(candidate, resume_at, idx + 1)
+    jump = np.minimum(np.maximum(jump, idx + 1), n)
+
+    # Only leg-in candidates need to be chained; skip straight to the next one
+    next_candidate = np.where(np.append(candidate, True), np.arange(n + 1), n)
+    next_candidate = np.minimum.accumulate(next_candidate[::-1])[::-1]
+    jump = next_candidate[jump]
+
+    visited = _visited_from(next_candidate[0], jump, n)
+    visited = visited[candidate[visited]]
+    return visited, n_base, base_end, n_legout, legout_end
+
+
+def _window_reduce(values, starts, ends, max_len, reducer, fill):
+    # Reduces values[starts:ends] for short windows without a Python loop per zone
+    result = np.full(len(starts), fill, dtype=np.float64)
+    for offset in range(max_len):
+        pos = starts + offset
+        inside = pos < ends
+        if not inside.any():
+            break
+        result[inside] = reducer(result[inside], values[pos[inside]])
+    return result
+
+
+def detect_demand_zones(open_price, high, low, close, is_legin, is_base, is_legout,
+                        max_base, min_base=1, min_legout=1,
+                        resume=RESUME_AT_LEGOUT, breakout="base_high"):
+    """
+    Detects demand zones over whole OHLC arrays.
+
+    The leg-out candle (the last of the leg-out run) must be bullish and close
+    above the leg-in high and above the base boundary selected by `breakout`:
+    "base_high" (highest base high) or "upper_body" (lowest base upper body).
+
+    Returns:
+        Structured array with ZONE_DTYPE fields, one record per zone.
+    """
+    legin, base_end, legout_end = find_patterns(is_legin, is_base, is_legout, max_base,
+                                                min_base, min_legout, resume)
+    return _demand_zones(open_price, high, low, close, legin, base_end, legout_end, max_base, breakout)
+
+
+def resume_demand_zones(start, settled, open_price, high, low, close, is_legin, is_base, is_legout,
+                        max_base, min_base=1, min_legout=1,
+                        resume=RESUME_AT_LEGOUT, breakout="base_high"):
+    """
+    Like detect_demand_zones, but only scans the bars from `start` on. The
+    zones are those detect_demand_zones finds with a leg-in at or after
+    start, provided start is a restart position of an earlier scan.
+
+    Returns:
+        Tuple of (zones with indices into the whole arrays, restart), where
+        restart is the last leg-in candidate examined whose outcome depends
+        only on the first `settled` bars. Bars may later be appended after
+        `settled` and a new scan resumed at restart; zones before restart
+        stay as they are.
+    """
+    visited, n_base, base_end, n_legout, legout_end = _pattern_path(
+        is_legin[start:], is_base[start:], is_legout[start:], max_base, min_legout, resume)
+    # A candidate looks at its base run and leg-out run, max_base + min_legout bars ahead
+    final = visited[visited + start + 1 + max_base + min_legout <= settled]
+    restart = int(final[-1]) + start if len(final) else start
+
+    matched = (n_base[visited] >= max(min_base, 1)) & (n_legout[visited] == min_legout)
+    visited = visited[matched]
+    zones = _demand_zones(open_price[start:], high[start:], low[start:], close[start:],
+                          visited, base_end[visited], legout_end[visited], max_base, breakout)
+    for field in ("legin", "base_start", "base_end", "legout"):
+        zones[field] += start
+    return zones, restart
+
+
+def _demand_zones(open_price, high, low, close, legin, base_end, legout_end, max_base, breakout):
+    # Zone records of the patterns whose leg-out breaks out of the base
+    open_price = np.asarray(open_price, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+
+    base_start = legin + 1
+    base_high = _window_reduce(high, base_start, base_end, max_base, np.maximum, -np.inf)
+    base_low = _window_reduce(low, base_start, base_end, max_base, np.minimum, np.inf)
+    upper_body = np.maximum(open_price, close)
+    upper_body_low = _window_reduce(upper_body, base_start, base_end, max_base, np.minimum, np.inf)
+
+    legout = legout_end - 1
+    legout_close = close[legout]
+    if breakout == "base_high":
+        level = base_high
+    elif breakout == "upper_body":
+        level = upper_body_low
+    else:
+        raise ValueError(f"Unknown breakout level: {breakout}")
+
+    is_zone = ((legout_close > open_price[legout]) &
+               (legout_close > high[legin]) &
+               (legout_close > level))
+
+    zones = np.empty(int(is_zone.sum()), dtype=ZONE_DTYPE)
+    zones["legin"] = legin[is_zone]
+    zones["base_start"] = base_start[is_zone]
+    zones["base_end"] = base_end[is_zone]
+    zones["legout"] = legout[is_zone]
+    zones["base_high"] = base_high[is_zone]
+    zones["base_low"] = base_low[is_zone]
+    zones["upper_body_low"] = upper_body_low[is_zone]
+    return zones
+
+
+def detect_supply_demand_zones(open_price, high, low, close, is_legin, is_base, is_legout,
+                               max_base, min_base=1, min_legout=1, resume=RESUME_AT_LEGOUT):
+    """
+    Detects demand and supply zones over whole OHLC arrays in one pass.
+
+    Patterns are found once and split by the leg-out candle (the last of the
+    leg-out run): supply when it closes below its open, demand otherwise.
+
+    Returns:
+        Structured array with SD_ZONE_DTYPE fields, one record per zone in leg-in order.
+    """
+    open_price = np.asarray(open_price, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+
+    legin, base_end, legout_end = find_patterns(is_legin, is_base, is_legout, max_base,
+                                                min_base, min_legout, resume)
+    base_start = legin + 1
+    legout = legout_end - 1
+
+    zones = np.empty(len(legin), dtype=SD_ZONE_DTYPE)
+    zones["legin"] = legin
+    zones["base_start"] = base_start
+    zones["base_end"] = base_end
+    zones["legout"] = legout
+    zones["is_supply"] = close[legout] < open_price[legout]
+    zones["base_high"] = _window_reduce(high, base_start, base_end, max_base, np.maximum, -np.inf)
+    zones["base_low"] = _window_reduce(low, base_start, base_end, max_base, np.minimum, np.inf)
+    return zones
+
+
+def ohlc_arrays(candles):
+    """
+    Returns (open, high, low, close) float arrays for a CandleSeries or a sequence of Candle objects.
+    """
+    # A CandleSeries already holds its columns
+    if hasattr(candles, "ohlc_arrays"):
+        return candles.ohlc_arrays()
+    open_price = np.fromiter((c.open_price for c in candles), dtype=np.float64, count=len(candles))
+    high = np.fromiter((c.high for c in candles), dtype=np.float64, count=len(candles))
+    low = np.fromiter((c.low for c in candles), dtype=np.float64, count=len(candles))
+    close = np.fromiter((c.close for c in candles), dtype=np.float64, count=len(candles))
+    return open_price, high, low, close
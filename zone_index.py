@@ -0,0 +1,241 @@
+import heapq
+
+import numpy as np
+
+import zone_engine
+
+# -----------------------------
+# Zone Touch Index
+# -----------------------------
+#
+# Answers "which is the first candle at or after index k that reaches a price"
+# in O(log n) by descending segment trees of the running min-low and max-high,
+# instead of walking the candles one by one for every zone.
+
+STATUS_FRESH = 'Fresh'
+STATUS_TESTED = 'Tested'
+STATUS_TARGET = 'Target Achieved'
+
+
+class TouchIndex:
+    """
+    Segment trees over the lows and highs of a candle series.
+    """
+    def __init__(self, low, high):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.n = len(self.low)
+
+        size = 1
+        while size < max(self.n, 1):
+            size *= 2
+        self.size = size
+
+        # Leaves live at [size, 2 * size); padding never satisfies a query
+        self.min_low = np.full(2 * size, np.inf)
+        self.max_high = np.full(2 * size, -np.inf)
+        self.min_low[size:size + self.n] = self.low
+        self.max_high[size:size + self.n] = self.high
+        level = size
+        while level > 1:
+            parents = slice(level // 2, level)
+            self.min_low[parents] = np.minimum(self.min_low[level:2 * level:2], self.min_low[level + 1:2 * level:2])
+            self.max_high[parents] = np.maximum(self.max_high[level:2 * level:2], self.max_high[level + 1:2 * level:2])
+            level //= 2
+
+    @classmethod
+    def from_candles(cls, candles):
+        _, high, low, _ = zone_engine.ohlc_arrays(candles)
+        return cls(low, high)
+
+    def _first(self, tree, start, reaches):
+        # First leaf at or after start whose subtree value satisfies reaches()
+        if start >= self.n:
+            return None
+        i = max(start, 0) + self.size
+        while True:
+            if reaches(tree[i]):
+                while i < self.size:
+                    i = 2 * i
+                    if not reaches(tree[i]):
+                        i += 1
+                return i - self.size if i - self.size < self.n else None
+            # Climb while we are a right child, then step to the next subtree
+            while i & 1:
+                i >>= 1
+            if i == 0:
+                return None
+            i += 1
+
+    def first_low_at_or_below(self, start, price):
+        return self._first(self.min_low, start, lambda value: value <= price)
+
+    def first_low_below(self, start, price):
+        return self._first(self.min_low, start, lambda value: value < price)
+
+    def first_high_at_or_above(self, start, price):
+        return self._first(self.max_high, start, lambda value: value >= price)
+
+    def first_touch(self, start, zone_low, zone_high):
+        """
+        Returns the index of the first candle at or after start whose range
+        overlaps [zone_low, zone_high], or None if price never comes back.
+        """
+        k = start
+        while True:
+            k = self.first_low_at_or_below(k, zone_high)
+            if k is None:
+                return None
+            if self.high[k] >= zone_low:
+                return k
+            # The candle gapped below the zone; wait for price to reach back up
+            k = self.first_high_at_or_above(k + 1, zone_low)
+            if k is None:
+                return None
+            if self.low[k] <= zone_high:
+                return k
+            k += 1
+
+    def is_price_touched(self, start, price):
+        """
+        Checks if any candle at or after start trades through the given price.
+        """
+        return self.first_touch(start, price, price) is not None
+
+    def zone_status(self, start, zone_low, zone_high, target_price):
+        """
+        Finds the first touch of the zone, then whether the target or a break
+        below zone_low comes first (the target wins on the same candle).
+
+        Returns:
+            Tuple of (status, touch index, exit index) where the indexes are None
+            when the zone was never touched or is still open.
+        """
+        touch = self.first_touch(start, zone_low, zone_high)
+        if touch is None:
+            return STATUS_FRESH, None, None
+
+        target = self.first_high_at_or_above(touch, target_price)
+        broken = self.first_low_below(touch, zone_low)
+        if target is not None and (broken is None or target <= broken):
+            return STATUS_TARGET, touch, target
+        if broken is not None:
+            return STATUS_TESTED, touch, broken
+        return STATUS_FRESH, touch, None
+
+
+# -----------------------------
+# Batch Zone Status
+# -----------------------------
+#
+# zone_statuses() settles every zone of a series in one pass over the candles.
+# Zones join the sweep at their start candle; until they are entered they wait
+# in a heap of zones above the price (lowest zone low first) or below it
+# (highest zone high first), so each candle only looks at the zones it can
+# reach. Entered zones wait in a heap of targets and a heap of zone lows until
+# one of them is hit. Each zone moves through the heaps a bounded number of
+# times, so the pass costs O((n + zones) log zones) however long the series.
+
+def zone_statuses(low, high, starts, zone_lows, zone_highs, target_prices, touched=None):
+    """
+    Status of many zones of one candle series, with the same rules and results
+    as TouchIndex.zone_status applied to each zone.
+
+    Args:
+        low, high: Candle lows and highs.
+        starts: First candle to check for each zone, usually the leg-out + 1.
+        zone_lows, zone_highs, target_prices: Price levels of each zone.
+        touched: Optional touch index of each zone, or -1. A zone that was
+            already entered before its start is only checked for its exit.
+
+    Returns:
+        List of (status, touch index, exit index) tuples in the order of the zones.
+    """
+    low = np.asarray(low, dtype=np.float64).tolist()
+    high = np.asarray(high, dtype=np.float64).tolist()
+    starts = np.maximum(np.asarray(starts, dtype=np.int64), 0)
+    order = np.argsort(starts, kind="stable").tolist()
+    starts = starts.tolist()
+    zone_lows = np.asarray(zone_lows, dtype=np.float64).tolist()
+    zone_highs = np.asarray(zone_highs, dtype=np.float64).tolist()
+    target_prices = np.asarray(target_prices, dtype=np.float64).tolist()
+    if touched is None:
+        touched = [-1] * len(starts)
+    else:
+        touched = np.asarray(touched, dtype=np.int64).tolist()
+
+    n = len(low)
+    results = [(STATUS_FRESH, None, None)] * len(starts)
+    # Known touches are kept even if the zone starts after the last candle
+    touches = [touch if touch >= 0 else None for touch in touched]
+    above = []      # (zone low, zone) of zones waiting above the price
+    below = []      # (-zone high, zone) of zones waiting below the price
+    targets = []    # (target price, zone) of entered zones
+    stops = []      # (-zone low, zone) of entered zones
+    open_zones = 0  # Entered zones without an exit yet
+    next_zone = 0
+    i = 0
+
+    while True:
+        if not above and not below and not open_zones:
+            # Nothing to watch: jump to the start of the next zone
+            if next_zone == len(order):
+                break
+            del targets[:], stops[:]
+            i = max(i, starts[order[next_zone]])
+        if i >= n:
+            break
+        bar_low = low[i]
+        bar_high = high[i]
+
+        entered = []
+        while next_zone < len(order) and starts[order[next_zone]] <= i:
+            z = order[next_zone]
+            next_zone += 1
+            if touched[z] >= 0:
+                entered.append(z)
+            elif zone_lows[z] > bar_high:
+                heapq.heappush(above, (zone_lows[z], z))
+            elif zone_highs[z] < bar_low:
+                heapq.heappush(below, (-zone_highs[z], z))
+            else:
+                entered.append(z)
+        while above and above[0][0] <= bar_high:
+            z = heapq.heappop(above)[1]
+            if bar_low <= zone_highs[z]:
+                entered.append(z)
+            else:
+                # The candle gapped over the zone, which now waits below the price
+                heapq.heappush(below, (-zone_highs[z], z))
+        while below and -below[0][0] >= bar_low:
+            z = heapq.heappop(below)[1]
+            if bar_high >= zone_lows[z]:
+                entered.append(z)
+            else:
+                heapq.heappush(above, (zone_lows[z], z))
+
+        for z in entered:
+            touches[z] = touched[z] if touched[z] >= 0 else i
+            heapq.heappush(targets, (target_prices[z], z))
+            heapq.heappush(stops, (-zone_lows[z], z))
+        open_zones += len(entered)
+
+        # The target wins on the same candle; the other heap's entry of a
+        # settled zone is dropped when it comes up
+        while targets and targets[0][0] <= bar_high:
+            z = heapq.heappop(targets)[1]
+            if results[z][0] == STATUS_FRESH:
+                results[z] = (STATUS_TARGET, touches[z], i)
+                open_zones -= 1
+        while stops and -stops[0][0] > bar_low:
+            z = heapq.heappop(stops)[1]
+            if results[z][0] == STATUS_FRESH:
+                results[z] = (STATUS_TESTED, touches[z], i)
+                open_zones -= 1
+        i += 1
+
+    # Zones entered without reaching the target or breaking stay fresh
+    for z, touch in enumerate(touches):
+        if touch is not None and results[z][0] == STATUS_FRESH:
+            results[z] = (STATUS_FRESH, touch, None)
+    return results
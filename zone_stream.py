@@ -0,0 +1,395 @@
+import heapq
+import itertools
+import sys
+
+import numpy as np
+import pandas as pd
+
+import zone_engine
+import zone_index
+
+# -----------------------------
+# Streaming Zone Detector
+# -----------------------------
+#
+# ZoneDetector takes one candle at a time, e.g. from a 1-minute feed, instead
+# of re-running the batch detectors over the whole history on every tick.
+# Patterns use the leg-in / base / leg-out rules of gui_bulk_dz.py and are
+# split into demand and supply zones by the leg-out direction, as in
+# dem_zones_updated.py. Zone statuses follow zone_index.TouchIndex.zone_status.
+#
+# Each candle costs O(1) work, plus O(log zones) for every zone that changes
+# state: untouched and open zones wait in heaps keyed by the price that will
+# move them next, so zones far from the current price are never looked at.
+
+DEMAND = "demand"
+SUPPLY = "supply"
+
+_SCAN = 0      # Looking for a leg-in candle
+_BASE = 1      # Collecting base candles after a leg-in
+_LEGOUT = 2    # Counting leg-out candles after the base
+
+
+class StreamZone:
+    """
+    A zone confirmed by ZoneDetector. status, touch_index and exit_index are
+    updated in place as new candles arrive.
+    """
+    __slots__ = ("kind", "legin", "legout", "legin_date", "legout_date", "base_candles",
+                 "zone_low", "zone_high", "target_price", "status", "touch_index", "exit_index")
+
+    def __init__(self, kind, legin, legout, legin_date, legout_date, base_candles,
+                 zone_low, zone_high, target_price):
+        self.kind = kind
+        self.legin = legin
+        self.legout = legout
+        self.legin_date = legin_date
+        self.legout_date = legout_date
+        self.base_candles = base_candles
+        self.zone_low = zone_low
+        self.zone_high = zone_high
+        self.target_price = target_price
+        self.status = zone_index.STATUS_FRESH
+        self.touch_index = None
+        self.exit_index = None
+
+    def __repr__(self):
+        return (f"StreamZone({self.kind}, legin={self.legin}, legout={self.legout}, "
+                f"low={self.zone_low}, high={self.zone_high}, status={self.status})")
+
+
+class _StatusBook:
+    """
+    Tracks the status of demand zones. Supply zones use a second book fed with
+    negated prices, which turns them into demand zones.
+    """
+    def __init__(self):
+        self.seq = itertools.count()
+        self.above = []    # Untouched, price above the zone: (-zone_high, seq, entry)
+        self.below = []    # Untouched, price gapped below the zone: (zone_low, seq, entry)
+        self.targets = []  # Touched, waiting for the target: (target, seq, entry)
+        self.breaks = []   # Touched, waiting for a break below: (-zone_low, seq, entry)
+
+    def add(self, zone, zone_low, zone_high, target):
+        # The leg-out closed above the zone, so price starts above it
+        heapq.heappush(self.above, (-zone_high, next(self.seq), (zone, zone_low, zone_high, target)))
+
+    def update(self, index, low, high):
+        """
+        Applies one candle and returns the zones whose status changed.
+        """
+        changed = []
+        touched = []
+
+        while self.above and -self.above[0][0] >= low:
+            entry = heapq.heappop(self.above)[2]
+            if high >= entry[1]:
+                touched.append(entry)
+            else:
+                # Gapped below the zone; wait for price to reach back up
+                heapq.heappush(self.below, (entry[1], next(self.seq), entry))
+
+        while self.below and self.below[0][0] <= high:
+            entry = heapq.heappop(self.below)[2]
+            if low <= entry[2]:
+                touched.append(entry)
+            else:
+                heapq.heappush(self.above, (-entry[2], next(self.seq), entry))
+
+        # Open zones: the target wins when both happen on the same candle
+        while self.targets and self.targets[0][0] <= high:
+            zone = heapq.heappop(self.targets)[2][0]
+            if zone.exit_index is None:
+                self._close(zone, zone_index.STATUS_TARGET, index, changed)
+
+        while self.breaks and -self.breaks[0][0] > low:
+            zone = heapq.heappop(self.breaks)[2][0]
+            if zone.exit_index is None:
+                self._close(zone, zone_index.STATUS_TESTED, index, changed)
+
+        # The touching candle itself can already reach the target or break the zone
+        for entry in touched:
+            zone, zone_low, _, target = entry
+            zone.touch_index = index
+            if high >= target:
+                self._close(zone, zone_index.STATUS_TARGET, index, changed)
+            elif low < zone_low:
+                self._close(zone, zone_index.STATUS_TESTED, index, changed)
+            else:
+                heapq.heappush(self.targets, (target, next(self.seq), entry))
+                heapq.heappush(self.breaks, (-zone_low, next(self.seq), entry))
+        return changed
+
+    @staticmethod
+    def _close(zone, status, index, changed):
+        zone.status = status
+        zone.exit_index = index
+        changed.append(zone)
+
+
+class ZoneDetector:
+    """
+    Incremental demand and supply zone detector.
+
+    Args mirror the tunables of gui_bulk_dz.create_gui. A demand zone needs a
+    bullish leg-out closing above the leg-in high and the lowest base upper
+    body; a supply zone is the mirror image with a bearish leg-out. Targets sit
+    at twice the zone height beyond the zone, as in gui_bulk_dz.py.
+    """
+    def __init__(self, min_body_percent_legin=50, max_body_percent_base=50, min_body_percent_legout=50,
+                 max_base_candles=5, min_legin_candles=1, min_legout_candles=1):
+        self.min_body_percent_legin = min_body_percent_legin
+        self.max_body_percent_base = max_body_percent_base
+        self.min_body_percent_legout = min_body_percent_legout
+        self.max_base_candles = max_base_candles
+        self.min_legin_candles = min_legin_candles
+        self.min_legout_candles = min_legout_candles
+
+        self.count = 0
+        self.zones = []
+        self.demand_book = _StatusBook()
+        self.supply_book = _StatusBook()
+
+        self.phase = _SCAN
+        self.previous = None
+        self._reset_pattern()
+
+    def _reset_pattern(self):
+        self.legin = None
+        self.legin_date = None
+        self.legin_high = None
+        self.legin_low = None
+        self.n_base = 0
+        self.n_legout = 0
+        self.base_high = -np.inf
+        self.base_low = np.inf
+        self.upper_body_low = np.inf
+        self.lower_body_high = -np.inf
+
+    def add_candle(self, open_price, high, low, close, date=None):
+        """
+        Feeds the next candle.
+
+        Returns:
+            Tuple of (zones confirmed by this candle, existing zones whose status changed).
+        """
+        index = self.count
+        self.count += 1
+
+        new_zones = []
+        self._detect(index, float(open_price), float(high), float(low), float(close), date, new_zones)
+        self.previous = (float(open_price), float(close), date)
+
+        # A zone's status starts after its leg-out. Without leg-out candles the
+        # zone is only confirmed one candle late, so that candle must count too.
+        for zone in new_zones:
+            if zone.legout < index:
+                self._track(zone)
+        changed = self.demand_book.update(index, low, high)
+        changed += self.supply_book.update(index, -high, -low)
+        for zone in new_zones:
+            if zone.legout == index:
+                self._track(zone)
+        return new_zones, changed
+
+    def finish(self):
+        """
+        Ends the feed. Without leg-out candles a base run only ends at the
+        next non-base candle, but the batch engine also ends it at the last
+        candle, so a base still open here is confirmed now. Leg-ins of the
+        last two candles are skipped, as in the batch engine.
+
+        Returns:
+            List of the zones this confirms.
+        """
+        new_zones = []
+        if (self.phase == _BASE and self.min_legout_candles <= 0 and self.n_base > 0
+                and self.legin < self.count - 2):
+            prev_open, prev_close, prev_date = self.previous
+            self._confirm(self.count - 1, prev_open, prev_close, prev_date, new_zones)
+            for zone in new_zones:
+                self._track(zone)
+        self.phase = _SCAN
+        return new_zones
+
+    def _detect(self, index, open_price, high, low, close, date, new_zones):
+        candle_range = high - low
+        body_pct = abs(close - open_price) / candle_range * 100 if candle_range != 0 else 0.0
+        is_legin = body_pct > self.min_body_percent_legin and self.min_legin_candles > 0
+        is_base = body_pct < self.max_body_percent_base
+        is_legout = body_pct > self.min_body_percent_legout
+
+        if self.phase == _BASE:
+            if is_base and self.n_base < self.max_base_candles:
+                self.n_base += 1
+                self.base_high = max(self.base_high, high)
+                self.base_low = min(self.base_low, low)
+                self.upper_body_low = min(self.upper_body_low, max(open_price, close))
+                self.lower_body_high = max(self.lower_body_high, min(open_price, close))
+                return
+            if self.n_base == 0:
+                # No base after the leg-in; this candle is scanned afresh
+                self.phase = _SCAN
+            elif self.min_legout_candles <= 0:
+                # The last base candle doubles as the leg-out
+                prev_open, prev_close, prev_date = self.previous
+                self._confirm(index - 1, prev_open, prev_close, prev_date, new_zones)
+                self.phase = _SCAN
+            else:
+                self.phase = _LEGOUT
+                self.n_legout = 0
+
+        if self.phase == _LEGOUT:
+            self.phase = _SCAN
+            if is_legout:
+                self.n_legout += 1
+                if self.n_legout < self.min_legout_candles:
+                    self.phase = _LEGOUT
+                else:
+                    self._confirm(index, open_price, close, date, new_zones)
+            # An incomplete leg-out run consumes this candle
+            return
+
+        if is_legin:
+            self._reset_pattern()
+            self.phase = _BASE
+            self.legin = index
+            self.legin_date = date
+            self.legin_high = high
+            self.legin_low = low
+
+    def _confirm(self, legout, open_price, close, date, new_zones):
+        if close > open_price and close > self.legin_high and close > self.upper_body_low:
+            zone_low, zone_high = self.base_low, self.upper_body_low
+            zone = StreamZone(DEMAND, self.legin, legout, self.legin_date, date, self.n_base,
+                              zone_low, zone_high, zone_high + 2 * (zone_high - zone_low))
+        elif close < open_price and close < self.legin_low and close < self.lower_body_high:
+            zone_low, zone_high = self.lower_body_high, self.base_high
+            zone = StreamZone(SUPPLY, self.legin, legout, self.legin_date, date, self.n_base,
+                              zone_low, zone_high, zone_low - 2 * (zone_high - zone_low))
+        else:
+            return
+        self.zones.append(zone)
+        new_zones.append(zone)
+
+    def _track(self, zone):
+        if zone.kind == DEMAND:
+            self.demand_book.add(zone, zone.zone_low, zone.zone_high, zone.target_price)
+        else:
+            self.supply_book.add(zone, -zone.zone_high, -zone.zone_low, -zone.target_price)
+
+# -----------------------------
+# Replay Harness
+# -----------------------------
+
+
+def replay(data, detector=None, on_update=None):
+    """
+    Feeds the bars of an OHLC DataFrame to a detector one at a time, then
+    ends the feed. on_update(index, new_zones, changed_zones) is called after
+    every bar that confirms or changes zones.
+    """
+    detector = detector if detector is not None else ZoneDetector()
+    dates = data.index
+    columns = [data[name].to_numpy(dtype=np.float64).ravel() for name in ['Open', 'High', 'Low', 'Close']]
+    for i, (open_price, high, low, close) in enumerate(zip(*columns)):
+        new_zones, changed = detector.add_candle(open_price, high, low, close, dates[i])
+        if on_update is not None and (new_zones or changed):
+            on_update(i, new_zones, changed)
+    new_zones = detector.finish()
+    if on_update is not None and new_zones:
+        on_update(len(data) - 1, new_zones, [])
+    return detector
+
+
+def batch_zones(data, detector):
+    """
+    Runs the batch engine with the detector's settings over the whole frame.
+
+    Returns:
+        List of (kind, legin, legout, zone_low, zone_high, status) in legin order.
+    """
+    open_price, high, low, close = (data[name].to_numpy(dtype=np.float64).ravel()
+                                    for name in ['Open', 'High', 'Low', 'Close'])
+    results = []
+    # Supply zones are demand zones of the negated prices
+    for kind, sign, ohlc in ((DEMAND, 1, (open_price, high, low, close)),
+                             (SUPPLY, -1, (-open_price, -low, -high, -close))):
+        body_pct = zone_engine.body_percentage(*ohlc)
+        zones = zone_engine.detect_demand_zones(
+            *ohlc,
+            (body_pct > detector.min_body_percent_legin) & (detector.min_legin_candles > 0),
+            body_pct < detector.max_body_percent_base,
+            body_pct > detector.min_body_percent_legout,
+            max_base=detector.max_base_candles, min_legout=detector.min_legout_candles,
+            resume=zone_engine.RESUME_AFTER_LEGOUT, breakout="upper_body")
+        targets = zones['upper_body_low'] + 2 * (zones['upper_body_low'] - zones['base_low'])
+        statuses = zone_index.zone_statuses(ohlc[2], ohlc[1], zones['legout'] + 1, zones['base_low'],
+                                            zones['upper_body_low'], targets)
+        for z, (status, _, _) in zip(zones, statuses):
+            zone_low, zone_high = float(z['base_low']), float(z['upper_body_low'])
+            if sign < 0:
+                zone_low, zone_high = -zone_high, -zone_low
+            results.append((kind, int(z['legin']), int(z['legout']), zone_low, zone_high, status))
+    return sorted(results, key=lambda zone: zone[1])
+
+
+# Settings the harness checks besides the defaults; zero leg-out candles
+# confirm zones on the last base candle, which takes its own code path
+REPLAY_CHECKS = [
+    dict(min_legout_candles=0),
+    dict(min_legout_candles=2, max_base_candles=3),
+    dict(min_body_percent_legin=60, max_body_percent_base=30, min_body_percent_legout=60,
+         max_base_candles=2, min_legout_candles=0),
+]
+
+
+def check_replay(data, detector=None):
+    """
+    Replays the frame and compares the streamed zones and statuses with the
+    batch engine. Returns a list of mismatch descriptions (empty when equal).
+    """
+    detector = replay(data, detector)
+    streamed = [(z.kind, z.legin, z.legout, z.zone_low, z.zone_high, z.status) for z in detector.zones]
+    expected = batch_zones(data, detector)
+
+    mismatches = []
+    for got, want in itertools.zip_longest(streamed, expected):
+        if got != want:
+            mismatches.append(f"streamed {got} != batch {want}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python zone_stream.py bars.csv          replays a CSV with Date,Open,High,Low,Close
+    # python zone_stream.py SYMBOL [INTERVAL] replays the bars in the OHLC cache
+    if len(sys.argv) < 2:
+        print("Usage: python zone_stream.py <bars.csv | SYMBOL [INTERVAL]>")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    if source.lower().endswith(".csv"):
+        bars = pd.read_csv(source, index_col=0, parse_dates=True)
+    else:
+        from ohlc_cache import OHLCCache
+        bars, _ = OHLCCache().load(source, sys.argv[2] if len(sys.argv) > 2 else "1d")
+        if bars is None:
+            print(f"No cached bars for {source}.")
+            sys.exit(1)
+
+    def report(index, new_zones, changed):
+        for zone in new_zones:
+            print(f"{bars.index[index]} | New {zone.kind} zone {zone.zone_low:.2f}-{zone.zone_high:.2f}")
+        for zone in changed:
+            print(f"{bars.index[index]} | {zone.kind.capitalize()} zone from {zone.legin_date} is now {zone.status}")
+
+    detector = replay(bars, on_update=report)
+    mismatches = check_replay(bars)
+    print(f"\n{len(detector.zones)} zones over {len(bars)} bars, {len(mismatches)} mismatches against the batch scan.")
+    for line in mismatches[:20]:
+        print(line)
+    for settings in REPLAY_CHECKS:
+        mismatches = check_replay(bars, ZoneDetector(**settings))
+        print(f"{settings}: {len(mismatches)} mismatches")
+        for line in mismatches[:5]:
+            print(line)
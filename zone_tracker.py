@@ -0,0 +1,239 @@
+import os
+import sys
+import tempfile
+import threading
+from urllib.parse import quote
+
+import numpy as np
+
+from candles import ohlc_digest
+import instrument
+import zone_engine
+import zone_index
+
+# -----------------------------
+# Incremental Zone Tracking
+# -----------------------------
+#
+# A daily rescan mostly sees the history of the day before plus one new bar,
+# yet detecting and settling the zones of a symbol walks its whole history.
+# ZoneTracker keeps what the previous scan settled for each symbol in a small
+# state file:
+#
+#   - how many bars were processed and a digest of those bars,
+#   - the bar where pattern detection can resume (see
+#     zone_engine.resume_demand_zones), and
+#   - the zones found before it with their touch and exit state.
+#
+# The next scan checks the digest against the new history, detects zones
+# from the resume bar on and continues the sweep over the new bars only for
+# the zones still open; zones that reached their target or broke their low
+# are never looked at again. When earlier bars were revised (a split
+# adjustment, a corrected print) the digest no longer matches and the symbol
+# is recomputed from scratch. Either way the zones and statuses are the ones
+# a full scan of the same bars returns.
+#
+# The last bar is provisional: the cache downloads the forming bar again, so
+# nothing that depends on it is kept.
+
+STATE_DIR = "scan_state"
+
+_STATUS_CODES = [zone_index.STATUS_FRESH, zone_index.STATUS_TESTED, zone_index.STATUS_TARGET]
+
+
+class ZoneTracker:
+    """
+    Demand zones and statuses of many symbols, updated from saved per-symbol state.
+
+    Args:
+        state_dir: Directory of the state files, one subdirectory per state key.
+        provisional: Trailing bars that may still change and are never settled.
+    """
+    def __init__(self, state_dir=STATE_DIR, provisional=1):
+        self.state_dir = state_dir
+        self.provisional = provisional
+
+    def _path(self, key, symbol):
+        return os.path.join(self.state_dir, quote(key, safe=''), quote(symbol, safe='') + ".npz")
+
+    def load(self, key, symbol):
+        """
+        Returns the saved state of a symbol as a dict, or None.
+        """
+        path = self._path(key, symbol)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return {name: data[name] for name in data.files}
+        except (OSError, ValueError, EOFError):
+            # A damaged state file only costs a full recompute
+            return None
+
+    def save(self, key, symbol, state):
+        path = self._path(key, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Scanner processes write their own symbols; the rename keeps readers from seeing half a file
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(temporary, **state)
+        os.replace(temporary, path)
+
+    def clear(self, key=None):
+        """
+        Drops the state of one key, or all of it.
+        """
+        target = self.state_dir if key is None else os.path.join(self.state_dir, quote(key, safe=''))
+        if not os.path.isdir(target):
+            return
+        for root, _, files in os.walk(target, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            os.rmdir(root)
+
+    def update(self, key, symbol, candles, detect, levels):
+        """
+        Zones and statuses of a symbol, reusing its saved state where the bars allow.
+
+        Args:
+            key: State key of the scan settings; states of other settings are kept apart.
+            symbol: Symbol the candles belong to.
+            candles: CandleSeries with dates.
+            detect: detect(start, settled) -> (zones, restart) for these candles,
+                as zone_engine.resume_demand_zones returns them.
+            levels: levels(zones) -> (zone_lows, zone_highs, target_prices).
+
+        Returns:
+            Tuple of (zones, statuses) matching zone_engine.detect_demand_zones
+            and zone_index.zone_statuses over all the candles.
+        """
+        open_price, high, low, close = zone_engine.ohlc_arrays(candles)
+        timestamps = candles.dates.asi8
+        n = len(close)
+        settled = max(n - self.provisional, 0)
+
+        state = self.load(key, symbol)
+        if state is not None:
+            previous = int(state["settled"])
+            if previous > settled or ohlc_digest(timestamps, open_price, high, low, close, previous) != str(state["digest"]):
+                state = None
+        if state is None:
+            instrument.count("full_rescans")
+            previous = 0
+            start = 0
+            kept = np.empty(0, dtype=zone_engine.ZONE_DTYPE)
+            touch = exit_ = status = np.empty(0, dtype=np.int64)
+        else:
+            instrument.count("incremental_rescans")
+            start = int(state["restart"])
+            kept, touch, exit_, status = state["zones"], state["touch"], state["exit"], state["status"]
+
+        new_zones, restart = detect(start, settled)
+        zones = np.concatenate([kept, new_zones])
+        zone_lows, zone_highs, target_prices = levels(zones)
+
+        # Settled zones keep their status; open ones continue from the first unseen bar
+        statuses = [(_STATUS_CODES[code], int(t), int(e)) for code, t, e in zip(status, touch, exit_) if e >= 0]
+        sweep = np.arange(len(statuses), len(zones))
+        starts = np.concatenate([np.full(len(kept) - len(statuses), previous, dtype=np.int64),
+                                 new_zones["legout"].astype(np.int64) + 1])
+        touched = np.concatenate([touch[exit_ < 0], np.full(len(new_zones), -1, dtype=np.int64)])
+        order = np.concatenate([np.flatnonzero(exit_ >= 0), np.flatnonzero(exit_ < 0), np.arange(len(kept), len(zones))])
+        statuses += zone_index.zone_statuses(low, high, starts, zone_lows[order[sweep]], zone_highs[order[sweep]],
+                                             target_prices[order[sweep]], touched)
+        results = [None] * len(zones)
+        for z, result in zip(order, statuses):
+            results[z] = result
+        instrument.count("zones_swept", len(sweep))
+
+        self.save(key, symbol, self._settled_state(timestamps, open_price, high, low, close, settled,
+                                                   restart, zones, results))
+        return zones, results
+
+    def _settled_state(self, timestamps, open_price, high, low, close, settled, restart, zones, results):
+        # What is known about the zones before the restart bar once only `settled` bars are seen
+        keep = int(np.searchsorted(zones["legin"], restart))
+        touch = np.full(keep, -1, dtype=np.int64)
+        exit_ = np.full(keep, -1, dtype=np.int64)
+        status = np.zeros(keep, dtype=np.int8)
+        for z in range(keep):
+            code, t, e = results[z]
+            if e is not None and e < settled:
+                touch[z], exit_[z], status[z] = t, e, _STATUS_CODES.index(code)
+            elif t is not None and t < settled:
+                touch[z] = t
+        return {
+            "settled": np.int64(settled),
+            "digest": np.str_(ohlc_digest(timestamps, open_price, high, low, close, settled)),
+            "restart": np.int64(restart),
+            "zones": zones[:keep],
+            "touch": touch,
+            "exit": exit_,
+            "status": status,
+        }
+
+
+# -----------------------------
+# Update Check
+# -----------------------------
+
+
+def check_updates(candles, detect, levels, provisional=1, steps=(0, 1, 1, 2, 7), first=50):
+    """
+    Grows the candles by the given steps in turn, updating a tracker with a
+    temporary state directory after each step, and compares every update with
+    a full scan of the same bars. A step of 0 updates without new bars.
+
+    Args:
+        detect: detect(candles, start, settled) -> (zones, restart).
+        levels: levels(zones) -> (zone_lows, zone_highs, target_prices).
+
+    Returns:
+        List of mismatch descriptions (empty when equal).
+    """
+    mismatches = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        tracker = ZoneTracker(state_dir, provisional)
+        n = first
+        step = 0
+        while n <= len(candles):
+            part = candles[:n]
+            zones, statuses = tracker.update("check", "check", part,
+                                             lambda start, settled: detect(part, start, settled), levels)
+            expected, _ = detect(part, 0, n)
+            _, high, low, _ = zone_engine.ohlc_arrays(part)
+            expected_statuses = zone_index.zone_statuses(low, high, expected["legout"] + 1, *levels(expected))
+            if not np.array_equal(zones, expected):
+                mismatches.append(f"{n} bars: {len(zones)} zones != {len(expected)} zones of a full scan")
+            elif statuses != expected_statuses:
+                z = next(z for z, (got, want) in enumerate(zip(statuses, expected_statuses)) if got != want)
+                mismatches.append(f"{n} bars, zone {z}: {statuses[z]} != {expected_statuses[z]}")
+            n += steps[step % len(steps)]
+            step += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python zone_tracker.py [BARS]  checks tracker updates on random bars against full scans
+    from benchmark import synthetic_ohlc
+    from candles import CandleSeries
+
+    bars = synthetic_ohlc(int(sys.argv[1]) if len(sys.argv) > 1 else 3000, seed=1)
+    candles = CandleSeries.from_dataframe(bars)
+
+    def detect(part, start, settled):
+        open_price, high, low, close = zone_engine.ohlc_arrays(part)
+        body_pct = zone_engine.body_percentage(open_price, high, low, close)
+        return zone_engine.resume_demand_zones(start, settled, open_price, high, low, close,
+                                               body_pct > 50, body_pct < 50, body_pct > 50, max_base=5,
+                                               resume=zone_engine.RESUME_AFTER_LEGOUT, breakout="upper_body")
+
+    def levels(zones):
+        zone_high = zones["upper_body_low"]
+        return zones["base_low"], zone_high, zone_high + 2 * (zone_high - zones["base_low"])
+
+    # provisional=0 also covers updates that add no bars after a touched zone
+    for provisional in (0, 1):
+        mismatches = check_updates(candles, detect, levels, provisional)
+        print(f"provisional={provisional}: {len(mismatches)} mismatches against full scans")
+        for line in mismatches[:5]:
+            print(line)